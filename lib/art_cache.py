@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import re
+import threading
+import time
+from io import BytesIO
+
+import xbmc
+import xbmcaddon
+import error_handler as eh
+from error_handler import ErrorPriority
+from nakamori_utils.globalvars import plugin_settings, get_int_setting, server
+from nakamori_utils import thread_utils
+from proxy.python_version_proxy import python_proxy as pyproxy
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+try:
+    # noinspection PyUnresolvedReferences
+    from PIL import Image
+    resample = getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+except ImportError:
+    Image = None
+
+# The art of listings, kept in the profile. Without it Kodi pulls every poster from Shoko while a view scrolls.
+# A listing gets the local files that are there already, and what is missing is downloaded in the background,
+# so the next listing has it. The folder is kept under art_cache_max_size (MB), the least recently used go first.
+# The animated pictures of characters and their seiyuu (seiyuu_gif) work the same way, in their own folder
+
+# noinspection PyTypeChecker
+addon = xbmcaddon.Addon('plugin.video.nakamori')
+# noinspection PyTypeChecker
+profile_dir = pyproxy.decode(xbmc.translatePath(addon.getAddonInfo('profile')))
+art_dir = os.path.join(profile_dir, 'art')
+character_dir = os.path.join(profile_dir, 'characters')
+
+# the attributes of a Directory that hold art
+art_attributes = ('fanart', 'poster', 'banner', 'icon')
+
+# the first bytes of the image types, to give the files an extension that Kodi understands
+signatures = [
+    (b'\x89PNG', '.png'),
+    (b'\xff\xd8', '.jpg'),
+    (b'GIF8', '.gif'),
+    (b'RIFF', '.webp'),
+]
+
+prefetch_thread = None
+# urls that couldn't be downloaded in this invocation, so they aren't asked for again
+failed_urls = set()
+
+# the id of what an image shows, in its path on the server: /api/image/<type>/<id>, or /api/image/thumb/<type>/<id>/...
+image_id_pattern = re.compile(r'/image/(?:thumb/)?\d+/(\d+)(?:/|$)')
+
+# the character pictures that are waiting to be made, and the threads that make them
+character_jobs = Queue()
+character_jobs_pending = set()
+character_workers = []
+character_lock = threading.Lock()
+
+
+def is_enabled():
+    return plugin_settings.get_bool('art_cache')
+
+
+def make_key(url):
+    """
+    :param url: the url of an image
+    :return: the name of its file, without the extension
+    """
+    return hashlib.sha1(pyproxy.encode(url)).hexdigest()
+
+
+def list_files(folder=art_dir):
+    """
+    :param folder: art_dir or character_dir
+    :return: the file names in the cache by key
+    :rtype: dict
+    """
+    try:
+        return dict((os.path.splitext(name)[0], name) for name in os.listdir(folder) if not name.endswith('.tmp'))
+    except OSError:
+        return {}
+
+
+def prefetch(directories):
+    """
+    Point the art of the directories to the cached files, and download what isn't cached yet in the background
+    :param directories: the children of a listing
+    :type directories: list
+    """
+    if not is_enabled():
+        return
+    files = None
+    used = []
+    missing = []
+    for directory in directories:
+        for attribute in art_attributes:
+            url = getattr(directory, attribute, None)
+            if url is None or not url.startswith(('http://', 'https://')):
+                continue
+            if files is None:
+                files = list_files()
+            name = files.get(make_key(url))
+            if name is not None:
+                path = os.path.join(art_dir, name)
+                setattr(directory, attribute, path)
+                used.append(path)
+            elif url not in missing and url not in failed_urls:
+                missing.append(url)
+
+    if len(used) == 0 and len(missing) == 0:
+        return
+    global prefetch_thread
+    if prefetch_thread is not None and prefetch_thread.is_alive():
+        # the next listing gets the rest
+        return
+    prefetch_thread = threading.Thread(target=eh.try_function(ErrorPriority.NORMAL)(update), args=(used, missing))
+    # the invocation doesn't wait for it. What isn't downloaded is left for the next listing, and evict() removes the
+    # temporary file of one that was cut off
+    prefetch_thread.daemon = True
+    prefetch_thread.start()
+
+
+def update(used, missing):
+    """
+    Mark the used files as recently used, download the missing ones, and evict if the cache got too big
+    :param used: paths of cached files that a listing uses
+    :param missing: urls of images that aren't cached
+    """
+    now = time.time()
+    for path in used:
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+    if len(missing) == 0:
+        return
+    if not os.path.exists(art_dir):
+        os.makedirs(art_dir)
+    thread_utils.run_in_parallel(download, missing, get_int_setting('art_prefetch_threads', 4))
+    evict()
+
+
+def download(url):
+    """
+    Download an image into the cache
+    :param url: the url of the image
+    :return: the path of the file, or None if it couldn't be downloaded
+    """
+    data = get_image(url)
+    if data is None:
+        return None
+    extension = '.jpg'
+    for signature, signature_extension in signatures:
+        if data.startswith(signature):
+            extension = signature_extension
+            break
+    path = os.path.join(art_dir, make_key(url) + extension)
+    write_file(path, lambda image_file: image_file.write(data))
+    return path
+
+
+def get_image(url):
+    """
+    :return: the image as bytes, or None if it couldn't be downloaded
+    """
+    if url in failed_urls:
+        return None
+    data = pyproxy.get_binary(url, get_int_setting('timeout', 10), pyproxy.get_apikey())
+    if data is None or len(data) == 0:
+        failed_urls.add(url)
+        return None
+    return data
+
+
+def write_file(path, write):
+    """
+    Write a file of the cache under another name first, so a listing never gets half of it
+    :param path: the path of the file
+    :param write: function that takes the open file
+    """
+    temp_path = '%s.%i.%i.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    with open(temp_path, 'wb') as image_file:
+        write(image_file)
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # another invocation was faster
+        os.remove(temp_path)
+
+
+def evict(max_size=None, folder=art_dir):
+    """
+    Remove the least recently used files until the cache is under its size
+    :param max_size: in bytes, art_cache_max_size (MB) if None
+    :param folder: art_dir or character_dir
+    :return: how many files were removed
+    """
+    if max_size is None:
+        max_size = get_int_setting('art_cache_max_size', 100) * 1024 * 1024
+    entries = []
+    total = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if name.endswith('.tmp'):
+            # left by an invocation that was stopped while downloading
+            if time.time() - stat.st_mtime > 3600:
+                os.remove(path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    removed = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def get_character_picture(staff_image, character_image, static_picture):
+    """
+    The animated picture of a seiyuu and their character. If it isn't made yet, it's made in the background,
+    and the static picture is used until then, so a listing never waits for it
+    :param staff_image: the path of the seiyuu's image on the server
+    :param character_image: the path of the character's image on the server
+    :param static_picture: what to show while it's made
+    :return: the path of the animated picture, or static_picture
+    """
+    if Image is None or staff_image == '' or character_image == '':
+        return static_picture
+    key = make_character_key(staff_image, character_image)
+    if key is None:
+        return static_picture
+    path = os.path.join(character_dir, key + '.gif')
+    if os.path.exists(path):
+        return path
+    with character_lock:
+        if key not in character_jobs_pending:
+            character_jobs_pending.add(key)
+            character_jobs.put((key, staff_image, character_image))
+            if len(character_workers) < get_int_setting('seiyuu_gif_threads', 2):
+                worker = threading.Thread(target=character_worker)
+                # the invocation doesn't wait for it, the next listing gets what wasn't made
+                worker.daemon = True
+                character_workers.append(worker)
+                worker.start()
+    return static_picture
+
+
+def make_character_key(staff_image, character_image):
+    """
+    :param staff_image: the path or url of the seiyuu's image
+    :param character_image: the path or url of the character's image
+    :return: the name of the animated picture, by the ids of the seiyuu and the character, or None if they aren't
+    in the paths
+    """
+    ids = []
+    for image in (staff_image, character_image):
+        # the same for a url and a path
+        path = image.split('://', 1)[-1]
+        path = path[path.find('/'):] if '/' in path else ''
+        match = image_id_pattern.search(path.split('?', 1)[0])
+        if match is None:
+            return None
+        ids.append(match.group(1))
+    return 'staff%s-character%s' % tuple(ids)
+
+
+def character_worker():
+    while True:
+        with character_lock:
+            try:
+                key, staff_image, character_image = character_jobs.get_nowait()
+            except Empty:
+                character_workers.remove(threading.current_thread())
+                return
+        try:
+            make_character_picture(key, staff_image, character_image)
+        except:
+            eh.exception(ErrorPriority.LOW)
+        finally:
+            with character_lock:
+                character_jobs_pending.discard(key)
+
+
+def make_character_picture(key, staff_image, character_image):
+    """
+    Make the animated picture for get_character_picture()
+    :return: the path of it, or None if the images couldn't be downloaded
+    """
+    staff_data = get_image(server_url(staff_image))
+    character_data = get_image(server_url(character_image))
+    if staff_data is None or character_data is None:
+        return None
+    frames = make_frames([Image.open(BytesIO(staff_data)), Image.open(BytesIO(character_data))])
+    if not os.path.exists(character_dir):
+        os.makedirs(character_dir)
+    path = os.path.join(character_dir, key + '.gif')
+    write_file(path, lambda image_file: frames[0].save(image_file, format='GIF', append_images=frames[1:],
+                                                       save_all=True, duration=500, loop=0))
+    evict(get_int_setting('seiyuu_gif_max_size', 50) * 1024 * 1024, character_dir)
+    return path
+
+
+def make_frames(images):
+    """
+    Scale the images to the same height, and put them in the middle of frames of the same size, as every frame of
+    a GIF is drawn on a canvas of the size of the first one
+    :param images: PIL images
+    :return: the frames
+    """
+    height = max(image.size[1] for image in images)
+    scaled = []
+    for image in images:
+        width = max(1, int(round(image.size[0] * float(height) / image.size[1])))
+        scaled.append(image.convert('RGB').resize((width, height), resample))
+    width = max(image.size[0] for image in scaled)
+    frames = []
+    for image in scaled:
+        frame = Image.new('RGB', (width, height))
+        frame.paste(image, ((width - image.size[0]) // 2, 0))
+        frames.append(frame)
+    return frames
+
+
+def server_url(path):
+    return path if ':' in path else server + path
+
+
+def clear():
+    """
+    Remove every cached image. kodi_utils.clear_image_cache() calls it, as Kodi's textures of them go with it
+    """
+    if prefetch_thread is not None and prefetch_thread.is_alive():
+        prefetch_thread.join()
+    for worker in list(character_workers):
+        worker.join()
+    for folder in (art_dir, character_dir):
+        for name in list_files(folder).values():
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
@@ -1,20 +1,36 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
-try:
-    from sqlite3 import dbapi2 as database
-except:
-    # noinspection PyUnresolvedReferences
-    from pysqlite2 import dbapi2 as database
-
+import atexit
+import hashlib
 import os.path
+import threading
 import time
 import sys
+import zlib
+from collections import OrderedDict
 
 import xbmc
 import xbmcaddon
 import xbmcgui
+import database_manager
+import error_handler as eh
+from error_handler import ErrorPriority
+from nakamori_utils.globalvars import get_int_setting
+from nakamori_utils import json_utils
 from proxy.python_version_proxy import python_proxy as pyproxy
+from proxy.single_flight import normalize_url
+
+try:
+    from urllib.parse import urlsplit, parse_qsl
+except ImportError:
+    from urlparse import urlsplit, parse_qsl
+
+try:
+    # noinspection PyUnresolvedReferences
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
 
 
 def decode_utf8(_string):
@@ -36,94 +52,684 @@ if not os.path.exists(profileDir):
 
 db_file = os.path.join(profileDir, 'cache.db')
 
-# connect to db
-db_connection = database.connect(db_file)
-db_cursor = db_connection.cursor()
+# rows not read for this long get their last access time updated again, so reading isn't a write every time
+access_resolution = 60
+sweep_thread = None
 
-# create table
-try:
+# how the body in [response].json is stored
+FORMAT_TEXT, FORMAT_ZLIB, FORMAT_LZ4 = 0, 1, 2
+
+# parsed bodies of the responses that were read last, by key, as (created, tree)
+parsed_trees = OrderedDict()
+parsed_trees_size = 32
+parsed_trees_lock = threading.Lock()
+
+# the [type] of the Shoko objects in a response, by the type field of their json.
+# These are also what comes after /api/ in their urls
+object_types = {
+    'filter': 'filter',
+    'filters': 'filter',
+    'group': 'group',
+    'serie': 'serie',
+    'ep': 'ep',
+    'file': 'file',
+}
+
+# how get_json was answered: from the cache, from the cache after the server said it didn't change,
+# from the cache while it's refreshed in the background, or by a download
+stats = {'hit': 0, 'revalidated': 0, 'stale': 0, 'miss': 0}
+stats_lock = threading.Lock()
+
+
+def create_tables(connection):
+    """
+    Create the tables, or bring an existing cache.db up to date. The version is kept in PRAGMA user_version
+    0: the old [cache] table, with no key, index or size limit
+    1: the [response] table
+    2: compressed bodies, [response].format
+    3: validators for conditional requests, [response].etag and [response].last_modified
+    4: [response].key is a hash of the normalized url and the apikey, see make_key()
+    5: [response_object], the Shoko objects in each response, and [object_parent], which objects contain which
+    """
+    cursor = connection.cursor()
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE TABLE IF NOT EXISTS [response] ([key] TEXT PRIMARY KEY NOT NULL, [url] TEXT NOT NULL, '
+                   '[json] BLOB NULL, [created] FLOAT NOT NULL, [expires] FLOAT NOT NULL, [accessed] FLOAT NOT NULL, '
+                   '[size] INTEGER NOT NULL DEFAULT 0, [format] INTEGER NOT NULL DEFAULT 0, [etag] TEXT NULL, '
+                   '[last_modified] TEXT NULL);')
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE INDEX IF NOT EXISTS [response_expires] ON [response] ([expires]);')
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE INDEX IF NOT EXISTS [response_accessed] ON [response] ([accessed]);')
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE INDEX IF NOT EXISTS [response_url] ON [response] ([url]);')
     # noinspection PyTypeChecker
-    db_cursor.execute('CREATE TABLE IF NOT EXISTS [cache] ([url] TEXT NULL, [json] TEXT NULL, [created] FLOAT NULL);')
-except:
-    pass
+    cursor.execute('CREATE TABLE IF NOT EXISTS [response_object] ([key] TEXT NOT NULL, [type] TEXT NOT NULL, '
+                   '[id] INTEGER NOT NULL, PRIMARY KEY ([type], [id], [key]));')
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE INDEX IF NOT EXISTS [response_object_key] ON [response_object] ([key]);')
+    # however a response goes (replaced, swept, removed), its objects go with it
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE TRIGGER IF NOT EXISTS [response_delete] AFTER DELETE ON [response] '
+                   'BEGIN DELETE FROM [response_object] WHERE [key]=old.[key]; END;')
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE TABLE IF NOT EXISTS [object_parent] ([type] TEXT NOT NULL, [id] INTEGER NOT NULL, '
+                   '[parent_type] TEXT NOT NULL, [parent_id] INTEGER NOT NULL, '
+                   'PRIMARY KEY ([type], [id], [parent_type], [parent_id]));')
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE INDEX IF NOT EXISTS [object_parent_parent] ON [object_parent] ([parent_type], [parent_id]);')
+    # noinspection PyTypeChecker
+    cursor.execute('CREATE TABLE IF NOT EXISTS [meta] ([name] TEXT PRIMARY KEY NOT NULL, [value] TEXT NULL);')
 
-# close connection
-db_connection.close()
+    # noinspection PyTypeChecker
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    if version >= 5:
+        return
+    old_table = None
+    if version == 0:
+        # noinspection PyTypeChecker
+        old_table = cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='cache'").fetchone()
+        if old_table is not None:
+            # its rows are keyed by the raw url, see below
+            # noinspection PyTypeChecker
+            cursor.execute('DROP TABLE [cache]')
+    if version == 1:
+        # noinspection PyTypeChecker
+        cursor.execute('ALTER TABLE [response] ADD COLUMN [format] INTEGER NOT NULL DEFAULT 0')
+    if 1 <= version < 3:
+        # noinspection PyTypeChecker
+        cursor.execute('ALTER TABLE [response] ADD COLUMN [etag] TEXT NULL')
+        # noinspection PyTypeChecker
+        cursor.execute('ALTER TABLE [response] ADD COLUMN [last_modified] TEXT NULL')
+    if 1 <= version < 5:
+        # before 4, the rows are keyed by the raw url, and nothing would find them anymore.
+        # Before 5, nothing knows which objects they show, so they would never be removed when one changes
+        # noinspection PyTypeChecker
+        cursor.execute('DELETE FROM [response]')
+    # noinspection PyTypeChecker
+    cursor.execute('PRAGMA user_version = 5')
+    connection.commit()
+    if version > 0 or old_table is not None:
+        # give back the space that the old rows took
+        # noinspection PyTypeChecker
+        cursor.execute('VACUUM')
+
+
+database_manager.register(db_file, create_tables)
+
+
+def make_key(url, apikey=None):
+    """
+    The key that a response is cached under. Urls that ask for the same thing get the same key, no matter the order
+    of the parameters, and every apikey (so every user) has its own keys
+    :param url: the url
+    :param apikey: the apikey that is sent with the request, the current one if not given
+    :return: a sha1 hex digest
+    """
+    if apikey is None:
+        apikey = pyproxy.get_apikey()
+    scope = hashlib.sha1(pyproxy.encode(apikey or '')).hexdigest()
+    return hashlib.sha1(pyproxy.encode(scope + ' ' + normalize_url(url))).hexdigest()
+
+
+def compress(body):
+    """
+    Compress a response body for storage, with lz4 if it's available, else zlib
+    :param body: the body
+    :return: (format, compressed bytes)
+    """
+    body = pyproxy.encode(body)
+    if lz4_frame is not None:
+        return FORMAT_LZ4, lz4_frame.compress(body)
+    return FORMAT_ZLIB, zlib.compress(body, 6)
+
+
+def decompress(body_format, data):
+    """
+    :param body_format: FORMAT_*
+    :param data: what was stored
+    :return: the body as bytes
+    :rtype: bytes
+    """
+    if body_format == FORMAT_TEXT:
+        return pyproxy.encode(data)
+    data = bytes(data)
+    if body_format == FORMAT_ZLIB:
+        return zlib.decompress(data)
+    if body_format == FORMAT_LZ4 and lz4_frame is not None:
+        return lz4_frame.decompress(data)
+    raise ValueError('Unsupported cache format: %s' % body_format)
 
 
-# noinspection PyShadowingNames
 def get_cached_data():
     """
-    Search for Search History inside db
-    :return: list of used search terms
+    Get everything that is in the cache
+    :return: list of (url, json, created)
     """
     items = []
-    db_connection = None
     try:
-        db_connection = database.connect(db_file)
-        db_cursor = db_connection.cursor()
-        # noinspection PyTypeChecker
-        db_cursor.execute('SELECT url, json, created FROM cache')
-        faves = db_cursor.fetchall()
+        with database_manager.cursor(db_file) as db_cursor:
+            # noinspection PyTypeChecker
+            db_cursor.execute('SELECT url, json, created, format FROM [response]')
+            faves = db_cursor.fetchall()
         for a_row in faves:
             if len(a_row) > 0:
-                items.append(a_row)
+                items.append((a_row[0], pyproxy.decode(decompress(a_row[3], a_row[1])), a_row[2]))
     except:
         pass
-
-    db_connection.close()
     return items
 
 
-# noinspection PyShadowingNames
-def get_data_from_cache(url):
-    items = None
-    url = str(url)
+def get_body_from_cache(url, parsed=False, apikey=None):
+    """
+    Get a cached response, and mark it as used
+    :param url: the url it was cached for
+    :param parsed: return the parsed json instead of the raw body. This is kept in memory for the last few responses,
+    so reading the same response again doesn't need to decompress or parse it
+    :param apikey: the apikey it was cached for, the current one if not given
+    :return: (body as bytes or the parsed json, created) or None
+    """
     try:
-        db_connection = database.connect(db_file)
-        db_cursor = db_connection.cursor()
+        key = make_key(url, apikey)
+        with database_manager.cursor(db_file, commit=True) as db_cursor:
+            # noinspection PyTypeChecker
+            db_cursor.execute('SELECT created, accessed, format FROM [response] WHERE key=?', (key,))
+            row = db_cursor.fetchone()
+            if row is None:
+                return None
+            created, accessed, body_format = row
+            now = time.time()
+            if now - accessed > access_resolution:
+                # noinspection PyTypeChecker
+                db_cursor.execute('UPDATE [response] SET accessed=? WHERE key=?', (now, key))
+
+            if parsed:
+                with parsed_trees_lock:
+                    tree = parsed_trees.get(key)
+                if tree is not None and tree[0] == created:
+                    return tree[1], created
+
+            # noinspection PyTypeChecker
+            data = db_cursor.execute('SELECT json FROM [response] WHERE key=?', (key,)).fetchone()[0]
+        body = decompress(body_format, data)
+        if not parsed:
+            return body, created
+
+        tree = json_utils.loads(body)
+        remember_tree(key, created, tree)
+        return tree, created
+    except:
+        eh.exception(ErrorPriority.NORMAL)
+        return None
+
+
+def iter_body_from_cache(url, max_age, apikey=None, chunk_size=65536):
+    """
+    Read a cached body in pieces, decompressing it as it goes
+    :param url: the url it was cached for
+    :param max_age: ignore the response if it was cached more than this many seconds ago
+    :param apikey: the apikey it was cached for, the current one if not given
+    :param chunk_size: how much of the stored data to decompress at a time
+    :return: generator of bytes, or None if there's nothing fresh enough
+    """
+    key = make_key(url, apikey)
+    with database_manager.cursor(db_file) as db_cursor:
         # noinspection PyTypeChecker
-        db_cursor.execute('SELECT json, created FROM cache WHERE url=?', (url,))
-        items = db_cursor.fetchone()
+        row = db_cursor.execute('SELECT json, created, format FROM [response] WHERE key=? AND created >= ?',
+                                (key, time.time() - max_age)).fetchone()
+    if row is None:
+        return None
+    data, body_format = row[0], row[2]
+    if body_format != FORMAT_ZLIB:
+        body = decompress(body_format, data)
+        return (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+
+    def chunks():
+        decompressor = zlib.decompressobj()
+        compressed = bytes(data)
+        for i in range(0, len(compressed), chunk_size):
+            piece = decompressor.decompress(compressed[i:i + chunk_size])
+            if piece:
+                yield piece
+        piece = decompressor.flush()
+        if piece:
+            yield piece
+    return chunks()
+
+
+def caching_chunks(url, chunks, ttl=None, etag=None, last_modified=None, apikey=None):
+    """
+    Pass the pieces of a body through, compressing them on the way, and cache the body once all of them were read.
+    Nothing is cached if the reader stops early
+    :param url: url you want to cache
+    :param chunks: iterable of the body as bytes
+    :param ttl: how long it will be valid in seconds, expireCache setting if not given
+    :param etag: the ETag header of the response
+    :param last_modified: the Last-Modified header of the response
+    :param apikey: the apikey that was sent with the request, the current one if not given
+    :return: generator of the same chunks
+    """
+    compressor = zlib.compressobj(6)
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(compressor.compress(chunk))
+            yield chunk
+    finally:
+        # stopping early closes the source too, so its connection is given back now
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+    parts.append(compressor.flush())
+    try:
+        add_compressed(url, FORMAT_ZLIB, b''.join(parts), ttl, etag, last_modified, apikey)
     except:
-        pass
-    return items
+        eh.exception(ErrorPriority.NORMAL)
+
+
+def remember_tree(key, created, tree):
+    """
+    Keep a parsed body in memory, for get_body_from_cache(parsed=True)
+    :param key: see make_key()
+    :param created: the creation time of the row it belongs to
+    :param tree: the parsed body
+    """
+    with parsed_trees_lock:
+        parsed_trees[key] = (created, tree)
+        while len(parsed_trees) > parsed_trees_size:
+            parsed_trees.popitem(last=False)
+
+
+def get_data_from_cache(url, apikey=None):
+    """
+    Get a cached response, and mark it as used
+    :param url: the url it was cached for
+    :param apikey: the apikey it was cached for, the current one if not given
+    :return: (json, created) or None
+    """
+    row = get_body_from_cache(url, apikey=apikey)
+    if row is None:
+        return None
+    return pyproxy.decode(row[0]), row[1]
 
 
-# noinspection PyShadowingNames
-def add_cache(url, json_body):
+def get_validators(url, apikey=None):
     """
-    Add 'url' with 'json'
+    :param url: the url it was cached for
+    :param apikey: the apikey it was cached for, the current one if not given
+    :return: (etag, last_modified) that the server sent with the cached response, either can be None
+    """
+    try:
+        key = make_key(url, apikey)
+        with database_manager.cursor(db_file) as db_cursor:
+            # noinspection PyTypeChecker
+            row = db_cursor.execute('SELECT etag, last_modified FROM [response] WHERE key=?', (key,)).fetchone()
+        if row is not None:
+            return row[0], row[1]
+    except:
+        eh.exception(ErrorPriority.NORMAL)
+    return None, None
+
+
+def refresh_cache(url, ttl=None, apikey=None):
+    """
+    Mark a cached response as new again, after the server said that it didn't change. The body is left as it is
+    :param url: the url it was cached for
+    :param ttl: how long it will be valid in seconds, expireCache setting if not given
+    :param apikey: the apikey it was cached for, the current one if not given
+    :return: the new creation time, or None if the response is not cached anymore
+    """
+    key = make_key(url, apikey)
+    if ttl is None or ttl <= 0:
+        ttl = get_int_setting('expireCache', 0)
+    date = time.time()
+    with database_manager.cursor(db_file, commit=True) as db_cursor:
+        # noinspection PyTypeChecker
+        db_cursor.execute('UPDATE [response] SET created=?, expires=?, accessed=? WHERE key=?',
+                          (date, date + ttl, date, key))
+        if db_cursor.rowcount < 1:
+            return None
+    with parsed_trees_lock:
+        tree = parsed_trees.get(key)
+        if tree is not None:
+            parsed_trees[key] = (date, tree[1])
+    return date
+
+
+def add_cache(url, json_body, ttl=None, etag=None, last_modified=None, apikey=None, tree=None):
+    """
+    Add 'url' with 'json', replacing what was cached for it before
     :param url: url you want to cache
     :param json_body: json respond
+    :param ttl: how long it will be valid in seconds, expireCache setting if not given
+    :param etag: the ETag header of the response, to ask the server later if it changed
+    :param last_modified: the Last-Modified header of the response
+    :param apikey: the apikey that was sent with the request, the current one if not given
+    :param tree: the body, already parsed. get_body_from_cache(parsed=True) gives it instead of parsing the body again
     :return:
     """
+    if json_body is None:
+        return
+    body_format, data = compress(json_body)
+    if tree is None:
+        objects = find_objects_in_body(json_body)
+    else:
+        objects = find_objects(tree)
+    date = add_compressed(url, body_format, data, ttl, etag, last_modified, apikey, objects)
+    if tree is not None:
+        remember_tree(make_key(url, apikey), date, tree)
+
+
+def add_compressed(url, body_format, data, ttl=None, etag=None, last_modified=None, apikey=None, objects=None):
+    """
+    Same as add_cache, for a body that was already compressed
+    :param body_format: FORMAT_*
+    :param data: the compressed body
+    :param objects: what find_objects() gives for the body. It's decompressed and parsed to get it, if not given
+    :return: the creation time of the row
+    """
+    if ttl is None or ttl <= 0:
+        ttl = get_int_setting('expireCache', 0)
+    if objects is None:
+        objects = find_objects_in_body(decompress(body_format, data))
+    contained, parents = objects
+    key = make_key(url, apikey)
     date = time.time()
-    db_connection = database.connect(db_file)
-    db_cursor = db_connection.cursor()
-    # noinspection PyTypeChecker
-    db_cursor.execute('INSERT INTO cache (url, json, created) VALUES (?, ?, ?)', (url, pyproxy.decode(json_body), date))
-    db_connection.commit()
-    db_connection.close()
+    with database_manager.cursor(db_file, commit=True) as db_cursor:
+        # REPLACE doesn't run the delete trigger
+        # noinspection PyTypeChecker
+        db_cursor.execute('DELETE FROM [response] WHERE key=?', (key,))
+        # noinspection PyTypeChecker
+        db_cursor.execute('INSERT INTO [response] (key, url, json, created, expires, accessed, size, '
+                          'format, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                          (key, normalize_url(url), database_manager.database.Binary(data), date,
+                           date + ttl, date, len(data), body_format, etag, last_modified))
+        # noinspection PyTypeChecker
+        db_cursor.executemany('INSERT OR IGNORE INTO [response_object] (key, type, id) VALUES (?, ?, ?)',
+                              [(key, object_type, object_id) for object_type, object_id in contained])
+        # noinspection PyTypeChecker
+        db_cursor.executemany('INSERT OR IGNORE INTO [object_parent] (type, id, parent_type, parent_id) '
+                              'VALUES (?, ?, ?, ?)', parents)
+    start_sweep()
+    return date
+
+
+def find_objects(tree):
+    """
+    Find the Shoko objects in a parsed response, at any depth
+    :param tree: the parsed json
+    :return: set of (type, id), and set of (type, id, parent_type, parent_id) for the ones that are inside another one
+    :rtype: tuple
+    """
+    contained = set()
+    parents = set()
+    stack = [(tree, None)]
+    while len(stack) > 0:
+        node, parent = stack.pop()
+        if isinstance(node, dict):
+            try:
+                object_type = object_types.get(node.get('type'))
+                if object_type is not None:
+                    obj = (object_type, int(node['id']))
+                    contained.add(obj)
+                    if parent is not None and parent != obj:
+                        parents.add(obj + parent)
+                    parent = obj
+            except (KeyError, TypeError, ValueError):
+                # no id, or a type that isn't a string
+                pass
+            values = node.values()
+        elif isinstance(node, list):
+            values = node
+        else:
+            continue
+        for value in values:
+            if isinstance(value, (dict, list)):
+                stack.append((value, parent))
+    return contained, parents
+
+
+def find_objects_in_body(body):
+    """
+    find_objects() for a body that isn't parsed yet. A body that isn't json has none
+    :param body: the body as str or bytes
+    """
+    try:
+        return find_objects(json_utils.loads(body))
+    except ValueError:
+        return set(), set()
+
+
+def find_related(objects, parents=True, children=False):
+    """
+    Add what contains the objects, or what they contain, as far as the cached responses ever showed it.
+    Which objects contain which is kept after the responses that showed it are gone
+    :param objects: (type, id) pairs, like ('ep', 12)
+    :param parents: add the objects that contain them, at any depth, like the series, group and filters of an episode
+    :param children: add the objects that they contain, at any depth
+    :return: the objects and the ones that were found
+    :rtype: set
+    """
+    objects = set((object_type, int(object_id)) for object_type, object_id in objects)
+    found = set(objects)
+    queries = []
+    if parents:
+        queries.append('SELECT parent_type, parent_id FROM [object_parent] WHERE type=? AND id=?')
+    if children:
+        queries.append('SELECT type, id FROM [object_parent] WHERE parent_type=? AND parent_id=?')
+    with database_manager.cursor(db_file) as db_cursor:
+        for query in queries:
+            # both ways start from the objects, so the children of their parents (their siblings) aren't found
+            pending = list(objects)
+            seen = set(objects)
+            while len(pending) > 0:
+                # noinspection PyTypeChecker
+                for row in db_cursor.execute(query, pending.pop()).fetchall():
+                    row = tuple(row)
+                    if row not in seen:
+                        seen.add(row)
+                        pending.append(row)
+            found |= seen
+    return found
+
+
+def remove_object(object_type, object_id, parents=False, children=False):
+    """
+    Remove every cached response that shows an object, for every user
+    :param object_type: filter, group, serie, ep or file
+    :param object_id: its id
+    :param parents: also the responses that show what contains it, like the series of a file, as their sizes or
+    watched counts may have changed with it
+    :param children: also the responses that show what it contains
+    :return: the urls that were removed
+    :rtype: list
+    """
+    objects = [(object_type, object_id)]
+    if parents or children:
+        objects = find_related(objects, parents, children)
+    return remove_objects(objects)
 
 
-# noinspection PyShadowingNames
 def remove_cache(url=None):
     """
-    Remove single term from Search History
+    Remove single url from the cache (for every user), or everything
     :param url:
     :return:
     """
-    db_connection = database.connect(db_file)
-    db_cursor = db_connection.cursor()
-    if url is not None:
+    keys = []
+    with database_manager.cursor(db_file, commit=True) as db_cursor:
+        if url is not None:
+            # noinspection PyTypeChecker
+            keys = [row[0] for row in db_cursor.execute('SELECT key FROM [response] WHERE url=?',
+                                                        (normalize_url(url),)).fetchall()]
+            # noinspection PyTypeChecker
+            db_cursor.execute('DELETE FROM [response] WHERE url=?', (normalize_url(url),))
+        else:
+            # noinspection PyTypeChecker
+            db_cursor.execute('DELETE FROM [response]')
+            # noinspection PyTypeChecker
+            db_cursor.execute('DELETE FROM [object_parent]')
+    with parsed_trees_lock:
+        if url is not None:
+            # the ones of every user
+            for key in keys + [make_key(url)]:
+                parsed_trees.pop(key, None)
+        else:
+            parsed_trees.clear()
+    pyproxy.forget_request(url)
+
+
+def split_api_url(url):
+    """
+    :param url: a normalized url, like http://host/api/ep?id=12&level=1
+    :return: what comes after /api/ and the id parameter, like ('ep', '12'). The id is None if there isn't one
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    index = path.find('/api/')
+    if index == -1:
+        return None, None
+    return path[index + 5:].strip('/').lower(), dict(parse_qsl(parts.query)).get('id')
+
+
+def remove_objects(objects, listings=()):
+    """
+    Remove the cached responses of some objects, and every response of some listings, in one transaction and for
+    every user. Used after something changed on the server, like the watched status of episodes
+    :param objects: (url_prefix, id) pairs, like ('ep', 12) for api/ep?id=12 with any other parameters, and every
+    response that shows the object
+    :param listings: url prefixes of which every response goes, like 'filter' for api/filter?id=1 and api/filter
+    :return: the urls that were removed
+    :rtype: list
+    """
+    objects = set((prefix, str(object_id)) for prefix, object_id in objects)
+    listings = set(listings)
+    prefixes = listings | set(prefix for prefix, _ in objects)
+    if len(prefixes) == 0:
+        return []
+
+    keys = set()
+    with database_manager.cursor(db_file, commit=True) as db_cursor:
+        # the responses that show them
+        for object_type, object_id in objects:
+            if object_type in object_types and object_id.isdigit():
+                # noinspection PyTypeChecker
+                rows = db_cursor.execute('SELECT key FROM [response_object] WHERE type=? AND id=?',
+                                         (object_type, int(object_id))).fetchall()
+                keys.update(row[0] for row in rows)
+        # and their own urls, for the ones that aren't in their response, like api/serie/fromep?id=12.
+        # Only the urls of the right kind are looked at, the rest is sorted out here
+        where = ' OR '.join(['[url] LIKE ?'] * len(prefixes))
         # noinspection PyTypeChecker
-        db_cursor.execute('DELETE FROM cache WHERE url=?', (url,))
-    else:
+        rows = db_cursor.execute('SELECT [key], [url] FROM [response] WHERE ' + where,
+                                 ['%/api/' + prefix + '%' for prefix in prefixes]).fetchall()
+        for key, url in rows:
+            prefix, object_id = split_api_url(url)
+            if prefix in listings or (prefix, object_id) in objects:
+                keys.add(key)
+        keys = list(keys)
+        urls = []
+        # sqlite has a limit on the number of parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ','.join(['?'] * len(chunk))
+            # noinspection PyTypeChecker
+            rows = db_cursor.execute('SELECT url FROM [response] WHERE [key] IN (%s)' % marks, chunk).fetchall()
+            urls.extend(row[0] for row in rows)
+            # noinspection PyTypeChecker
+            db_cursor.execute('DELETE FROM [response] WHERE [key] IN (%s)' % marks, chunk)
+
+    with parsed_trees_lock:
+        for key in keys:
+            parsed_trees.pop(key, None)
+    for url in set(urls):
+        pyproxy.forget_request(url)
+    return urls
+
+
+def count_stat(name):
+    """
+    :param name: hit, revalidated, stale or miss
+    """
+    with stats_lock:
+        stats[name] += 1
+
+
+def get_stats():
+    """
+    :return: how many get_json calls were answered from the cache (hit), from the cache after a 304 (revalidated),
+    from the cache while it was refreshed in the background (stale), or had to download the body (miss)
+    :rtype: dict
+    """
+    with stats_lock:
+        return dict(stats)
+
+
+def log_stats():
+    current = get_stats()
+    if sum(current.values()) > 0:
+        eh.spam('Cache stats:', current)
+
+
+atexit.register(log_stats)
+
+
+def sweep():
+    """
+    Remove expired responses, then the least recently used ones until the cache fits into
+    the cache_max_size (MB) and cache_max_entries settings.
+    Expired responses with an ETag or Last-Modified are kept for cache_revalidate_days (7), as they can still be
+    revalidated, and so are the ones that can still be shown while they are refreshed (the stale_while_revalidate
+    setting)
+    """
+    max_size = get_int_setting('cache_max_size', 50) * 1024 * 1024
+    max_entries = get_int_setting('cache_max_entries', 5000)
+    stale_window = get_int_setting('stale_while_revalidate', 0)
+    revalidate_age = get_int_setting('cache_revalidate_days', 7) * 24 * 60 * 60
+    now = time.time()
+    with database_manager.cursor(db_file, commit=True) as db_cursor:
+        # noinspection PyTypeChecker
+        db_cursor.execute('INSERT OR REPLACE INTO [meta] (name, value) VALUES (?, ?)', ('last_sweep', str(now)))
         # noinspection PyTypeChecker
-        db_cursor.execute('DELETE FROM cache')
-    db_connection.commit()
-    db_connection.close()
+        db_cursor.execute('DELETE FROM [response] WHERE expires < ? AND '
+                          '((etag IS NULL AND last_modified IS NULL) OR expires < ?)',
+                          (now - stale_window, now - max(stale_window, revalidate_age)))
+        # noinspection PyTypeChecker
+        total_size, total_entries = db_cursor.execute('SELECT IFNULL(SUM(size), 0), COUNT(*) FROM [response]').fetchone()
+        if total_size <= max_size and total_entries <= max_entries:
+            return
+        evicted = []
+        # noinspection PyTypeChecker
+        for key, size in db_cursor.execute('SELECT key, size FROM [response] ORDER BY accessed').fetchall():
+            if total_size <= max_size and total_entries <= max_entries:
+                break
+            evicted.append((key,))
+            total_size -= size
+            total_entries -= 1
+        # noinspection PyTypeChecker
+        db_cursor.executemany('DELETE FROM [response] WHERE key=?', evicted)
+    eh.spam('Evicted', len(evicted), 'responses from the cache')
+
+
+def start_sweep():
+    """
+    Start sweep() on a background thread, if it didn't run in the last cache_sweep_interval seconds
+    """
+    global sweep_thread
+    if sweep_thread is not None and sweep_thread.is_alive():
+        return
+    interval = get_int_setting('cache_sweep_interval', 300)
+    try:
+        with database_manager.cursor(db_file) as db_cursor:
+            # noinspection PyTypeChecker
+            row = db_cursor.execute('SELECT value FROM [meta] WHERE name=?', ('last_sweep',)).fetchone()
+        if row is not None and time.time() - float(row[0]) < interval:
+            return
+    except:
+        eh.exception(ErrorPriority.NORMAL)
+        return
+    sweep_thread = threading.Thread(target=eh.try_function(ErrorPriority.NORMAL)(sweep))
+    sweep_thread.start()
 
 
 def clear_cache(params):
@@ -1,5 +1,5 @@
-import json
 from collections import defaultdict
+from nakamori_utils import json_utils
 try:
     basestring
     unicode
@@ -30,10 +30,10 @@ def dump(obj):
     if isinstance(obj, (int, bool, float)):
         return unicode(obj)
     if isinstance(obj, (list, set, tuple)):
-        return json.dumps(dump_iterable(obj))
+        return json_utils.dumps(dump_iterable(obj))
     if isinstance(obj, (dict, defaultdict)):
-        return json.dumps(dump_dictionary(obj))
-    return json.dumps(dump_class(obj))
+        return json_utils.dumps(dump_dictionary(obj))
+    return json_utils.dumps(dump_class(obj))
 
 
 def dump_class(obj):
@@ -41,7 +41,10 @@ def dump_class(obj):
     if obj is None:
         return result
 
-    members = [attr for attr in dir(obj) if not callable(getattr(obj, attr)) and not attr.startswith("__")]
+    # dir() lists the __slots__ of a class even when they were never assigned, so those are skipped. So are
+    # attributes that aren't worked out yet (see shoko_models.v2.LazyAttribute), and the private slots behind them
+    members = [attr for attr in dir(obj) if not attr.startswith("_") and is_loaded(obj, attr) and hasattr(obj, attr)
+               and not callable(getattr(obj, attr))]
     for key in members:
         value = getattr(obj, key)
         if isinstance(value, (basestring, int, bool, float)):
@@ -55,6 +58,13 @@ def dump_class(obj):
     return result
 
 
+def is_loaded(obj, attr):
+    attribute = getattr(type(obj), attr, None)
+    if attribute is None or not hasattr(attribute, 'is_loaded'):
+        return True
+    return attribute.is_loaded(obj)
+
+
 def dump_iterable(obj):
     result = []
     for item in obj:
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import atexit
+import threading
+from contextlib import contextmanager
+
+try:
+    from sqlite3 import dbapi2 as database
+except:
+    # noinspection PyUnresolvedReferences
+    from pysqlite2 import dbapi2 as database
+
+import error_handler as eh
+from error_handler import ErrorPriority
+
+# Opening a database on a slow SD card can take longer than the query itself, so each database file is opened
+# once per invocation, and the connection is shared by everything (and every thread) that uses it
+
+pragmas = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    # negative is in KiB
+    'PRAGMA cache_size=-4096',
+    'PRAGMA mmap_size=16777216',
+    'PRAGMA temp_store=MEMORY',
+]
+
+__lock = threading.Lock()
+__connections = {}
+__schemas = {}
+
+
+class SharedConnection(object):
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.RLock()
+        self.connection = database.connect(db_file, timeout=10, check_same_thread=False)
+        for pragma in pragmas:
+            try:
+                self.connection.execute(pragma)
+            except database.Error:
+                # an old sqlite may not know some of them, that's fine
+                pass
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.commit()
+            finally:
+                self.connection.close()
+
+
+def register(db_file, create_tables):
+    """
+    Set the function that creates (or upgrades) the tables of a database. It is run when the database is opened
+    :param db_file: path to the database
+    :param create_tables: function that takes the sqlite connection
+    """
+    __schemas[db_file] = create_tables
+
+
+def get_connection(db_file):
+    """
+    Get the shared connection to a database, opening it if needed. If creating the tables fails, it's logged and the
+    database is used as it is
+    :param db_file: path to the database
+    :rtype: SharedConnection
+    """
+    with __lock:
+        shared = __connections.get(db_file)
+        if shared is None:
+            shared = SharedConnection(db_file)
+            create_tables = __schemas.get(db_file)
+            if create_tables is not None:
+                try:
+                    with shared.lock:
+                        create_tables(shared.connection)
+                        shared.connection.commit()
+                except:
+                    eh.exception(ErrorPriority.HIGH)
+                    # what wasn't committed is rolled back, and the tables are used as they are. It's tried again on
+                    # the next invocation, instead of every query of this one raising it again
+                    try:
+                        shared.connection.rollback()
+                        shared.close()
+                    except:
+                        pass
+                    shared = SharedConnection(db_file)
+            __connections[db_file] = shared
+        return shared
+
+
+@contextmanager
+def cursor(db_file, commit=False):
+    """
+    Use a cursor of the shared connection. Nothing else can use the connection until the block is done
+    with cursor(db_file, commit=True) as db_cursor:
+        db_cursor.execute(...)
+    :param db_file: path to the database
+    :param commit: commit when the block finishes, or roll back if it raises
+    """
+    shared = get_connection(db_file)
+    with shared.lock:
+        db_cursor = shared.connection.cursor()
+        try:
+            yield db_cursor
+            if commit:
+                shared.connection.commit()
+        except:
+            if commit:
+                shared.connection.rollback()
+            raise
+        finally:
+            db_cursor.close()
+
+
+def close(db_file):
+    with __lock:
+        shared = __connections.pop(db_file, None)
+    if shared is not None:
+        shared.close()
+
+
+def close_all():
+    with __lock:
+        connections = list(__connections.values())
+        __connections.clear()
+    for shared in connections:
+        try:
+            shared.close()
+        except database.Error:
+            pass
+
+
+atexit.register(close_all)
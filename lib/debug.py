@@ -53,7 +53,7 @@ def debug_init():
     also dump argv if spamLog
     :return:
     """
-    if plugin_addon.getSetting('remote_debug') == 'true':
+    if plugin_settings.get_bool('remote_debug'):
         # try pycharm first
         try:
             import pydevd
@@ -63,7 +63,7 @@ def debug_init():
             tries = 0
             while not connected and tries < 60:
                 try:
-                    pydevd.settrace(host=plugin_addon.getSetting('remote_ip'), stdoutToServer=True, stderrToServer=True,
+                    pydevd.settrace(host=plugin_settings.get('remote_ip'), stdoutToServer=True, stderrToServer=True,
                                     port=5678, suspend=False)
                     eh.spam('Connected to debugger')
                     connected = True
@@ -79,7 +79,7 @@ def debug_init():
                 web_pdb.set_trace()
             except Exception:
                 eh.exception(ErrorPriority.NORMAL, 'Unable to start debugger, disabling it')
-                plugin_addon.setSetting('remote_debug', 'false')
+                plugin_settings.set('remote_debug', 'false')
         except:
             eh.exception(ErrorPriority.HIGHEST, 'Unable to start debugger')
 
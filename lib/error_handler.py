@@ -8,7 +8,7 @@ from collections import defaultdict, Counter
 
 import class_dump
 import xbmcgui
-from nakamori_utils.globalvars import plugin_addon, plugin_version
+from nakamori_utils.globalvars import plugin_addon, plugin_settings, plugin_version
 
 try:
     import xbmc
@@ -162,7 +162,7 @@ def __get_basic_prefix():
 
 
 def spam(*args):
-    if plugin_addon.getSetting('spamLog') == 'true':
+    if plugin_settings.get_bool('spamLog'):
         log(*args)
 
 
@@ -238,7 +238,7 @@ def exception_internal(exc_type, exc_obj, exc_tb, priority, message=''):
         if msg == '':
             msg = str(exc_obj)
         ex = NakamoriError(msg, exc_type, place)
-        if priority == ErrorPriority.BLOCKING or plugin_addon.getSetting('spamLog') == 'true':
+        if priority == ErrorPriority.BLOCKING or plugin_settings.get_bool('spamLog'):
             for line in traceback.format_exc().replace('\r', '\n').split('\n'):
                 # skip empty lines
                 if len(line) == 0:
@@ -291,15 +291,15 @@ def show_messages():
         exes = Counter(exes).items()
         exes = sorted(exes)
         # log all if we are spamming
-        if plugin_addon.getSetting('spamLog') != 'true':
+        if not plugin_settings.get_bool('spamLog'):
             exes = next([x for x in exes if x[1] > 5], [])
         print_exceptions(exes)
-    if plugin_addon.getSetting('spamLog') == 'true' and ErrorPriority.LOWEST in __exceptions:
+    if plugin_settings.get_bool('spamLog') and ErrorPriority.LOWEST in __exceptions:
         exes = __exceptions[ErrorPriority.LOWEST]
         exes = Counter(exes).items()
         exes = sorted(exes)
         # log only if we are spamming
-        if plugin_addon.getSetting('spamLog') != 'true':
+        if not plugin_settings.get_bool('spamLog'):
             exes = next([x for x in exes if x[1] > 5], [])
             print_exceptions(exes)
 
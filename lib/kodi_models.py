@@ -71,7 +71,7 @@ class ListItem(xbmcgui.ListItem):
         elif flag == WatchedStatus.WATCHED:
             infolabels['playcount'] = 1
             infolabels['overlay'] = 5
-        elif flag == WatchedStatus.PARTIAL and plugin_addon.getSetting('file_resume') == 'true':
+        elif flag == WatchedStatus.PARTIAL and plugin_settings.get_bool('file_resume'):
             self.setProperty('ResumeTime', str(resume_time))
 
     def resume(self):
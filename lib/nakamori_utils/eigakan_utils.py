@@ -1,14 +1,13 @@
 # -*- coding: utf-8 -*-
 from nakamori_utils.globalvars import *
-from nakamori_utils import kodi_utils
+from nakamori_utils import kodi_utils, json_utils
 from proxy.python_version_proxy import python_proxy as pyproxy
 import error_handler as eh
-import json
 import xbmc
 import xbmcgui
 
-eigakan_url = plugin_addon.getSetting('ipEigakan')
-eigakan_port = plugin_addon.getSetting('portEigakan')
+eigakan_url = plugin_settings.get('ipEigakan')
+eigakan_port = plugin_settings.get('portEigakan')
 eigakan_host = 'http://' + eigakan_url + ':' + eigakan_port
 
 clientid = kodi_utils.get_device_id()
@@ -17,7 +16,7 @@ def probe_file(file_id, file_url):
     probe_url = eigakan_host + '/api/probe/%s/%s' % (clientid, file_id)
     post_data = '"file":"' + file_url + '"'
     streams = pyproxy.post_json(probe_url, post_data)
-    streams = json.loads(streams)
+    streams = json_utils.loads(streams)
     stream = streams.get('stream', {})
     audio = ''
     subs = ''
@@ -31,7 +30,7 @@ def pick_best_streams(audio_streams, subs_streams):
     s_index = -1
     subs_type = ''
     eh.spam('Processing streams a: %s; s: %s' % (audio_streams, subs_streams))
-    if plugin_addon.getSetting('eigakan_manual_mode') == 'false':
+    if plugin_settings.get('eigakan_manual_mode') == 'false':
         if len(audio_streams.split('\r')) == 1:
             a_index = audio_streams.split('|')[0]
         else:
@@ -101,7 +100,7 @@ def pick_best_streams(audio_streams, subs_streams):
     return a_index, s_index, subs_type
 
 def is_fileid_added_to_transcoder(file_id):
-    ask_for_queue = json.loads(pyproxy.get_json(eigakan_host + '/api/queue/status'))
+    ask_for_queue = json_utils.loads(pyproxy.get_json(eigakan_host + '/api/queue/status'))
     if ask_for_queue is None:
         ask_for_queue = {}
     # {"queue":{"queue":["6330","6330"],"subtitles":{"6330":{"status":"{'init'}"}},"videos":{}}}
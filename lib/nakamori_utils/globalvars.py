@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import time
 
 import xbmc
 import xbmcaddon
@@ -9,25 +10,117 @@ import xbmcaddon
 # We can make this an object belonging to nakamori.service, but we may need to make script and plugin
 # dependent on service if that is the case
 
+
+class Settings(object):
+    """
+    The settings of an addon, each read from Kodi once and then kept. getSetting() goes through Kodi's addon API,
+    and some settings are read for every item of a listing. Change them with set(), and open the settings dialog with
+    open_dialog(), or call invalidate() after they were changed some other way.
+    A change made by another invocation (like the settings dialog of the script) is seen here after max_age seconds
+    at most, which only matters to something that keeps running, like the service
+    """
+    def __init__(self, addon, max_age=60):
+        """
+        :param addon: the xbmcaddon.Addon
+        :param max_age: seconds to keep the values, so a long running service still sees changes
+        """
+        self.addon = addon
+        self.max_age = max_age
+        self._values = {}
+        self._loaded = time.time()
+
+    def get(self, setting_id):
+        """
+        :param setting_id: the id of the setting
+        :return: the value, as Kodi gives it
+        :rtype: str
+        """
+        if time.time() - self._loaded > self.max_age:
+            self.invalidate()
+        try:
+            return self._values[setting_id]
+        except KeyError:
+            value = self.addon.getSetting(setting_id)
+            self._values[setting_id] = value
+            return value
+
+    def get_bool(self, setting_id):
+        """
+        :param setting_id: the id of a bool setting
+        :rtype: bool
+        """
+        return self.get(setting_id) == 'true'
+
+    def get_int(self, setting_id, default=0):
+        """
+        :param setting_id: the id of a numeric setting
+        :param default: used when the setting is not there or is not a number
+        :rtype: int
+        """
+        try:
+            return int(self.get(setting_id))
+        except (TypeError, ValueError):
+            return default
+
+    def set(self, setting_id, value):
+        """
+        Change a setting in Kodi and here
+        :param setting_id: the id of the setting
+        :param value: the new value, as a str
+        """
+        self.addon.setSetting(setting_id, value)
+        self._values[setting_id] = value
+
+    def open_dialog(self):
+        """
+        Show the settings dialog of the addon, and read the settings again after it's closed
+        """
+        self.addon.openSettings()
+        self.invalidate()
+
+    def invalidate(self, setting_id=None):
+        """
+        Read a setting from Kodi again the next time it's asked for
+        :param setting_id: the id of the setting, or None for all of them
+        """
+        if setting_id is None:
+            self._values = {}
+            self._loaded = time.time()
+        else:
+            self._values.pop(setting_id, None)
+
+
 # The plugin object for nakamori.plugin
 plugin_addon = xbmcaddon.Addon('plugin.video.nakamori')
+plugin_settings = Settings(plugin_addon)
 plugin_version = plugin_addon.getAddonInfo('version')
 plugin_home = xbmc.translatePath(plugin_addon.getAddonInfo('path'))
-plugin_img_path = os.path.join(xbmcaddon.Addon(plugin_addon.getSetting('icon_pack')).getAddonInfo('path'), 'resources', 'media')
+plugin_img_path = os.path.join(xbmcaddon.Addon(plugin_settings.get('icon_pack')).getAddonInfo('path'), 'resources', 'media')
 
 service_addon = xbmcaddon.Addon('service.nakamori')
 script_addon = xbmcaddon.Addon('script.module.nakamori')
 lib_addon = xbmcaddon.Addon('script.module.nakamori-lib')
 
-server = 'http://' + plugin_addon.getSetting('ipaddress') + ':' + plugin_addon.getSetting('port')
+server = 'http://' + plugin_settings.get('ipaddress') + ':' + plugin_settings.get('port')
 
 tag_setting_flags = 0
-tag_setting_flags |= 1 << 0 if plugin_addon.getSetting('MiscTags') == 'true' else 0
-tag_setting_flags |= 1 << 1 if plugin_addon.getSetting('ArtTags') == 'true' else 0
-tag_setting_flags |= 1 << 2 if plugin_addon.getSetting('SourceTags') == 'true' else 0
-tag_setting_flags |= 1 << 3 if plugin_addon.getSetting('UsefulMiscTags') == 'true' else 0
-tag_setting_flags |= 1 << 4 if plugin_addon.getSetting('SpoilerTags') == 'true' else 0
-tag_setting_flags |= 1 << 5 if plugin_addon.getSetting('SettingTags') == 'true' else 0
-tag_setting_flags |= 1 << 6 if plugin_addon.getSetting('ProgrammingTags') == 'true' else 0
-tag_setting_flags |= 1 << 7 if plugin_addon.getSetting('GenreTags') == 'true' else 0
-tag_setting_flags |= 1 << 31 if plugin_addon.getSetting('InvertTags') == 'Show' else 0
+tag_setting_flags |= 1 << 0 if plugin_settings.get_bool('MiscTags') else 0
+tag_setting_flags |= 1 << 1 if plugin_settings.get_bool('ArtTags') else 0
+tag_setting_flags |= 1 << 2 if plugin_settings.get_bool('SourceTags') else 0
+tag_setting_flags |= 1 << 3 if plugin_settings.get_bool('UsefulMiscTags') else 0
+tag_setting_flags |= 1 << 4 if plugin_settings.get_bool('SpoilerTags') else 0
+tag_setting_flags |= 1 << 5 if plugin_settings.get_bool('SettingTags') else 0
+tag_setting_flags |= 1 << 6 if plugin_settings.get_bool('ProgrammingTags') else 0
+tag_setting_flags |= 1 << 7 if plugin_settings.get_bool('GenreTags') else 0
+tag_setting_flags |= 1 << 31 if plugin_settings.get('InvertTags') == 'Show' else 0
+
+
+def get_int_setting(setting_id, default=0):
+    """
+    Read a numeric setting of the plugin
+    :param setting_id: the id of the setting
+    :param default: used when the setting is not there or is not a number
+    :return: the value
+    :rtype: int
+    """
+    return plugin_settings.get_int(setting_id, default)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import codecs
+import json
+import weakref
+from collections import deque
+
+# Parses a json object while it's being downloaded. The arrays that are asked for are given an element at a time,
+# so the first ListItem can be built before the rest arrives, and the whole document is never in memory at once.
+# Everything else in the object is parsed normally, one top level value at a time
+
+_whitespace = ' \t\n\r'
+_number = '0123456789.eE+-'
+
+
+class _Parser(object):
+    def __init__(self, chunks, array_keys):
+        self.chunks = iter(chunks)
+        self.array_keys = array_keys
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, wanted=1):
+        """
+        Read until there are at least wanted characters after pos
+        :return: False if the end was reached first
+        """
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        parts = [self.text]
+        size = len(self.text)
+        while size < wanted and not self.eof:
+            try:
+                chunk = self.utf8.decode(next(self.chunks))
+            except StopIteration:
+                chunk = self.utf8.decode(b'', True)
+                self.eof = True
+            parts.append(chunk)
+            size += len(chunk)
+        self.text = ''.join(parts)
+        return size >= wanted
+
+    def peek(self):
+        """
+        Skip whitespace
+        :return: the next character, or None at the end
+        """
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, characters):
+        c = self.peek()
+        if c is None or c not in characters:
+            raise ValueError('Expected %s at %i, got %r' % (characters, self.pos, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                result, end = self.decoder.raw_decode(self.text, self.pos)
+                # a number that was cut in the middle (like 12 of 12.5e3) could still go on
+                if self.eof or (end < len(self.text) and self.text[end] not in _number):
+                    self.pos = end
+                    return result
+            except ValueError:
+                if self.eof:
+                    raise
+            # read at least as much again, so a big value isn't parsed over and over
+            self.fill(2 * (len(self.text) - self.pos) + 1)
+
+    def events(self):
+        """
+        :return: generator of ('field', key, value), ('start', key, None), ('item', key, value) and ('end', key, None)
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key in self.array_keys and self.peek() == '[':
+                self.pos += 1
+                yield 'start', key, None
+                if self.peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield 'item', key, self.value()
+                        if self.expect(',]') == ']':
+                            break
+                kind, value = 'end', None
+            else:
+                kind, value = 'field', self.value()
+            # look ahead, so that the body was read to the end once the last value is given
+            last = self.expect(',}') == '}'
+            if last:
+                self.finish()
+            yield kind, key, value
+            if last:
+                return
+
+    def finish(self):
+        # read what's left (normally nothing), so that whatever gives us the chunks sees the end
+        for _ in self.chunks:
+            pass
+        self.eof = True
+
+
+class _Closer(object):
+    """
+    Closes the chunks of a StreamedNode once, so the connection they come from is given back, and tells on_close.
+    It's kept apart from the node, so that a cycle through the node can't keep __del__ from running (a cycle with
+    __del__ is never collected on python 2)
+    """
+    def __init__(self, chunks, on_close):
+        self.chunks = chunks
+        self.on_close = on_close
+        self.closed = False
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.chunks, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    def __del__(self):
+        self.close()
+
+
+class StreamedArray(object):
+    """
+    An array of a StreamedNode that is still being read. It can only be iterated once, while the node is kept.
+    It doesn't keep the node itself, so a node that is dropped is closed right away
+    """
+    def __init__(self, node, key):
+        self.node = weakref.ref(node)
+        self.key = key
+        self.pending = deque()
+        self.done = False
+
+    def __iter__(self):
+        while True:
+            if len(self.pending) > 0:
+                yield self.pending.popleft()
+            elif self.done:
+                return
+            else:
+                node = self.node()
+                if node is None or not node.advance():
+                    return
+                del node
+
+
+class StreamedNode(object):
+    """
+    Looks like the dict that json.loads would give, as far as the models use it. Values are parsed when they are
+    asked for, and the arrays in array_keys are StreamedArrays, unless something after them was asked for first
+    """
+    def __init__(self, chunks, array_keys, on_close=None):
+        """
+        :param chunks: iterable of the body as bytes, in pieces
+        :param array_keys: the top level arrays to stream
+        :param on_close: function without arguments, called once when the whole object was read, reading it failed,
+        or the node was closed or dropped
+        """
+        self._events = _Parser(chunks, array_keys).events()
+        self._values = {}
+        self._finished = False
+        self._closer = _Closer(chunks, on_close)
+
+    def close(self):
+        """
+        Stop reading. What wasn't read yet is never given, and the connection is dropped instead of reused
+        """
+        self._finished = True
+        self._closer.close()
+
+    def advance(self):
+        """
+        Read the next value
+        :return: False when the whole object was read
+        """
+        if self._finished:
+            return False
+        try:
+            kind, key, value = next(self._events)
+        except StopIteration:
+            self._finished = True
+            self._closer.close()
+            return False
+        except:
+            self.close()
+            raise
+        if kind == 'field':
+            self._values[key] = value
+        elif kind == 'start':
+            self._values[key] = StreamedArray(self, key)
+        elif kind == 'item':
+            self._values[key].pending.append(value)
+        else:
+            self._values[key].done = True
+        return True
+
+    def get(self, key, default=None):
+        while key not in self._values:
+            if not self.advance():
+                return default
+        return self._values[key]
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
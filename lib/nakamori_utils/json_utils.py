@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import json
+
+# The fastest json library that is installed, with the standard one as the fallback.
+# loads() takes str or bytes, and dumps() always gives str, whichever one is used
+
+backend = 'json'
+try:
+    # noinspection PyUnresolvedReferences
+    import orjson as _backend
+    backend = 'orjson'
+except ImportError:
+    try:
+        # noinspection PyUnresolvedReferences
+        import ujson as _backend
+        backend = 'ujson'
+    except ImportError:
+        try:
+            # noinspection PyUnresolvedReferences
+            import simplejson as _backend
+            backend = 'simplejson'
+        except ImportError:
+            _backend = json
+
+
+def loads(data):
+    """
+    :param data: json as str or bytes
+    :return: the parsed json
+    :raises ValueError: if it isn't valid json
+    """
+    return _backend.loads(data)
+
+
+def dumps(obj, **kwargs):
+    """
+    :param obj: something that json can represent
+    :param kwargs: options of json.dumps, like indent or sort_keys. These always use the standard library
+    :return: the json
+    :rtype: str
+    """
+    if len(kwargs) > 0:
+        return json.dumps(obj, **kwargs)
+    if backend == 'orjson':
+        try:
+            return _backend.dumps(obj).decode('utf-8')
+        except TypeError:
+            # orjson is strict about things like non-str keys, which json just converts
+            return json.dumps(obj)
+    if backend == 'ujson':
+        return _backend.dumps(obj, escape_forward_slashes=False)
+    return _backend.dumps(obj)
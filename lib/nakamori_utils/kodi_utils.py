@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import json
 import sys
 import os
 
@@ -8,9 +7,11 @@ import xbmcgui
 import xbmcplugin
 
 from nakamori_utils.globalvars import *
+import art_cache
 import error_handler as eh
 from error_handler import ErrorPriority, log
-from nakamori_utils.globalvars import plugin_addon
+from nakamori_utils.globalvars import plugin_addon, plugin_settings
+from nakamori_utils import json_utils
 from proxy.python_version_proxy import python_proxy as pyproxy
 from proxy.python_version_proxy import http_error as http_err
 from nakamori_utils.script_utils import log_setsuzoku
@@ -28,8 +29,8 @@ localize2 = lib_addon.getLocalizedString
 
 sorting_types = []
 
-eigakan_url = plugin_addon.getSetting('ipEigakan')
-eigakan_port = plugin_addon.getSetting('portEigakan')
+eigakan_url = plugin_settings.get('ipEigakan')
+eigakan_port = plugin_settings.get('portEigakan')
 eigakan_host = 'http://' + eigakan_url + ':' + eigakan_port
 
 
@@ -136,7 +137,7 @@ def import_folder_list():
     """
     pick_folder = []
     get_id = []
-    import_list = json.loads(pyproxy.get_json(server + '/api/folder/list'))
+    import_list = json_utils.loads(pyproxy.get_json(server + '/api/folder/list'))
     if len(import_list) > 1:
         for body in import_list:
             location = str(body['ImportFolderLocation'])
@@ -164,6 +165,8 @@ def clear_listitem_cache():
     ret = xbmcgui.Dialog().yesno(plugin_addon.getLocalizedString(30104),
                                  plugin_addon.getLocalizedString(30081), plugin_addon.getLocalizedString(30112))
     if ret:
+        # the local copies of the art go too, their textures are removed below with the rest of nakamori
+        art_cache.clear()
         db_files = []
         db_path = os.path.join(pyproxy.decode(xbmc.translatePath('special://home')), 'userdata')
         db_path = os.path.join(db_path, 'Database')
@@ -191,6 +194,8 @@ def clear_image_cache():
     ret = xbmcgui.Dialog().yesno(plugin_addon.getLocalizedString(30104),
                                  plugin_addon.getLocalizedString(30081), plugin_addon.getLocalizedString(30112))
     if ret:
+        # the local copies of the art go too, their textures are removed below with the rest of nakamori
+        art_cache.clear()
         db_files = []
         db_path = os.path.join(pyproxy.decode(xbmc.translatePath('special://home')), 'userdata')
         db_path = os.path.join(db_path, 'Database')
@@ -201,7 +206,7 @@ def clear_image_cache():
         for db_file in db_files:
             db_connection = database.connect(os.path.join(db_path, db_file))
             db_cursor = db_connection.cursor()
-            db_cursor.execute('DELETE FROM texture WHERE url LIKE "%' + plugin_addon.getSetting('port') + '/api/%"')
+            db_cursor.execute('DELETE FROM texture WHERE url LIKE "%' + plugin_settings.get('port') + '/api/%"')
             db_connection.commit()
             db_cursor.execute('DELETE FROM texture WHERE url LIKE "%nakamori%"')
             db_connection.commit()
@@ -302,7 +307,7 @@ def move_position_on_list(control_list, position=0, absolute=False):
     if not absolute:
         if position < 0:
             position = 0
-        if plugin_addon.getSetting('show_continue') == 'true':
+        if plugin_settings.get_bool('show_continue'):
             position = int(position + 1)
         if get_kodi_setting('filelists.showparentdiritems'):
             position = int(position + 1)
@@ -333,10 +338,10 @@ def message_box(title, text, text2=None, text3=None):
 
 def kodi_jsonrpc(method, params):
     try:
-        values = (pyproxy.decode(method), json.dumps(params))
+        values = (pyproxy.decode(method), json_utils.dumps(params))
         request = '{"jsonrpc":"2.0","method":"%s","params":%s, "id": 1}' % values
         return_data = xbmc.executeJSONRPC(request)
-        result = json.loads(return_data)
+        result = json_utils.loads(return_data)
         return result
     except:
         eh.exception(ErrorPriority.HIGH, localize2(30016))
@@ -477,27 +482,27 @@ def send_profile():
     settings = {}
 
     # tweak-ninja
-    settings['manual_mode'] = plugin_addon.getSetting('eigakan_manual_mode')
-    settings['h_resolution'] = plugin_addon.getSetting('eigakan_h_resolution')
-    settings['h_bitrate'] = plugin_addon.getSetting('eigakan_h_bitrate')
-    settings['l_resolution'] = plugin_addon.getSetting('eigakan_l_resolution')
-    settings['l_bitrate'] = plugin_addon.getSetting('eigakan_l_bitrate')
-    settings['x264_preset'] = plugin_addon.getSetting('eigakan_x264_preset')
-    settings['burn_subs'] = plugin_addon.getSetting('burnEigakan')
+    settings['manual_mode'] = plugin_settings.get('eigakan_manual_mode')
+    settings['h_resolution'] = plugin_settings.get('eigakan_h_resolution')
+    settings['h_bitrate'] = plugin_settings.get('eigakan_h_bitrate')
+    settings['l_resolution'] = plugin_settings.get('eigakan_l_resolution')
+    settings['l_bitrate'] = plugin_settings.get('eigakan_l_bitrate')
+    settings['x264_preset'] = plugin_settings.get('eigakan_x264_preset')
+    settings['burn_subs'] = plugin_settings.get('burnEigakan')
     # lang-master
-    settings['pref_audio'] = plugin_addon.getSetting('audiolangEigakan')
-    settings['pref_subs'] = plugin_addon.getSetting('subEigakan')
+    settings['pref_audio'] = plugin_settings.get('audiolangEigakan')
+    settings['pref_subs'] = plugin_settings.get('subEigakan')
 
-    settings = json.dumps(settings)
+    settings = json_utils.dumps(settings)
 
     eh.spam('send_profile() data = %s' % settings)
 
     try:
         pyproxy.post_data(eigakan_host + '/api/clientid/%s' % get_device_id(), settings)
         # if no error, lets mark that we did full handshake with eigakan
-        plugin_addon.setSetting('eigakan_handshake', 'true')
+        plugin_settings.set('eigakan_handshake', 'true')
     except Exception as ex:
-        plugin_addon.setSetting('eigakan_handshake', 'false')
+        plugin_settings.set('eigakan_handshake', 'false')
         eh.spam('error while send_profile(): %s' % ex)
 
 
@@ -511,14 +516,14 @@ def check_eigakan():
             # raise RuntimeError('Invalid response from Eigakan')
             return False
         else:
-            if plugin_addon.getSetting('eigakan_handshake') == 'false':
+            if plugin_settings.get('eigakan_handshake') == 'false':
                 eh.spam('We did not find Eigakan handshake')
                 try:
                     pyproxy.get_json(eigakan_host + '/api/clientid/%s' % get_device_id())
                 except http_err as err:
                     if int(err.code) == 404:
                         eh.spam('We did not find device profile on Eigakan, sending new one...')
-                        plugin_addon.setSetting('eigakan_handshake', 'false')
+                        plugin_settings.set('eigakan_handshake', 'false')
                         send_profile()
                     else:
                         return False
@@ -532,7 +537,7 @@ def is_addon_installed(addonid='inputstream.adaptive'):
         '{"jsonrpc":"2.0","id":1,"method":"Addons.GetAddonDetails","params":{"addonid":"%s","properties":["enabled"]}}'
         % addonid)
     # {"error":{"code":-32602,"message":"Invalid params."},"id":1,"jsonrpc":"2.0"}
-    xret = json.loads(x)
+    xret = json_utils.loads(x)
     if 'error' in xret:
         return False
     return True
@@ -543,7 +548,7 @@ def is_addon_enabled(addonid='inputstream.adaptive'):
         '{"jsonrpc":"2.0","id":1,"method":"Addons.GetAddonDetails","params":{"addonid":"%s","properties":["enabled"]}}'
         % addonid)
     # {"id":1,"jsonrpc":"2.0","result":{"addon":{"addonid":"inputstream.adaptive","enabled":false,"type":"kodi.inputstream"}}}
-    xret = json.loads(x)
+    xret = json_utils.loads(x)
     xret = xret.get('result', {'addon': {'enabled': 'false'}}).get('addon').get('enabled')
     if type(xret) is bool:
         return xret
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 import re
-from collections import defaultdict
+import threading
+from collections import defaultdict, OrderedDict
 
+import art_cache
 import error_handler as eh
 from error_handler import ErrorPriority
 from nakamori_utils.globalvars import *
-from proxy.python_version_proxy import python_proxy as pyproxy
+from proxy.python_version_proxy import python_proxy as pyproxy, UrlBuilder
 from proxy.kodi_version_proxy import kodi_proxy as kproxy
 
 
@@ -23,7 +25,7 @@ def get_tags(tag_node):
             return ''
         if len(tag_node) == 0:
             return ''
-        short_tag = plugin_addon.getSetting('short_tag_list') == 'true'
+        short_tag = plugin_settings.get_bool('short_tag_list')
         temp_genres = []
         current_length = 0
         # the '3' here is because the separator ' | ' is 3 chars
@@ -56,50 +58,19 @@ def get_cast_and_role_new(data, fix_seiyuu_pic=False):
     """
     result_list = []
     if data is not None and len(data) > 0:
+        animated_pictures = plugin_settings.get_bool('seiyuu_gif')
         for char in data:
             char_charname = char.get('character', '')
             char_seiyuuname = char.get('staff', '')
-            animated_pictures = True if plugin_addon.getSetting('seiyuu_gif') == 'true' else False
             try:
-                if animated_pictures:
-                    # TODO as for now it eats a lot of disk space and the process it slows down loading time significantly
-                    # TODO this is as test for quality / performence
-                    file_name = str(char_seiyuuname).replace(' ', '') + str(char_charname).replace(' ', '')
-                    profileDir = xbmc.translatePath(xbmcaddon.Addon().getAddonInfo('profile'))
-                    import os
-                    if not os.path.exists(profileDir):
-                        os.mkdir(profileDir)
-                    new_image_url = os.path.join(profileDir, 'characters')
-                    if not os.path.exists(new_image_url):
-                        os.mkdir(new_image_url)
-                    new_image_url = os.path.join(new_image_url, file_name + '.gif')
-                    if not os.path.exists(new_image_url):
-                        frames = []
-                        actor_pic = server + char.get('staff_image', '')
-                        char_pic = server + char.get('character_image', '')
-                        if actor_pic != '' and char_pic != '':
-                            from PIL import ImageFont, ImageDraw, Image
-                            from io import BytesIO
-                            try:
-                                from urllib.request import urlopen
-                            except ImportError:
-                                from urllib2 import urlopen
-                            img1 = Image.open(BytesIO(urlopen(actor_pic).read()))
-                            img2 = Image.open(BytesIO(urlopen(char_pic).read()))
-                            # TODO Center characters
-                            # TODO resize image and/or crop
-                            frames.append(img1)
-                            frames.append(img2)
-                            frames[0].save(new_image_url, format='GIF', append_images=frames[1:], save_all=True, duration=500,
-                                           loop=0)
-                    char_seiyuupic = new_image_url
+                if fix_seiyuu_pic:
+                    char_seiyuupic = server + char.get('staff_image', '')
                 else:
-                    # region OLD
-                    if fix_seiyuu_pic:
-                        char_seiyuupic = server + char.get('staff_image', '')
-                    else:
-                        char_seiyuupic = server + char.get('character_image', '')
-                    # endregion OLD
+                    char_seiyuupic = server + char.get('character_image', '')
+                if animated_pictures:
+                    # made in the background, the listing gets the static picture until it's ready
+                    char_seiyuupic = art_cache.get_character_picture(char.get('staff_image', ''),
+                                                                     char.get('character_image', ''), char_seiyuupic)
             except Exception as ex:
                 # TODO UNTIL THIS IS NOT POLISHED OR MOVED TO SERVER LEAVE THIS AS IS
                 xbmc.log('EEEEEEE------- ' + str(ex), xbmc.LOGNOTICE)
@@ -204,7 +175,7 @@ def get_title(data, lang=None, title_type=None):
 
     """
     try:
-        if 'titles' not in data or plugin_addon.getSetting('use_server_title') == 'true':
+        if 'titles' not in data or plugin_settings.get_bool('use_server_title'):
             return pyproxy.decode(data.get('name', ''))
         # xbmc.log(data.get('title', 'Unknown'))
         title = pyproxy.decode(data.get('name', '').lower())
@@ -212,22 +183,23 @@ def get_title(data, lang=None, title_type=None):
             return pyproxy.decode(data.get('name', ''))
 
         if lang is None:
-            lang = plugin_addon.getSetting('displaylang')
+            lang = plugin_settings.get('displaylang')
         if title_type is None:
-            title_type = plugin_addon.getSetting('title_type')
+            title_type = plugin_settings.get('title_type')
 
+        titles = get_title_index(data)
         # try to match
-        title = match_title(data, lang, title_type)
+        title = titles.match(lang, title_type)
         if title is not None:
             return title
 
         # fallback on any type of same language
-        title = match_title(data, lang, '!short')
+        title = titles.match(lang, '!short')
         if title is not None:
             return title
 
         # fallback on x-jat main title
-        title = match_title(data, 'x-jat', 'main')
+        title = titles.match('x-jat', 'main')
         if title is not None:
             return title
 
@@ -239,31 +211,85 @@ def get_title(data, lang=None, title_type=None):
 
 
 def match_title(data, lang, title_type):
+    """
+    :param data: json node containing the titles
+    :param lang: the language of the title
+    :param title_type: the type of the title, or !type for the first one that isn't that type
+    :return: the title, or None if there isn't one
+    """
     try:
-        exclude = False
-        if title_type.startswith('!'):
-            title_type = title_type[1:]
-            exclude = True
+        return get_title_index(data).match(lang, title_type)
+    except:
+        eh.exception(ErrorPriority.NORMAL)
+        return None
 
-        for title_tag in data.get('titles', []):
+
+class TitleIndex(object):
+    """
+    The titles of a json node by language and type, made in one pass, so that a lookup doesn't go over them again
+    """
+    __slots__ = ('by_type', 'first', 'other')
+
+    def __init__(self, titles):
+        # (language, type): the first title of them
+        self.by_type = {}
+        # language: (type, title) of its first title
+        self.first = {}
+        # language: its first title with another type than the first one
+        self.other = {}
+        for title_tag in titles:
             title = pyproxy.decode(title_tag.get('Title', ''))
-            if pyproxy.decode(title_tag.get('Title', '')) == '':
+            if title == '':
                 continue
+            lang = title_tag.get('Language', '').lower()
+            title_type = title_tag.get('Type', '').lower()
+            if (lang, title_type) not in self.by_type:
+                self.by_type[(lang, title_type)] = title
+            first = self.first.get(lang)
+            if first is None:
+                self.first[lang] = (title_type, title)
+            elif first[0] != title_type and lang not in self.other:
+                self.other[lang] = title
+
+    def match(self, lang, title_type):
+        """
+        See match_title()
+        """
+        lang = lang.lower()
+        if not title_type.startswith('!'):
+            return self.by_type.get((lang, title_type.lower()))
+        first = self.first.get(lang)
+        if first is None:
+            return None
+        if first[0] != title_type[1:].lower():
+            return first[1]
+        return self.other.get(lang)
 
-            if title_tag.get('Language', '').lower() != lang.lower():
-                continue
-            # does it match the proper type
-            if exclude and title_tag.get('Type', '').lower() == title_type.lower():
-                continue
 
-            if not exclude and title_tag.get('Type', '').lower() != title_type.lower():
-                continue
+# TitleIndexes of the last json nodes, by id(). The node is kept with it, so the id can't be reused meanwhile
+title_indexes = OrderedDict()
+title_indexes_size = 64
+title_indexes_lock = threading.Lock()
 
-            return title
-        return None
-    except:
-        eh.exception(ErrorPriority.NORMAL)
-        return None
+
+def get_title_index(data):
+    """
+    :param data: json node containing the titles
+    :rtype: TitleIndex
+    """
+    key = id(data)
+    with title_indexes_lock:
+        entry = title_indexes.get(key)
+        if entry is not None and entry[0] is data:
+            title_indexes[key] = title_indexes.pop(key)
+            return entry[1]
+
+    index = TitleIndex(data.get('titles', []))
+    with title_indexes_lock:
+        title_indexes[key] = (data, index)
+        while len(title_indexes) > title_indexes_size:
+            title_indexes.popitem(last=False)
+    return index
 
 
 def video_file_information(node, detail_dict):
@@ -411,18 +437,18 @@ def title_coloring(title, episode_count, total_count, special_count, total_speci
     :return: colorized title
     """
     color_title = title
-    if plugin_addon.getSetting('color_title') != 'true' or is_movie:  # skip movies (they like to have parts)
+    if not plugin_settings.get_bool('color_title') or is_movie:  # skip movies (they like to have parts)
         return color_title
 
     color_format = '[COLOR %s]%s[/COLOR]'
     if airing:
-        color = plugin_addon.getSetting('title_color_airing')
-        color_special = plugin_addon.getSetting('title_color_airing_special')
-        color_missing = plugin_addon.getSetting('title_color_airing_missing')
+        color = plugin_settings.get('title_color_airing')
+        color_special = plugin_settings.get('title_color_airing_special')
+        color_missing = plugin_settings.get('title_color_airing_missing')
     else:
-        color = plugin_addon.getSetting('title_color_finish')
-        color_special = plugin_addon.getSetting('title_color_finish_special')
-        color_missing = plugin_addon.getSetting('title_color_finish_missing')
+        color = plugin_settings.get('title_color_finish')
+        color_special = plugin_settings.get('title_color_finish_special')
+        color_missing = plugin_settings.get('title_color_finish_missing')
 
     if episode_count == total_count:
         if total_special_count == 0:
@@ -484,18 +510,41 @@ def set_stream_info(listitem, f):
             listitem.addStreamInfo('subtitle', subs[stream2])
 
 
+# the patterns of the description cleaners, compiled once instead of on every call
+anidb_link_pattern = re.compile(r'(https?://anidb\.net/[0-9A-z/\-_.?=&]+[ ]*\[)([\S ]+?)(\])')
+anidb_annotation_pattern = re.compile(r'\n(Source|Note|Summary):')
+anidb_comment_pattern = re.compile(r'^(\*|--|~) .*', re.MULTILINE)
+multi_empty_lines_pattern = re.compile(r'\n\n+')
+
+# make_text_nice() results by the text they were made from. The same summaries come again in every listing
+nice_texts = OrderedDict()
+nice_texts_size = 1024
+nice_texts_lock = threading.Lock()
+
+
 def make_text_nice(data=''):
     """
     Make any anidb text look nice, clean and sleek by removing links, annotations, comments, empty lines
     :param data: text that is too ugly to be shown
     :return: text that is a bit nicer
     """
-    data = remove_anidb_links(data)
+    with nice_texts_lock:
+        result = nice_texts.get(data)
+        if result is not None:
+            nice_texts[data] = nice_texts.pop(data)
+            return result
+
+    result = remove_anidb_links(data)
     # the only one I could care to make settings if someone ask for
-    data = remove_anidb_annotations(data)
-    data = remove_anidb_comments(data)
-    data = remove_multi_empty_lines(data)
-    return data
+    result = remove_anidb_annotations(result)
+    result = remove_anidb_comments(result)
+    result = remove_multi_empty_lines(result)
+
+    with nice_texts_lock:
+        nice_texts[data] = result
+        while len(nice_texts) > nice_texts_size:
+            nice_texts.popitem(last=False)
+    return result
 
 
 def remove_anidb_links(data=''):
@@ -507,8 +556,9 @@ def remove_anidb_links(data=''):
     Returns: new string without links
 
     """
-    p = re.compile(r'(https?://anidb\.net/[0-9A-z/\-_.?=&]+[ ]*\[)([\S ]+?)(\])')
-    return p.sub(r'\2', data)
+    if 'anidb.net/' not in data:
+        return data
+    return anidb_link_pattern.sub(r'\2', data)
 
 
 def remove_anidb_comments(data=''):
@@ -517,18 +567,20 @@ def remove_anidb_comments(data=''):
     :param data: text to clean
     :return: text after clean
     """
-    data = re.sub(r'^(\*|--|~) .*', "", data, flags=re.MULTILINE)
-    return data.strip(" \n")
+    data = anidb_comment_pattern.sub('', data)
+    return data.strip(' \n')
 
 
 def remove_anidb_annotations(data=''):
     """
-    Remove annotations containing Source, Note, Summary from description
+    Remove annotations containing Source, Note, Summary from description, and everything after them
     :param data: text to clean
     :return: text after clean
     """
-    data = re.sub(r'\n(Source|Note|Summary):.*', "", data, flags=re.DOTALL)
-    return data.strip(" \n")
+    match = anidb_annotation_pattern.search(data)
+    if match is not None:
+        data = data[:match.start()]
+    return data.strip(' \n')
 
 
 def remove_multi_empty_lines(data=''):
@@ -537,14 +589,26 @@ def remove_multi_empty_lines(data=''):
     :param data: text to clean
     :return: text after clean
     """
-    data = re.sub(r'\n\n+', r'\n\n', data)
-    return data.strip(" \n")
+    if '\n\n\n' in data:
+        data = multi_empty_lines_pattern.sub('\n\n', data)
+    return data.strip(' \n')
 
 
 def add_default_parameters(url, obj_id, level):
-    key = pyproxy.set_parameter(url, 'id', obj_id)
-    key = pyproxy.set_parameter(key, 'level', level)
-    key = pyproxy.set_parameter(key, 'tagfilter', tag_setting_flags)
-    if plugin_addon.getSetting('request_nocast') == 'true':
-        key = pyproxy.set_parameter(key, 'nocast', 1)
-    return key
+    return set_default_parameters(UrlBuilder(url), obj_id, level).build()
+
+
+def set_default_parameters(url, obj_id, level):
+    """
+    Set the parameters that every request for an object has
+    :param url: the url
+    :type url: UrlBuilder
+    :param obj_id: the id of the object
+    :param level: how deep the children should be
+    :return: the same UrlBuilder
+    :rtype: UrlBuilder
+    """
+    url.set('id', obj_id).set('level', level).set('tagfilter', tag_setting_flags)
+    if plugin_settings.get_bool('request_nocast'):
+        url.set('nocast', 1)
+    return url
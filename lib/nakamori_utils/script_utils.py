@@ -113,7 +113,9 @@ def url_service_settings():
 
 def settings():
     url = url_settings()
-    xbmc.executebuiltin(url)
+    # wait for the dialog, so what was changed in it is used from now on
+    xbmc.executebuiltin(url, True)
+    plugin_settings.invalidate()
 
 
 def url_shoko_menu():
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
-import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
 from distutils.version import LooseVersion
 
 import xbmcgui
-from nakamori_utils import kodi_utils
+from nakamori_utils import kodi_utils, json_utils, thread_utils
 from nakamori_utils.globalvars import *
 from nakamori_utils.kodi_utils import message_box
 from proxy import python_version_proxy
-from proxy.python_version_proxy import python_proxy as pyproxy
+from proxy.python_version_proxy import python_proxy as pyproxy, UrlBuilder
 import error_handler as eh
 from error_handler import ErrorPriority
 import xbmc
@@ -27,13 +31,29 @@ localization_notification_map = {
     'folderscan': plugin_addon.getLocalizedString(30199),
 }
 
+# the queues of the server that an action leaves its work in, by the command.
+# The list is refreshed when they are empty, see wait_for_queues()
+action_queues = {
+    'rescan': ('general',),
+    'rehash': ('hasher', 'general'),
+}
+default_action_queues = ('hasher', 'general')
+
+# the last time that the server answered that it's started, so a plugin start soon after doesn't ask again.
+# It's kept in the profile for the next invocations, see remember_server_state()
+server_state = {}
+server_state_lock = threading.Lock()
+# noinspection PyTypeChecker
+server_state_file = os.path.join(pyproxy.decode(xbmc.translatePath(plugin_addon.getAddonInfo('profile'))),
+                                 'server_state.json')
+
 localization_refresh_map = {
     'refresh10': plugin_addon.getLocalizedString(30191),
     'awhile': plugin_addon.getLocalizedString(30193),
 }
 
 
-def perform_server_action(command, object_id=None, refresh='refresh10', post=False, post_body=''):
+def perform_server_action(command, object_id=None, refresh='refresh10', post=False, post_body='', objects=None):
     """
     Performs an action on the server
     Args:
@@ -42,10 +62,12 @@ def perform_server_action(command, object_id=None, refresh='refresh10', post=Fal
         refresh: whether to refresh
         post: is it a POST endpoint
         post_body: the body to post, minus the {}
+        objects: (type, id) pairs of what the action changes, their cached responses go before the refresh
     """
-    key_url = server + '/api/' + command
+    key_url = UrlBuilder(server + '/api/' + command)
     if object_id is not None and object_id != 0 and object_id != '':
-        key_url = pyproxy.set_parameter(key_url, 'id', object_id)
+        key_url.set('id', object_id)
+    key_url = key_url.build()
 
     eh.spam('url:', key_url, 'id:', object_id)
     eh.spam('post:', post, 'body:', post_body)
@@ -62,10 +84,80 @@ def perform_server_action(command, object_id=None, refresh='refresh10', post=Fal
         localization_notification_map.get(command, command),
         refresh_message, plugin_addon.getAddonInfo('icon')))
 
-    # there's a better way to do this, but I don't feel like trying to make it work in Python
     if refresh != '' and refresh != 'awhile':
-        xbmc.sleep(10000)
-        kodi_utils.refresh()
+        # the script is done, the waiting happens in the background
+        roles = action_queues.get(command, default_action_queues)
+        thread = threading.Thread(target=eh.try_function(ErrorPriority.NORMAL)(refresh_when_done),
+                                  args=(roles, objects))
+        thread.start()
+    else:
+        invalidate(objects)
+
+
+def refresh_when_done(roles, objects=None):
+    """
+    Refresh the list once the server did the work of an action, or when it took too long
+    :param roles: the queues that the action left its work in
+    :param objects: (type, id) pairs of what the action changes, their cached responses go before the refresh
+    """
+    if not wait_for_queues(roles) and xbmc.Monitor().abortRequested():
+        return
+    invalidate(objects)
+    kodi_utils.refresh()
+
+
+def wait_for_queues(roles, timeout=None):
+    """
+    Wait until queues of the server are empty. It's asked after half a second, then less and less often
+    :param roles: the queues, hasher, general or images
+    :param timeout: give up after this many seconds, the server_action_timeout setting (60) if None
+    :return: True if they are empty (or paused), False if it timed out or Kodi is closing
+    """
+    if timeout is None:
+        timeout = get_int_setting('server_action_timeout', 60)
+    monitor = xbmc.Monitor()
+    deadline = time.time() + timeout
+    delay = 0.5
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            eh.spam('Timed out waiting for the queues:', roles)
+            return False
+        if monitor.waitForAbort(min(delay, remaining)):
+            return False
+        if all(is_queue_done(role) for role in roles):
+            return True
+        delay = min(delay * 2, 8)
+
+
+def is_queue_done(role):
+    """
+    Ask the server for the state of a queue, like shoko_models.v2.Queue, but never from the cache
+    :param role: hasher, general or images
+    :return: True if it's empty, or paused so nothing will happen. False if it has work left or the server didn't answer
+    """
+    try:
+        json_node = pyproxy.get_json_tree(server + '/api/queue/%s/get' % role, direct=True)
+    except:
+        eh.exception(ErrorPriority.LOW)
+        return False
+    if json_node is None:
+        return False
+    if int(json_node.get('count', 0)) == 0:
+        return True
+    # isrunning is also False between two commands, so only a queue that was paused won't get to what is left
+    return str(json_node.get('ispause', 'False')) == 'True'
+
+
+def invalidate(objects):
+    """
+    Remove the cached responses that show some objects, or what contains them
+    :param objects: (type, id) pairs, like ('file', 12), or None
+    """
+    if objects is None or len(objects) == 0:
+        return
+    import cache
+    cache.remove_objects(cache.find_related(objects))
 
 
 def rescan_file(object_id):
@@ -73,7 +165,7 @@ def rescan_file(object_id):
     This rescans a file for info from AniDB.
     :param object_id: VideoLocalID
     """
-    perform_server_action('rescan', object_id=object_id)
+    perform_server_action('rescan', object_id=object_id, objects=[('file', object_id)])
 
 
 def rehash_file(object_id):
@@ -81,7 +173,7 @@ def rehash_file(object_id):
     This rehashes and rescans a file
     :param object_id: VideoLocalID
     """
-    perform_server_action('rehash', object_id=object_id)
+    perform_server_action('rehash', object_id=object_id, objects=[('file', object_id)])
 
 
 def folder_list():
@@ -155,27 +247,135 @@ def remove_missing_files():
     perform_server_action('remove_missing_files', refresh='awhile')
 
 
-def get_server_status(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon.getSetting('port')):
+# the listings that count the watched episodes of what they contain, by the kind of object that changed.
+# They all go when the cache never saw what contains the object
+watched_listings = {
+    'ep': ('group', 'filter'),
+    'serie': ('group', 'filter'),
+    'group': ('group', 'filter'),
+}
+# the kinds of objects that change with a series or group. They all go when the cache never saw what it contains
+watched_children = {
+    'serie': ('ep',),
+    'group': ('serie', 'ep'),
+}
+
+
+class WatchedBatch(object):
+    """
+    Watched changes for many episodes, series and groups. send() sends them to the server at the same time,
+    and then removes the cached responses that show them, or what contains them, in one go, so the next listing has
+    the new flags
+        batch = WatchedBatch()
+        batch.add('ep', 12, True, related=[('serie', 3)])
+        batch.add('ep', 13, True, related=[('serie', 3)])
+        batch.send()
+    """
+    def __init__(self):
+        self.changes = OrderedDict()
+
+    def add(self, url_prefix, object_id, watched, related=(), listings=(), sent_with=None):
+        """
+        Queue a change. A later one for the same object replaces it
+        :param url_prefix: the kind of object, 'ep', 'serie' or 'group'
+        :param object_id: its id
+        :param watched: the new status
+        :param related: (url_prefix, id) pairs of objects whose responses show it too, like the series of an episode
+        :param listings: url prefixes of which every response shows it, besides watched_listings
+        :param sent_with: (url_prefix, id) of a queued change that changes this one on the server too, like the
+        series of an episode when the series is marked. It isn't sent itself, and is done when that one is
+        """
+        if sent_with is not None:
+            sent_with = (sent_with[0], int(sent_with[1]))
+        self.changes[(url_prefix, int(object_id))] = (watched, tuple(related), tuple(listings), sent_with)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def send(self):
+        """
+        Send the queued changes and remove what they made stale from the cache
+        :return: the (url_prefix, id) pairs that the server accepted, with the ones that were sent with them
+        :rtype: list
+        """
+        if len(self.changes) == 0:
+            return []
+        changes = list(self.changes.items())
+        self.changes.clear()
+        to_send = [change for change in changes if change[1][3] is None]
+        results = thread_utils.run_in_parallel(send_watched_status, to_send, get_int_setting('watched_threads', 4))
+        accepted = set(obj for (obj, _), result in zip(to_send, results) if result is not None)
+        queued = dict(changes)
+
+        def sent_by(obj):
+            # a series that is sent with its group takes its episodes along
+            seen = set()
+            while obj in queued and queued[obj][3] is not None and obj not in seen:
+                seen.add(obj)
+                obj = queued[obj][3]
+            return obj
+
+        import cache
+        sent = []
+        objects = set()
+        listings = set()
+        # all of them at once, so the responses are looked up and removed in one go
+        for obj, (watched, related, extra_listings, sent_with) in changes:
+            if sent_by(obj) not in accepted:
+                continue
+            sent.append(obj)
+            # what contains it shows its watched count, and what it contains has the same status now
+            found = cache.find_related([obj] + list(related), parents=True, children=obj[0] in watched_children)
+            if not any(object_type == 'filter' for object_type, _ in found):
+                listings.update(watched_listings.get(obj[0], ()))
+            if obj[0] in watched_children and not any(object_type in watched_children[obj[0]]
+                                                      for object_type, _ in found):
+                listings.update(watched_children[obj[0]])
+            objects.update(found)
+            listings.update(extra_listings)
+        if len(objects) > 0 or len(listings) > 0:
+            cache.remove_objects(objects, listings)
+        return sent
+
+
+def send_watched_status(change):
+    """
+    :param change: ((url_prefix, id), (watched, ...)) from WatchedBatch
+    :return: the body of the response, None if it failed
+    """
+    (url_prefix, object_id), (watched, _, _, _) = change
+    url = server + '/api/' + url_prefix + ('/watch' if watched else '/unwatch')
+    url = UrlBuilder(url).set('id', object_id).build()
+    # never from the cache, it has to reach the server every time
+    return pyproxy.get_json(url, direct=True)
+
+
+def get_server_status(ip=plugin_settings.get('ipaddress'), port=plugin_settings.get('port')):
     """
     Try to query server for status, display messages as needed
-    don't bother with caching, this endpoint is really fast
+    It isn't asked again while it answered in the last server_state_max_age seconds (300)
     :return: bool
     """
-    if port is None:
-        port = plugin_addon.getSetting('port')
-    if isinstance(port, basestring):
-        port = pyproxy.safe_int(port)
-        port = port if port != 0 else 8111
+    port = get_port(port)
+    if is_server_known_good(ip, port):
+        return True
 
-    url = 'http://%s:%i/api/init/status' % (ip, port)
     try:
-        # this should throw if there's an error code
-        response = pyproxy.get_json(url, True)
+        response = probe_server(ip, port)
+        if response is None:
+            show_connection_error()
+            return False
+        if response.status == 503:
+            return startup_handle_no_connection(ip, port)
+        if response.status == 404:
+            return startup_handle_404()
+        if response.status >= 400 or response.body is None:
+            show_connection_error()
+            return False
 
-        # we should have a json response now
         # example:
         # {"startup_state":"Complete!","server_started":false,"server_uptime":"04:00:45","first_run":false,"startup_failed":false,"startup_failed_error_message":""}
-        json_tree = json.loads(response)
+        json_tree = response.tree
 
         server_started = json_tree.get('server_started', False)
         startup_failed = json_tree.get('startup_failed', False)
@@ -183,6 +383,7 @@ def get_server_status(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon
 
         # server started successfully
         if server_started:
+            remember_server_state(ip, port)
             return True
 
         # not started successfully
@@ -195,25 +396,35 @@ def get_server_status(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon
         busy = xbmcgui.DialogProgress()
         busy.create(localized(30021), startup_state)
         busy.update(1)
-        # poll every second until the server gives us a response that we want
+        monitor = xbmc.Monitor()
+        delay = 0.25
+        # poll until the server gives us a response that we want, more and more rarely
         while True:
-            xbmc.sleep(1000)
-            response = pyproxy.get_json(url, True)
+            if monitor.waitForAbort(jitter(delay)):
+                was_canceled = True
+                break
+            delay = min(delay * 2, 4)
+            response = probe_server(ip, port)
 
             # this should not happen
-            if response is None or pyproxy.safe_int(response) > 200:
+            if response is None or response.status >= 400 or response.body is None:
                 busy.close()
                 message_box(localized(30022), localized(30023), localized(30033), localized(30034))
                 return False
 
-            json_tree = json.loads(response)
+            json_tree = response.tree
             server_started = json_tree.get('server_started', False)
             if server_started:
                 busy.close()
+                remember_server_state(ip, port)
                 return True
 
             startup_failed = json_tree.get('startup_failed', False)
 
+            if busy.iscanceled():
+                was_canceled = True
+                break
+
             if json_tree.get('startup_state', '') == startup_state:
                 continue
             startup_state = json_tree.get('startup_state', '')
@@ -222,10 +433,6 @@ def get_server_status(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon
             if startup_failed:
                 break
 
-            if busy.iscanceled():
-                was_canceled = True
-                break
-
         busy.close()
 
         if was_canceled:
@@ -236,14 +443,6 @@ def get_server_status(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon
                         localized(30020))
             return False
         return True
-    except python_version_proxy.http_error as httperror:
-        eh.exception(ErrorPriority.NORMAL)
-        if httperror.code == 503:
-            return startup_handle_no_connection(ip, port)
-        if httperror.code == 404:
-            return startup_handle_404()
-        show_connection_error()
-        return False
     except:
         eh.exception(ErrorPriority.HIGHEST)
         return False
@@ -257,22 +456,121 @@ def startup_handle_no_connection(ip=None, port=None):
     # TODO LOCALIZE
     busy.create('Waiting for Server Startup', 'This will retry for a short while')
     busy.update(1)
-    # poll every second until the server gives us a response that we want
-    counter = 0
-    time = 30
-    while not busy.iscanceled() and counter < time:
-        xbmc.sleep(1000)
-        busy.update(int(round(counter * 100.0 / 30)))
+    monitor = xbmc.Monitor()
+    timeout = 30
+    start = time.time()
+    delay = 0.25
+    # poll until the server answers, more and more rarely
+    connected = False
+    while not busy.iscanceled():
+        elapsed = time.time() - start
+        if elapsed >= timeout:
+            break
+        busy.update(int(round(elapsed * 100.0 / timeout)))
         if can_connect(ip, port):
+            connected = True
             break
-        counter += 1
-
-    if counter == time - 1:
-        busy.close()
-        return False
+        if monitor.waitForAbort(min(jitter(delay), timeout - elapsed)):
+            break
+        delay = min(delay * 2, 4)
 
     busy.close()
-    return True
+    return connected
+
+
+def probe_server(ip, port, timeout=None):
+    """
+    Ask the server how its startup goes. Nothing is cached, and the connection is kept for what comes next
+    :param ip: the address of the server
+    :param port: its port
+    :param timeout: in seconds, the probe_timeout setting (2) if None
+    :return: the response of api/init/status, or None if the server couldn't be reached
+    :rtype: python_version_proxy.HttpResponse
+    """
+    if timeout is None:
+        timeout = get_int_setting('probe_timeout', 2)
+    return pyproxy.probe('http://%s:%i/api/init/status' % (ip, get_port(port)), timeout)
+
+
+def jitter(delay):
+    """
+    :return: somewhere between half of the delay and all of it, so clients that started together don't stay in step
+    """
+    return random.uniform(delay / 2.0, delay)
+
+
+def get_port(port):
+    """
+    :param port: the port as a setting gives it, or None for the port setting
+    :return: the port as an int, 8111 if it isn't one
+    """
+    if port is None:
+        port = plugin_settings.get('port')
+    if isinstance(port, basestring):
+        port = pyproxy.safe_int(port)
+        port = port if port != 0 else 8111
+    return port
+
+
+def load_server_state():
+    """
+    :return: what remember_server_state() kept, read from the profile the first time
+    :rtype: dict
+    """
+    with server_state_lock:
+        if len(server_state) == 0 and os.path.exists(server_state_file):
+            try:
+                with open(server_state_file, 'rb') as state_file:
+                    server_state.update(json_utils.loads(state_file.read()))
+            except:
+                eh.exception(ErrorPriority.LOW)
+        return dict(server_state)
+
+
+def remember_server_state(ip, port):
+    """
+    Keep that the server answered that it's started, in memory and in the profile
+    """
+    state = {'ip': ip, 'port': get_port(port), 'time': time.time()}
+    with server_state_lock:
+        server_state.clear()
+        server_state.update(state)
+        try:
+            temp_file = '%s.%i.tmp' % (server_state_file, os.getpid())
+            with open(temp_file, 'wb') as state_file:
+                state_file.write(pyproxy.encode(json_utils.dumps(state)))
+            if os.path.exists(server_state_file):
+                # windows doesn't rename over a file
+                os.remove(server_state_file)
+            os.rename(temp_file, server_state_file)
+        except:
+            eh.exception(ErrorPriority.LOW)
+
+
+def forget_server_state():
+    """
+    Make the next get_server_status() ask the server, like after a connection error
+    """
+    with server_state_lock:
+        server_state.clear()
+        try:
+            if os.path.exists(server_state_file):
+                os.remove(server_state_file)
+        except:
+            eh.exception(ErrorPriority.LOW)
+
+
+def is_server_known_good(ip, port):
+    """
+    :return: True if the server at ip and port answered that it's started in the last server_state_max_age seconds
+    """
+    max_age = get_int_setting('server_state_max_age', 300)
+    if max_age <= 0:
+        return False
+    state = load_server_state()
+    if state.get('ip') != ip or state.get('port') != get_port(port):
+        return False
+    return 0 <= time.time() - state.get('time', 0) < max_age
 
 
 def startup_handle_404():
@@ -284,22 +582,23 @@ def startup_handle_404():
 
 
 def show_connection_error():
+    forget_server_state()
     message_box(localized(30022), localized(30023), localized(30024), localized(30025))
 
 
-def get_version(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon.getSetting('port'), force=False):
+def get_version(ip=plugin_settings.get('ipaddress'), port=plugin_settings.get('port'), force=False):
     legacy = LooseVersion('0.0')
     version = ''
     try:
-        _shoko_version = plugin_addon.getSetting('good_version')
-        _good_ip = plugin_addon.getSetting('good_ip')
+        _shoko_version = plugin_settings.get('good_version')
+        _good_ip = plugin_settings.get('good_ip')
         if not force and _shoko_version != LooseVersion('0.1') and _good_ip == ip:
             return _shoko_version
         json_file = pyproxy.get_json('http://' + str(ip) + ':' + str(port) + '/api/version', direct=True)
         if json_file is None:
             return legacy
         try:
-            data = json.loads(json_file)
+            data = json_utils.loads(json_file)
         except:
             return legacy
 
@@ -308,12 +607,12 @@ def get_version(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon.getSe
                 version = module['version']
                 break
 
-        plugin_addon.setSetting(id='good_ip', value=ip)
+        plugin_settings.set('good_ip', ip)
 
         if version != '':
             try:
                 _shoko_version = LooseVersion(version)
-                plugin_addon.setSetting(id='good_version', value=str(_shoko_version))
+                plugin_settings.set('good_version', str(_shoko_version))
             except:
                 return legacy
             return _shoko_version
@@ -323,22 +622,12 @@ def get_version(ip=plugin_addon.getSetting('ipaddress'), port=plugin_addon.getSe
 
 
 def can_connect(ip=None, port=None):
-    if port is None:
-        port = plugin_addon.getSetting('port')
-    if isinstance(port, basestring):
-        port = pyproxy.safe_int(port)
-        port = port if port != 0 else 8111
-
     if ip is None:
-        ip = plugin_addon.getSetting('ipaddress')
-    try:
-        # this handles the case of errors as well
-        json_file = pyproxy.get_json('http://%s:%i/api/version' % (ip, port), direct=True)
-        if json_file is None:
-            return False
-        return True
-    except Exception as ex:
-        return False
+        ip = plugin_settings.get('ipaddress')
+    # api/version answers while the server is still starting, unlike api/init/status, so this only says it's there.
+    # See get_server_status() for whether it's started
+    response = pyproxy.probe('http://%s:%i/api/version' % (ip, get_port(port)), get_int_setting('probe_timeout', 2))
+    return response is not None and response.status < 400
 
 
 def auth():
@@ -351,18 +640,18 @@ def auth():
     # we will have a log out button, and that wipes the apikey, then we go through the log in steps
 
     # we have an apikey. try to connect
-    if plugin_addon.getSetting('apikey') != '' and can_user_connect():
+    if plugin_settings.get('apikey') != '' and can_user_connect():
         return True
 
     # just in case there's a situation where the wizard isn't working, we can fill it in the settings
-    if plugin_addon.getSetting('login') != '':
-        login = plugin_addon.getSetting('login')
-        password = plugin_addon.getSetting('password')
+    if plugin_settings.get('login') != '':
+        login = plugin_settings.get('login')
+        password = plugin_settings.get('password')
         apikey = get_apikey(login, password)
         if apikey is not None:
-            plugin_addon.setSetting('apikey', apikey)
-            plugin_addon.setSetting(id='login', value='')
-            plugin_addon.setSetting(id='password', value='')
+            plugin_settings.set('apikey', apikey)
+            plugin_settings.set('login', '')
+            plugin_settings.set('password', '')
             return can_user_connect()
     # we tried the apikey, and login failed, too
     return False
@@ -370,10 +659,10 @@ def auth():
 
 def get_apikey(login, password):
     try:
-        creds = (login, password, plugin_addon.getSetting('device'))
+        creds = (login, password, plugin_settings.get('device'))
         body = '{"user":"%s","pass":"%s","device":"%s"}' % creds
         post_body = pyproxy.post_data(server + '/api/auth', body)
-        auth_body = json.loads(post_body)
+        auth_body = json_utils.loads(post_body)
         if 'apikey' in auth_body:
             apikey_found_in_auth = str(auth_body['apikey'])
             return apikey_found_in_auth
@@ -413,7 +702,7 @@ def can_user_connect():
         # because we always check for connection first, we can assume that auth is the only problem
         # we need to log in
         eh.exception(ErrorPriority.NORMAL)
-        plugin_addon.setSetting('apikey', '')
+        plugin_settings.set('apikey', '')
         return False
 
 
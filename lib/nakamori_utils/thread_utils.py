@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import error_handler as eh
+from error_handler import ErrorPriority
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+
+def run_in_parallel(func, items, max_workers=4):
+    """
+    Call func for each item on at most max_workers threads, and wait for all of them to finish.
+    Exceptions are logged, and the result for that item is None
+    :param func: function that takes one item
+    :param items: the items
+    :param max_workers: the maximum number of threads
+    :return: the results, in the same order as the items
+    :rtype: list
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if len(items) == 0:
+        return results
+
+    if max_workers < 2 or len(items) == 1:
+        for index, item in enumerate(items):
+            results[index] = _call_logged(func, item)
+        return results
+
+    work = Queue()
+    for index, item in enumerate(items):
+        work.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except Empty:
+                return
+            results[index] = _call_logged(func, item)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(max_workers, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _call_logged(func, item):
+    try:
+        return func(item)
+    except:
+        eh.exception(ErrorPriority.NORMAL)
+        return None
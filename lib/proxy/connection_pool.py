@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+import zlib
+from collections import defaultdict
+from io import BytesIO
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import urlparse, urljoin
+    from urllib.error import HTTPError
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urlparse import urlparse, urljoin
+    from urllib2 import HTTPError
+
+
+class ResponseTooLarge(Exception):
+    def __init__(self, url, max_size):
+        Exception.__init__(self, 'The response from %s is bigger than %i bytes' % (url, max_size))
+        self.url = url
+        self.max_size = max_size
+
+
+class PooledResponse(object):
+    """
+    A small wrapper around an HTTPResponse that looks enough like the result of urlopen() for our needs.
+    The connection is given back to the pool once the body was read completely, or dropped if it was not.
+    """
+    def __init__(self, pool, key, connection, response, url):
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+
+    def info(self):
+        return self._response.msg
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=None):
+        if self._connection is None:
+            return b''
+        if amt is None:
+            data = self._response.read()
+            self.close()
+            return data
+        data = self._response.read(amt)
+        if not data:
+            self.close()
+        return data
+
+    def iter_decoded(self, chunk_size=65536, max_size=0):
+        """
+        Read the body in chunks, decompressing gzip and deflate as it goes, so the compressed and the decompressed
+        body don't both have to be in memory. Stopping early drops the connection instead of reusing it
+        :param chunk_size: how much to read from the socket at a time
+        :param max_size: raise ResponseTooLarge if the decompressed body gets bigger than this. 0 for no limit
+        :return: generator of bytes
+        """
+        encoding = (self.info().get('Content-Encoding') or '').strip().lower()
+        decompressor = None
+        if encoding == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            decompressor = zlib.decompressobj()
+
+        size = 0
+        try:
+            while True:
+                data = self.read(chunk_size)
+                if not data:
+                    break
+                if decompressor is not None:
+                    try:
+                        data = decompressor.decompress(data)
+                    except zlib.error:
+                        if encoding != 'deflate' or size > 0:
+                            raise
+                        # some servers send raw deflate without the zlib header
+                        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                        data = decompressor.decompress(data)
+                size += len(data)
+                if 0 < max_size < size:
+                    raise ResponseTooLarge(self.url, max_size)
+                if data:
+                    yield data
+            if decompressor is not None:
+                data = decompressor.flush()
+                if data:
+                    yield data
+        finally:
+            self.close()
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection = self._connection
+        self._connection = None
+        # a response is only reusable if the server didn't ask to close, and we read everything it sent
+        reusable = not self._response.will_close and self._response.isclosed()
+        self._response.close()
+        self._pool.release(self._key, connection, reusable)
+
+
+class ConnectionPool(object):
+    """
+    Keeps HTTP connections to a host alive between requests, so a listing that fans out into many requests
+    only pays for the TCP handshake once per worker instead of once per request
+    """
+    redirect_codes = (301, 302, 303, 307, 308)
+    # the ones that can be sent again when it's not known if the server got them
+    idempotent_methods = ('GET', 'HEAD')
+
+    def __init__(self, max_per_host=4, idle_timeout=30):
+        """
+        :param max_per_host: how many connections to a single host can be open at the same time
+        :param idle_timeout: how long (in seconds) an unused connection is kept before it is closed
+        """
+        self.max_per_host = max(1, max_per_host)
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)
+        self._slots = {}
+        self._stats = {'requests': 0, 'new': 0, 'reused': 0, 'evicted': 0, 'discarded': 0}
+
+    def get_stats(self):
+        """
+        :return: counters for requests made, connections opened, reused, evicted for being idle and dropped on error
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _get_slot(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_host)
+                self._slots[key] = slot
+            return slot
+
+    def _evict_idle(self, now):
+        # needs to be called with the lock held
+        for key in list(self._idle.keys()):
+            alive = []
+            for connection, last_used in self._idle[key]:
+                if now - last_used > self.idle_timeout:
+                    connection.close()
+                    self._stats['evicted'] += 1
+                else:
+                    alive.append((connection, last_used))
+            if len(alive) > 0:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+
+    def _get_connection(self, key, timeout):
+        with self._lock:
+            self._evict_idle(time.time())
+            idle = self._idle.get(key)
+            if idle:
+                connection = idle.pop()[0]
+                self._stats['reused'] += 1
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+            self._stats['new'] += 1
+
+        scheme, host, port = key
+        if scheme == 'https':
+            return HTTPSConnection(host, port, timeout=timeout), False
+        return HTTPConnection(host, port, timeout=timeout), False
+
+    def release(self, key, connection, reusable):
+        """
+        Give a connection back to the pool. This is called by PooledResponse, so there's rarely a need to call it
+        :param key: (scheme, host, port)
+        :param connection: the connection
+        :param reusable: whether it can be used for another request
+        """
+        with self._lock:
+            if reusable:
+                self._idle[key].append((connection, time.time()))
+            else:
+                connection.close()
+        self._get_slot(key).release()
+
+    def close_all(self):
+        with self._lock:
+            for key in self._idle:
+                for connection, last_used in self._idle[key]:
+                    connection.close()
+            self._idle.clear()
+
+    def request(self, method, url, body=None, headers=None, timeout=None, redirects=5):
+        """
+        Send a request using a pooled connection
+        :param method: GET, POST, HEAD...
+        :param url: the full url
+        :param body: the body to send, already encoded
+        :param headers: a dict of headers
+        :param timeout: socket timeout in seconds
+        :param redirects: how many redirects to follow
+        :return: the response. Read it to the end or close it, so that the connection is given back
+        :rtype: PooledResponse
+        """
+        if headers is None:
+            headers = {}
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower() or 'http'
+        port = parsed.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parsed.hostname, port)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        self._count('requests')
+        slot = self._get_slot(key)
+        slot.acquire()
+        try:
+            response, connection = self._send(key, method, path, body, headers, timeout)
+        except:
+            slot.release()
+            raise
+        pooled = PooledResponse(self, key, connection, response, url)
+
+        if pooled.status in self.redirect_codes and redirects > 0:
+            location = pooled.info().get('Location')
+            if location:
+                pooled.read()
+                if pooled.status == 303:
+                    method, body = 'GET', None
+                return self.request(method, urljoin(url, location), body, headers, timeout, redirects - 1)
+
+        if pooled.status >= 400:
+            data = pooled.read()
+            raise HTTPError(url, pooled.status, pooled.reason, pooled.info(), BytesIO(data))
+        return pooled
+
+    def _send(self, key, method, path, body, headers, timeout):
+        while True:
+            connection, reused = self._get_connection(key, timeout)
+            sent = False
+            try:
+                connection.request(method, path, body, headers)
+                sent = True
+                return connection.getresponse(), connection
+            except (socket.error, HTTPException) as ex:
+                connection.close()
+                self._count('discarded')
+                # the server may have dropped a keep-alive connection while it sat in the pool, so try a fresh one
+                # a timeout means that the server is slow, and trying again would only double the wait
+                if not reused or isinstance(ex, socket.timeout):
+                    raise
+                # once it was sent, the server may have done it already, so a POST isn't sent twice
+                if sent and method.upper() not in self.idempotent_methods:
+                    raise
@@ -1,12 +1,12 @@
 from distutils.version import LooseVersion
 
 import xbmc
-from nakamori_utils.globalvars import plugin_addon
+from nakamori_utils.globalvars import plugin_settings
 
 
 class Kodi16Proxy:
     def __init__(self):
-        plugin_addon.setSetting('kodi18', 'false')
+        plugin_settings.set('kodi18', 'false')
 
     def user_agent(self):
         """
@@ -48,7 +48,7 @@ class Kodi16Proxy:
         :return: true or false
         :rtype: bool
         """
-        return plugin_addon.getSetting('external_player').lower() == 'true'
+        return plugin_settings.get('external_player').lower() == 'true'
 
     def parse_tags(self, tag_obj_string):
         """
@@ -71,7 +71,7 @@ class Kodi17Proxy(Kodi16Proxy):
 class Kodi18Proxy(Kodi17Proxy):
     def __init__(self):
         Kodi17Proxy.__init__(self)
-        plugin_addon.setSetting('kodi18', 'true')
+        plugin_settings.set('kodi18', 'true')
 
     def external_player(self, player_obj):
         return player_obj.isExternalPlayer()
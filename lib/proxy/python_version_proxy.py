@@ -1,32 +1,185 @@
-import gzip
-import json
+import atexit
 import sys
+import threading
 import time
-from io import BytesIO
 from abc import abstractmethod
 
-from nakamori_utils.globalvars import plugin_addon
+from nakamori_utils.globalvars import plugin_settings, get_int_setting
+from nakamori_utils import json_utils
+from proxy.connection_pool import ConnectionPool
+from proxy.single_flight import SingleFlight, normalize_url
 
 from socket import timeout
 import xbmc
 
 try:
     from urllib.parse import urlparse, quote, unquote_plus, quote_plus, urlencode
-    from urllib.request import urlopen, Request
+    from urllib.request import Request
     from urllib.error import HTTPError
 except ImportError:
     from urllib import quote, unquote_plus, quote_plus, urlencode
     from urlparse import urlparse
-    from urllib2 import urlopen, Request, HTTPError, URLError
+    from urllib2 import Request, HTTPError, URLError
+
+
+# one pool for everything we send to Shoko and Eigakan, so keep-alive connections are shared between them
+connection_pool = ConnectionPool(get_int_setting('http_max_connections', 4),
+                                 get_int_setting('http_idle_timeout', 30))
+atexit.register(connection_pool.close_all)
+
+# urls that are being refreshed in the background, so a url is only refreshed once at a time
+refreshing_urls = set()
+refreshing_lock = threading.Lock()
+
+# identical get_json calls that run at the same time, or a few seconds apart, share one request and one parse
+single_flight = SingleFlight()
+
+# urls that are being streamed by get_json_stream, with the thread that reads it and an event that is set once the
+# stream is done. A second stream of one on another thread waits for it, and then reads what it left in the cache
+streaming_urls = {}
+streaming_lock = threading.Lock()
+
+
+class UrlBuilder(object):
+    """
+    Builds a query string without splitting and joining the url for every parameter.
+    url = UrlBuilder(server + '/api/serie').set('id', 5).set('level', 2).build()
+    """
+    def __init__(self, url):
+        """
+        :param url: a url, which can already have a query string
+        """
+        # [name, value] in order. There are only a few, so a list is quicker than any mapping
+        self.parameters = []
+        self._url = None
+        if '?' not in url:
+            self.base = url
+            return
+        self.base, query = url.split('?', 1)
+        for pair in query.split('&'):
+            if pair != '':
+                name, _, value = pair.partition('=')
+                self.parameters.append([name, value])
+
+    def set(self, parameter, value):
+        """
+        Set a parameter, keeping its place if it's already there
+        :param parameter: what to set
+        :param value: what to set it to, None or '' removes it. Do not urlencode it
+        :return: self, so calls can be chained
+        :rtype: UrlBuilder
+        """
+        self._url = None
+        if value is None or value == '':
+            self.parameters = [pair for pair in self.parameters if pair[0] != parameter]
+            return self
+        if isinstance(value, int):
+            # most of them are ids and levels, which have nothing to quote
+            value = str(value)
+        else:
+            value = quote_plus(python_proxy.encode(str(value)))
+        for pair in self.parameters:
+            if pair[0] == parameter:
+                pair[1] = value
+                return self
+        self.parameters.append([parameter, value])
+        return self
+
+    def build(self):
+        """
+        :return: the url
+        :rtype: str
+        """
+        if self._url is None:
+            if len(self.parameters) == 0:
+                self._url = self.base
+            else:
+                self._url = self.base + '?' + '&'.join([pair[0] + '=' + pair[1] for pair in self.parameters])
+        return self._url
+
+    def __str__(self):
+        return self.build()
+
+
+class HttpResponse(object):
+    _unparsed = object()
+
+    def __init__(self, status, headers, body):
+        """
+        :param status: the HTTP status code
+        :param headers: the response headers, as given by the connection
+        :param body: the body, already decompressed. None for a 304
+        """
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self._tree = HttpResponse._unparsed
+
+    @property
+    def tree(self):
+        """
+        The parsed body. It's parsed the first time it's needed, and then shared by everything that looks at it
+        """
+        if self._tree is HttpResponse._unparsed:
+            self._tree = json_utils.loads(self.body) if self.body is not None else None
+        return self._tree
+
+    def get_validators(self):
+        """
+        :return: (ETag, Last-Modified), to ask the server later if the response changed
+        """
+        return self.headers.get('ETag'), self.headers.get('Last-Modified')
+
+
+def _prepend(first, chunks):
+    """
+    :return: generator of first and then chunks. Closing it closes chunks
+    """
+    try:
+        if first:
+            yield first
+        for chunk in chunks:
+            yield chunk
+    finally:
+        chunks.close()
 
 
 class BasePythonProxy:
     def __init__(self):
         self.api_key = ''
 
+    def get_connection_stats(self):
+        """
+        Counters of the shared connection pool, mainly to see how often keep-alive connections are reused
+        :return: dict with requests, new, reused, evicted and discarded counts
+        """
+        return connection_pool.get_stats()
+
+    def get_request_stats(self):
+        """
+        Counters of get_json calls that were sent, waited for an identical call, or used the result of a recent one
+        :return: dict with calls, coalesced and remembered counts
+        """
+        return single_flight.get_stats()
+
+    def forget_request(self, url=None):
+        """
+        Make the next get_json for a url ask the cache or server again, instead of reusing a recent result
+        :param url: the url, or None for all of them
+        """
+        single_flight.forget(normalize_url(url) if url is not None else None)
+
     def set_temporary_apikey(self, apikey):
         self.api_key = apikey
 
+    def get_apikey(self):
+        """
+        :return: the temporary apikey if one is set, else the one from the settings
+        """
+        if self.api_key is None or self.api_key == '':
+            return plugin_settings.get('apikey')
+        return self.api_key
+
     @abstractmethod
     def encode(self, value):
         """
@@ -46,57 +199,122 @@ class BasePythonProxy:
         pass
 
     def get_data(self, url, referer, timeout, apikey):
-        try:
-            import error_handler as eh
-            headers = {
-                'Accept': 'application/json',
-                'apikey': apikey,
-            }
+        response = self.get_response(url, referer, timeout, apikey)
+        if response is None:
+            return None
+        return response.body
 
-            if referer is not None:
-                referer = quote(self.encode(referer)).replace('%3A', ':')
-                if len(referer) > 1:
-                    headers['Referer'] = referer
+    def _open(self, url, referer, timeout, apikey, extra_headers=None):
+        import error_handler as eh
+        headers = {
+            'Accept': 'application/json',
+            'apikey': apikey,
+        }
 
-            if '127.0.0.1' not in url and 'localhost' not in url:
-                headers['Accept-Encoding'] = 'gzip'
-            if '/Stream/' in url:
-                headers['api-version'] = '1.0'
+        if referer is not None:
+            referer = quote(self.encode(referer)).replace('%3A', ':')
+            if len(referer) > 1:
+                headers['Referer'] = referer
 
-            # self.encode(url) # py3 fix
-            req = Request(url, headers=headers)
-            data = None
-
-            eh.spam('Getting Data ---')
-            eh.spam('URL: ', url)
-            eh.spam('Headers:', headers)
-            response = urlopen(req, timeout=int(timeout))
-
-            if response.info().get('Content-Encoding') == 'gzip':
-                eh.spam('Got gzipped response. Decompressing')
-                try:
-                    buf = BytesIO(response.read())
-                    f = gzip.GzipFile(fileobj=buf)
-                    data = f.read()
-                except Exception as e:
-                    eh.spam('Failed to decompress.', e.message)
-            else:
-                data = response.read()
-            response.close()
+        if '127.0.0.1' not in url and 'localhost' not in url:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+        if '/Stream/' in url:
+            headers['api-version'] = '1.0'
+        if extra_headers is not None:
+            headers.update(extra_headers)
+
+        eh.spam('Getting Data ---')
+        eh.spam('URL: ', url)
+        eh.spam('Headers:', headers)
+        # self.encode(url) # py3 fix
+        req = Request(url, headers=headers)
+        return req, connection_pool.request('GET', url, headers=headers, timeout=float(timeout))
+
+    def get_response(self, url, referer, timeout, apikey, extra_headers=None):
+        """
+        GET a url
+        :param url: the url
+        :param referer: the Referer header, if any
+        :param timeout: socket timeout in seconds
+        :param apikey: the apikey header
+        :param extra_headers: more headers to send, like If-None-Match
+        :return: the response, or None if the request failed
+        :rtype: HttpResponse
+        """
+        try:
+            import error_handler as eh
+            req, response = self._open(url, referer, timeout, apikey, extra_headers)
+            data = b''.join(response.iter_decoded(max_size=get_int_setting('max_response_size', 0) * 1024 * 1024))
 
             eh.spam('Response Body:', data)
+            if response.status == 304:
+                return HttpResponse(response.status, response.info(), None)
             eh.spam('Checking Response for a text error.\n')
 
-            if data is not None and data != '':
-                self.parse_possible_error(req, data)
-
-            return data
+            result = HttpResponse(response.status, response.info(), data)
+            self.check_response(req, result)
+            return result
         except Exception as ex:
             xbmc.log(' === get_data error === %s' % ex, xbmc.LOGNOTICE)
+            return None
+
+    def get_binary(self, url, timeout, apikey):
+        """
+        GET a file, like an image. Unlike get_data, json isn't asked for, and the body isn't checked for an error
+        or logged
+        :param url: the url
+        :param timeout: socket timeout in seconds
+        :param apikey: the apikey header
+        :return: the body as bytes, or None if the request failed
+        """
+        headers = {
+            'Accept': '*/*',
+            'apikey': apikey,
+        }
+        try:
+            response = connection_pool.request('GET', url, headers=headers, timeout=float(timeout))
+            return b''.join(response.iter_decoded(max_size=get_int_setting('max_response_size', 0) * 1024 * 1024))
+        except Exception as ex:
+            xbmc.log(' === get_binary error === %s' % ex, xbmc.LOGNOTICE)
+            return None
+
+    def probe(self, url, timeout):
+        """
+        GET a url, for things like the state of the server. Unlike get_response, an error status is given back
+        instead of logged, and nothing is checked or parsed
+        :param url: the url
+        :param timeout: socket timeout in seconds, it can be a fraction
+        :return: the response, with no body for an error status, or None if the server couldn't be reached
+        :rtype: HttpResponse
+        """
+        try:
+            req, response = self._open(url, None, timeout, self.get_apikey())
+            return HttpResponse(response.status, response.info(), b''.join(response.iter_decoded()))
+        except HTTPError as err:
+            return HttpResponse(err.code, err.info(), None)
+        except Exception as ex:
+            xbmc.log(' === probe error === %s' % ex, xbmc.LOGNOTICE)
+            return None
+
+    def get_chunks(self, url, timeout=None, apikey=None):
+        """
+        GET a url and read the decompressed body a piece at a time, to hand it to something like a streaming parser.
+        Unlike get_data, errors are raised
+        :param url: the url
+        :param timeout: socket timeout in seconds, the timeout setting if not given
+        :param apikey: the apikey header, the current one if not given
+        :return: generator of bytes
+        """
+        if timeout is None:
+            timeout = plugin_settings.get('timeout')
+        if apikey is None:
+            apikey = self.get_apikey()
+        req, response = self._open(url, None, timeout, apikey)
+        return response.iter_decoded(max_size=get_int_setting('max_response_size', 0) * 1024 * 1024)
 
     def head(self, url_in):
         try:
-            urlopen(url_in)
+            connection_pool.request('GET', url_in).read()
             return True
         except HTTPError:
             # error('HTTPError', e.code)
@@ -114,38 +332,9 @@ class BasePythonProxy:
         :return: the url
         :rtype: basestring
         """
-        if value is None or value == '':
-            if '?' not in url:
-                return url
-            array1 = url.split('?')
-            if (parameter + '=') not in array1[1]:
-                return url
-            url = array1[0] + '?'
-            array2 = array1[1].split('&')
-            for key in array2:
-                array3 = key.split('=')
-                if array3[0] == parameter:
-                    continue
-                url += array3[0] + '=' + array3[1] + '&'
-            return url[:-1]
-        value = quote_plus(self.encode(str(value)))
-        if '?' not in url:
-            return url + '?' + parameter + '=' + value
-
-        array1 = url.split('?')
-        if (parameter + '=') not in array1[1]:
-            return url + '&' + parameter + '=' + value
+        return UrlBuilder(url).set(parameter, value).build()
 
-        url = array1[0] + '?'
-        array2 = array1[1].split('&')
-        for key in array2:
-            array3 = key.split('=')
-            if array3[0] == parameter:
-                array3[1] = value
-            url += array3[0] + '=' + array3[1] + '&'
-        return url[:-1]
-
-    def post_json(self, url_in, body, custom_timeout=int(plugin_addon.getSetting('timeout'))):
+    def post_json(self, url_in, body, custom_timeout=int(plugin_settings.get('timeout'))):
         """
         Push data to server using 'POST' method
         :param url_in:
@@ -159,7 +348,7 @@ class BasePythonProxy:
         else:
             return None
 
-    def post_data(self, url, data_in, custom_timeout=int(plugin_addon.getSetting('timeout'))):
+    def post_data(self, url, data_in, custom_timeout=int(plugin_settings.get('timeout'))):
         """
         Send a message to the server and wait for a response
         Args:
@@ -179,7 +368,7 @@ class BasePythonProxy:
             'Accept': 'application/json',
         }
 
-        apikey = plugin_addon.getSetting('apikey')
+        apikey = plugin_settings.get('apikey')
         if apikey is not None and apikey != '':
             headers['apikey'] = apikey
 
@@ -193,7 +382,7 @@ class BasePythonProxy:
             req = Request(url, self.encode(data_in), headers)
             data_out = None
 
-            response = urlopen(req, timeout=custom_timeout)
+            response = connection_pool.request('POST', url, req.data, headers, timeout=custom_timeout)
             data_out = response.read()
             response.close()
             eh.spam('Response Body:', data_out)
@@ -204,7 +393,7 @@ class BasePythonProxy:
             # if using very short time out to not wait for response it will throw time out err,
             # but we check if that was intended by checking custom_timeout
             # if it wasn't intended we handle it the old way
-            if custom_timeout == int(plugin_addon.getSetting('timeout')):
+            if custom_timeout == int(plugin_settings.get('timeout')):
                 eh.exception(ErrorPriority.HIGH)
         except http_error as err:
             raise err
@@ -257,40 +446,75 @@ class BasePythonProxy:
         :param cache_time: ignore setting to set custom cache expiration time, mainly to expire data quicker to refresh watch flags
         :return:
         """
+        return self._get_json_shared(url_in, direct, force_cache, cache_time, False)
+
+    def get_json_tree(self, url_in, direct=False, force_cache=False, cache_time=0):
+        """
+        Same as get_json, but returns the parsed json. A response that comes from the cache is decoded only once
+        while it's among the last few that were read, so don't modify what this returns
+        :param url_in:
+        :param direct: force to bypass cache
+        :param force_cache: force to use cache even if disabled
+        :param cache_time: ignore setting to set custom cache expiration time
+        :return: the parsed json, or None
+        """
+        return self._get_json_shared(url_in, direct, force_cache, cache_time, True)
+
+    def _get_json_shared(self, url_in, direct, force_cache, cache_time, parse):
+        key = (normalize_url(url_in), parse, self.get_apikey())
+        # a direct request wants what the server has now, so it only joins a request that is already running
+        remember = not direct or force_cache
+        return single_flight.do(key, lambda: self._get_json(url_in, direct, force_cache, cache_time, parse), remember)
 
+    def _get_json(self, url_in, direct, force_cache, cache_time, parse):
         import error_handler as eh
         from error_handler import ErrorPriority
         try:
-            timeout = plugin_addon.getSetting('timeout')
-            if self.api_key is None or self.api_key == '':
-                apikey = plugin_addon.getSetting('apikey')
-            else:
-                apikey = self.api_key
+            timeout = plugin_settings.get('timeout')
+            apikey = self.get_apikey()
             # if cache is disabled, overwrite argument and force it to direct
-            if plugin_addon.getSetting('enableCache') != 'true':
+            if not plugin_settings.get_bool('enableCache'):
                 direct = True
+            response = None
             if direct and not force_cache:
-                body = self.get_data(url_in, None, timeout, apikey)
+                response = self.get_response(url_in, None, timeout, apikey)
             else:
                 import cache
                 eh.spam('Getting a Cached Response ---')
                 eh.spam('URL:', url_in)
-                db_row = cache.get_data_from_cache(url_in)
+                db_row = cache.get_body_from_cache(url_in, parsed=parse, apikey=apikey)
+                valid_until = cache_time if cache_time > 0 else int(plugin_settings.get('expireCache'))
                 if db_row is not None:
-                    valid_until = cache_time if cache_time > 0 else int(plugin_addon.getSetting('expireCache'))
                     expire_second = time.time() - float(db_row[1])
+                    stale_window = get_int_setting('stale_while_revalidate', 0)
+                    if valid_until < expire_second <= valid_until + stale_window:
+                        # slightly stale, show it now and have it fresh for next time
+                        eh.spam('The cached data is stale, refreshing it in the background.')
+                        cache.count_stat('stale')
+                        self._start_refresh(url_in, timeout, apikey, valid_until)
+                        return db_row[0] if parse else self.decode(db_row[0])
                     if expire_second > valid_until:
-                        # expire, get new date
+                        # expire, ask the server if it changed, and get new data if it did
                         eh.spam('The cached data is stale.')
-                        body = self.get_data(url_in, None, timeout, apikey)
-                        cache.remove_cache(url_in)
-                        cache.add_cache(url_in, body)
+                        response = self._revalidate(cache, url_in, timeout, apikey, valid_until)
+                        if response is not None and response.status == 304:
+                            if cache.refresh_cache(url_in, valid_until, apikey) is not None:
+                                eh.spam('The cached data did not change.')
+                                cache.count_stat('revalidated')
+                                return db_row[0] if parse else self.decode(db_row[0])
+                            # it was removed in the meantime, and a 304 has no body
+                            response = self._get_and_cache(cache, url_in, timeout, apikey, valid_until, parse)
+                        cache.count_stat('miss')
                     else:
-                        body = db_row[0]
+                        cache.count_stat('hit')
+                        return db_row[0] if parse else self.decode(db_row[0])
                 else:
                     eh.spam('No cached data was found for the URL.')
-                    body = self.get_data(url_in, None, timeout, apikey)
-                    cache.add_cache(url_in, body)
+                    cache.count_stat('miss')
+                    response = self._get_and_cache(cache, url_in, timeout, apikey, valid_until, parse)
+            body = response.body if response is not None else None
+            if parse:
+                return response.tree if body is not None else None
         except http_error as err:
             raise err
         except Exception as ex:
@@ -299,6 +523,174 @@ class BasePythonProxy:
             body = None
         return body
 
+    def get_json_stream(self, url_in, array_keys, force_cache=False, cache_time=0):
+        """
+        Like get_json_tree, but the json is parsed while it's read, and the arrays in array_keys give their elements
+        one at a time. The response is cached once it was read to the end.
+        A get_json_tree of the same url that is running or was just done is given instead, and a stream of the same
+        url that is being read is waited for, so it's read from the cache
+        :param url_in:
+        :param array_keys: the names of the top level arrays to stream, like ('groups',)
+        :param force_cache: force to use cache even if disabled
+        :param cache_time: ignore setting to set custom cache expiration time
+        :return: a dict-like StreamedNode (or the parsed json), or None if the request failed
+        :rtype: StreamedNode
+        """
+        import error_handler as eh
+        from error_handler import ErrorPriority
+        apikey = self.get_apikey()
+        key = (normalize_url(url_in), True, apikey)
+        tree = single_flight.join(key)
+        if tree is not None:
+            return tree
+
+        use_cache = plugin_settings.get_bool('enableCache') or force_cache
+        owner = False
+        stream = event = None
+        if use_cache:
+            with streaming_lock:
+                stream = streaming_urls.get(key)
+                if stream is None:
+                    stream = (threading.current_thread(), threading.Event())
+                    streaming_urls[key] = stream
+                    owner = True
+            event = stream[1]
+            # the thread that reads it would wait for itself
+            if not owner and stream[0] is not threading.current_thread():
+                event.wait(float(plugin_settings.get('timeout')))
+
+        def done():
+            if owner:
+                with streaming_lock:
+                    if streaming_urls.get(key) is stream:
+                        del streaming_urls[key]
+                event.set()
+
+        try:
+            node = self._get_json_stream(url_in, array_keys, use_cache, cache_time, apikey, done)
+        except Exception as ex:
+            xbmc.log(' ========= ERROR JSON STREAM ============  %s' % ex, xbmc.LOGNOTICE)
+            eh.exception(ErrorPriority.HIGH)
+            node = None
+        if node is None:
+            done()
+        return node
+
+    def _get_json_stream(self, url_in, array_keys, use_cache, cache_time, apikey, on_close):
+        import cache
+        from nakamori_utils.json_stream import StreamedNode
+        timeout = plugin_settings.get('timeout')
+        if not use_cache:
+            req, response = self._open(url_in, None, timeout, apikey)
+            return StreamedNode(self._checked_chunks(req, response), array_keys, on_close)
+
+        valid_until = cache_time if cache_time > 0 else get_int_setting('expireCache', 0)
+        chunks = cache.iter_body_from_cache(url_in, valid_until, apikey)
+        if chunks is not None:
+            cache.count_stat('hit')
+            return StreamedNode(chunks, array_keys, on_close)
+
+        req, response = self._open(url_in, None, timeout, apikey, self._conditional_headers(cache, url_in, apikey))
+        if response.status == 304:
+            response.read()
+            if cache.refresh_cache(url_in, valid_until, apikey) is not None:
+                chunks = cache.iter_body_from_cache(url_in, valid_until, apikey)
+                if chunks is not None:
+                    cache.count_stat('revalidated')
+                    return StreamedNode(chunks, array_keys, on_close)
+            # it was removed in the meantime
+            req, response = self._open(url_in, None, timeout, apikey)
+        cache.count_stat('miss')
+        etag, last_modified = response.info().get('ETag'), response.info().get('Last-Modified')
+        # checked before it's cached, so an error isn't
+        chunks = cache.caching_chunks(url_in, self._checked_chunks(req, response), valid_until, etag, last_modified,
+                                      apikey)
+        return StreamedNode(chunks, array_keys, on_close)
+
+    def _checked_chunks(self, req, response):
+        """
+        Read the first chunk of a body, and check it like check_response(), as Shoko answers some errors with a 200
+        and a StatusCode in the body. Errors are small, so the whole body is read to check one
+        :return: generator of the chunks, the first one included
+        :raises HTTPError: for an error
+        """
+        chunks = response.iter_decoded(max_size=get_int_setting('max_response_size', 0) * 1024 * 1024)
+        try:
+            first = next(chunks, b'')
+            if self.encode('StatusCode') in first:
+                first += b''.join(chunks)
+                self.check_response(req, HttpResponse(response.status, response.info(), first))
+        except:
+            chunks.close()
+            raise
+        return _prepend(first, chunks)
+
+    def _start_refresh(self, url_in, timeout, apikey, ttl):
+        """
+        Revalidate a cached url on a background thread, unless that is already happening
+        """
+        with refreshing_lock:
+            if url_in in refreshing_urls:
+                return
+            refreshing_urls.add(url_in)
+        thread = threading.Thread(target=self._refresh, args=(url_in, timeout, apikey, ttl))
+        # the stale copy was already served, so the invocation doesn't wait for this. If it is cut off, the next one
+        # finds the row still stale and revalidates again
+        thread.daemon = True
+        thread.start()
+
+    def _refresh(self, url_in, timeout, apikey, ttl):
+        import cache
+        import error_handler as eh
+        from error_handler import ErrorPriority
+        try:
+            response = self._revalidate(cache, url_in, timeout, apikey, ttl)
+            if response is not None and response.status == 304:
+                cache.refresh_cache(url_in, ttl, apikey)
+        except:
+            eh.exception(ErrorPriority.NORMAL)
+        finally:
+            with refreshing_lock:
+                refreshing_urls.discard(url_in)
+
+    def _conditional_headers(self, cache, url_in, apikey):
+        """
+        :return: the headers that ask the server if a cached response changed
+        """
+        etag, last_modified = cache.get_validators(url_in, apikey)
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def _get_and_cache(self, cache, url_in, timeout, apikey, ttl, parse):
+        """
+        Get a url from the server, without asking it if the cached one changed, and cache the answer
+        :return: the response, or None if the request failed
+        :rtype: HttpResponse
+        """
+        response = self.get_response(url_in, None, timeout, apikey)
+        if response is not None:
+            etag, last_modified = response.get_validators()
+            # the tree that was parsed here is what the next read from the cache gives
+            cache.add_cache(url_in, response.body, ttl, etag, last_modified, apikey,
+                            tree=response.tree if parse else None)
+        return response
+
+    def _revalidate(self, cache, url_in, timeout, apikey, ttl):
+        """
+        Send a conditional request for a cached url, and cache the new body if it changed
+        :return: the response, with status 304 if it didn't change, or None if the request failed
+        :rtype: HttpResponse
+        """
+        response = self.get_response(url_in, None, timeout, apikey, self._conditional_headers(cache, url_in, apikey))
+        if response is not None and response.status != 304:
+            etag, last_modified = response.get_validators()
+            cache.add_cache(url_in, response.body, ttl, etag, last_modified, apikey)
+        return response
+
     def parse_possible_error(self, request, data):
         """
 
@@ -308,7 +700,24 @@ class BasePythonProxy:
         :type data: srt
         :return:
         """
-        stream = json.loads(data)
+        self.check_response(request, HttpResponse(None, None, data))
+
+    def check_response(self, request, response):
+        """
+        Raise an HTTPError if the server answered with an error. The status code tells, but Shoko can also answer 200
+        with a StatusCode in the body. The body is only parsed if it has one, and then the tree is kept in the response
+        :param request:
+        :type request: Request
+        :param response:
+        :type response: HttpResponse
+        """
+        if response.status is not None and response.status >= 400:
+            raise HTTPError(request.get_full_url(), response.status, 'HTTP Error %s' % response.status,
+                            request.headers, None)
+        data = response.body
+        if data is None or len(data) == 0 or self.encode('StatusCode') not in self.encode(data):
+            return
+        stream = response.tree
         if 'StatusCode' in stream:
             code = stream.get('StatusCode')
             if code != '200':
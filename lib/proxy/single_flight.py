@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+except ImportError:
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import urlencode
+
+
+def normalize_url(url):
+    """
+    Make urls that ask for the same thing equal: lowercase scheme and host, no default port, sorted query
+    :param url: the url
+    :return: the normalized url
+    """
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        netloc = parts.netloc.lower()
+        if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+            netloc = netloc.rsplit(':', 1)[0]
+        # a parameter that is given more than once keeps its order
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True), key=lambda pair: pair[0]))
+        return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+    except:
+        return url
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Makes calls with the same key share one result. A call that comes while another one with the same key is running
+    waits for it instead of doing the work again, and results can be remembered for a few seconds, so the calls of
+    one listing share them, but a later one sees what changed. Everyone gets the same object, so don't modify it
+    """
+    def __init__(self, max_results=128, ttl=5):
+        """
+        :param max_results: how many remembered results to keep
+        :param ttl: how many seconds a result is remembered after its call finished
+        """
+        self.max_results = max_results
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._results = OrderedDict()
+        self._stats = {'calls': 0, 'coalesced': 0, 'remembered': 0}
+
+    def get_stats(self):
+        """
+        :return: counters for calls that did the work, waited for a running call, and used a remembered result
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _remembered(self, key):
+        """
+        Look up a remembered result, and drop the ones that expired. Call it with the lock held
+        :return: the result, or None
+        """
+        now = time.time()
+        # they are in the order they expire in
+        while len(self._results) > 0 and next(iter(self._results.values()))[0] <= now:
+            self._results.popitem(last=False)
+        remembered = self._results.get(key)
+        if remembered is None:
+            return None
+        self._stats['remembered'] += 1
+        return remembered[1]
+
+    def do(self, key, func, remember=True):
+        """
+        Call func, unless a call with the same key is running or its result is remembered
+        :param key: a tuple, the first item is the url that forget() looks at
+        :param func: function without arguments
+        :param remember: keep the result for the next ttl seconds. None is never remembered
+        :return: what func returned
+        """
+        with self._lock:
+            result = self._remembered(key)
+            if result is not None:
+                return result
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats['coalesced'] += 1
+                owner = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['calls'] += 1
+                owner = True
+
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if remember and self.ttl > 0 and call.error is None and call.result is not None:
+                    self._results.pop(key, None)
+                    self._results[key] = (time.time() + self.ttl, call.result)
+                    while len(self._results) > self.max_results:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def join(self, key):
+        """
+        Get the result of a call with the same key that is running or remembered, without starting one
+        :param key: see do()
+        :return: its result, or None if there is none or it failed
+        """
+        with self._lock:
+            result = self._remembered(key)
+            if result is not None:
+                return result
+            call = self._calls.get(key)
+            if call is None:
+                return None
+            self._stats['coalesced'] += 1
+        call.done.wait()
+        return call.result if call.error is None else None
+
+    def forget(self, url=None):
+        """
+        Drop remembered results
+        :param url: only the ones for this url (already normalized), or everything if None
+        """
+        with self._lock:
+            if url is None:
+                self._results.clear()
+                return
+            for key in [k for k in self._results if k[0] == url]:
+                del self._results[key]
@@ -1,15 +1,11 @@
 # -*- coding: utf-8 -*-
-try:
-    from sqlite3 import dbapi2 as database
-except:
-    from pysqlite2 import dbapi2 as database
-
 import os.path
 import sys
 
 import xbmc
 import xbmcaddon
 import xbmcgui
+import database_manager
 
 
 def decode_utf8(_string):
@@ -30,18 +26,12 @@ if not os.path.exists(profileDir):
 
 db_file = os.path.join(profileDir, 'search.db')
 
-# connect to db
-init_connection = database.connect(db_file)
-init_cursor = init_connection.cursor()
 
-# create table
-try:
-    init_cursor.execute('CREATE TABLE IF NOT EXISTS search (search_term);')
-except:
-    pass
+def create_tables(connection):
+    connection.execute('CREATE TABLE IF NOT EXISTS search (search_term);')
+
 
-# close connection
-init_connection.close()
+database_manager.register(db_file, create_tables)
 
 
 def get_search_history():
@@ -50,20 +40,15 @@ def get_search_history():
     :return: list of used search terms
     """
     items = []
-    db_connection = None
     try:
-        db_connection = database.connect(db_file)
-        db_cursor = db_connection.cursor()
-        db_cursor.execute('SELECT search_term FROM search ORDER BY ROWID DESC')
-        faves = db_cursor.fetchall()
+        with database_manager.cursor(db_file) as db_cursor:
+            db_cursor.execute('SELECT search_term FROM search ORDER BY ROWID DESC')
+            faves = db_cursor.fetchall()
         for a_row in faves:
             if len(a_row) > 0:
                 items.append(a_row)
     except:
         pass
-    finally:
-        if db_connection is not None:
-            db_connection.close()
     return items
 
 
@@ -73,11 +58,8 @@ def add_search_history(query):
     :param query: term to add to db
     :return:
     """
-    db_connection = database.connect(db_file)
-    db_cursor = db_connection.cursor()
-    db_cursor.execute('INSERT INTO search (search_term) VALUES (?)', (query,))
-    db_connection.commit()
-    db_connection.close()
+    with database_manager.cursor(db_file, commit=True) as db_cursor:
+        db_cursor.execute('INSERT INTO search (search_term) VALUES (?)', (query,))
 
 
 def remove_search_history(query=None):
@@ -86,16 +68,11 @@ def remove_search_history(query=None):
     :param query:
     :return:
     """
-    db_connection = database.connect(db_file)
-    db_cursor = db_connection.cursor()
-
-    if query is not None:
-        db_cursor.execute('DELETE FROM search WHERE search_term=?', (query,))
-    else:
-        db_cursor.execute('DELETE FROM search')
-
-    db_connection.commit()
-    db_connection.close()
+    with database_manager.cursor(db_file, commit=True) as db_cursor:
+        if query is not None:
+            db_cursor.execute('DELETE FROM search WHERE search_term=?', (query,))
+        else:
+            db_cursor.execute('DELETE FROM search')
 
 
 def check_in_database(term):
@@ -104,11 +81,10 @@ def check_in_database(term):
     :param term: string that you check for
     :return: True if exist in database, False if not
     """
-    db_connection = database.connect(db_file)
-    db_cursor = db_connection.cursor()
-    db_cursor.execute('SELECT Count(search_term) FROM search WHERE search_term=?', (term,))
-    data = db_cursor.fetchone()
-    return data > 0
+    with database_manager.cursor(db_file) as db_cursor:
+        db_cursor.execute('SELECT Count(search_term) FROM search WHERE search_term=?', (term,))
+        data = db_cursor.fetchone()
+    return data[0] > 0
 
 
 def clear_search_history():
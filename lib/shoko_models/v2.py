@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json
 import time
 from hashlib import md5
 
 from abc import abstractmethod
 
+import art_cache
 import class_dump
 import error_handler as eh
 import nakamori_utils.model_utils
@@ -15,19 +15,91 @@ from nakamori_utils.kodi_utils import Sorting
 from kodi_models import ListItem, WatchedStatus
 from nakamori_utils.globalvars import *
 from nakamori_utils import kodi_utils, shoko_utils, script_utils, plugin_utils
-from nakamori_utils import model_utils
+from nakamori_utils import model_utils, thread_utils
 
 from proxy.kodi_version_proxy import kodi_proxy
-from proxy.python_version_proxy import python_proxy as pyproxy
+from proxy.python_version_proxy import python_proxy as pyproxy, UrlBuilder
 
 localize = plugin_addon.getLocalizedString
 
+# full objects that were downloaded ahead of time by prefetch_full_objects(), by api url
+prefetched_objects = {}
+
+
+class Deferred(object):
+    """
+    A value that isn't worked out yet. Give it to a LazyAttribute, and it is called the first time that is read
+    """
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __call__(self):
+        return self.func(*self.args)
+
+
+class LazyAttribute(object):
+    """
+    An attribute of a model that can be set to a Deferred. The value is kept in the slot with the same name and a
+    leading underscore. Listing a series shouldn't pay for its episodes, files, cast and so on until they are used
+    """
+    def __init__(self, name, after=None):
+        """
+        :param name: the name of the attribute
+        :param after: another lazy attribute that sets this one while it loads, so it's loaded first
+        """
+        self.slot = '_' + name
+        self.after = after
+
+    def is_loaded(self, obj):
+        if self.after is not None and not getattr(type(obj), self.after).is_loaded(obj):
+            return False
+        return not isinstance(getattr(obj, self.slot, None), Deferred)
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        if self.after is not None:
+            getattr(obj, self.after)
+        value = getattr(obj, self.slot)
+        if isinstance(value, Deferred):
+            # if it's read again while it loads, it's None instead of loading twice
+            setattr(obj, self.slot, None)
+            try:
+                value = value()
+            except:
+                setattr(obj, self.slot, value)
+                raise
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+
+def _get_streams(get_streams, media):
+    try:
+        return get_streams(media)
+    except:
+        return {}
+
 
 # noinspection Duplicates,PyUnusedFunction
 class Directory(object):
     """
     A directory object, the base for Groups, Series, Episodes, etc
     """
+    # the arrays of children that can be parsed while they are downloaded, when stream_json is enabled.
+    # Only for the ones that are walked once, as a streamed array can't be read again
+    stream_keys = ()
+    # a long series makes thousands of these, so the hot ones don't get a __dict__. Subclasses without __slots__
+    # (Filter, Group, etc) still have one. An attribute that is assigned anywhere has to be listed here
+    __slots__ = ('is_kodi_folder', 'name', '_items', 'fanart', 'poster', 'banner', 'icon', 'size', 'get_children',
+                 'sort_index', 'sizes', 'id', 'make_bold')
+    items = LazyAttribute('items')
+
     def __init__(self, json_node, get_children=False):
         """
         Create a directory object from a json node, containing only what is needed to form a ListItem.
@@ -66,7 +138,10 @@ class Directory(object):
         else:
             result += '[%s]' % self.id
 
-        if self.items is not None and len(self.items) > 0:
+        # don't build the children just to log them
+        if not Directory.items.is_loaded(self):
+            result += ' - items not loaded'
+        elif self.items is not None and len(self.items) > 0:
             if len(self.items) == 1:
                 result += ' - %s item' % len(self.items)
             else:
@@ -106,11 +181,24 @@ class Directory(object):
 
     def get_full_object(self, force_cache=False, cache_time=0):
         url = self.get_api_url()
-        json_body = pyproxy.get_json(url, force_cache=force_cache, cache_time=cache_time)
-        if json_body is None:
-            return None
-        json_node = json.loads(json_body)
-        return json_node
+        json_node = prefetched_objects.pop(url, None)
+        if json_node is not None:
+            return json_node
+        if len(self.stream_keys) > 0 and plugin_settings.get_bool('stream_json'):
+            return pyproxy.get_json_stream(url, self.stream_keys, force_cache=force_cache, cache_time=cache_time)
+        return pyproxy.get_json_tree(url, force_cache=force_cache, cache_time=cache_time)
+
+    def defer_children(self, json_node):
+        """
+        Make process_children() run the first time items is read, instead of now
+        :param json_node: the json node with the children
+        """
+        self.items = Deferred(self.load_children, json_node)
+
+    def load_children(self, json_node):
+        self.items = []
+        self.process_children(json_node)
+        return self.items
 
     def process_art(self, json_node):
         thumb = ''
@@ -148,20 +236,10 @@ class Directory(object):
         pass
 
     def set_watched_status(self, watched):
-        if pyproxy.is_unicode_or_string(watched):
-            watched = watched.lower() != 'false'
-
-        url = self.base_url()
-        url += '/watch' if watched else '/unwatch'
-        url = pyproxy.set_parameter(url, 'id', self.id)
-        # TODO DEPRECATED
-        if plugin_addon.getSetting('syncwatched') == 'true':
-            pyproxy.get_json(url)
-        else:
-            xbmc.executebuiltin('XBMC.Action(ToggleWatched)')
+        mark_watched([self], watched)
 
         # TODO DEPRECATED
-        if plugin_addon.getSetting('sync_to_library') == 'true':
+        if plugin_settings.get_bool('sync_to_library'):
             # TODO NEED TO GET EPISODEID FROM FILE
             # IN DB FILES ARE STORED AS PATH: plugin://plugin.video.nakamori/  FILENAME: plugin://plugin.video.nakamori/tvshows/<ID>/ep/<EP_ID>/play
             # <ID> is not the same as shoko ID.
@@ -184,16 +262,28 @@ class Directory(object):
             # TODO make this work - but not here :-)
             pass
 
-        if plugin_addon.getSetting('watchedbox') == 'true':
-            msg = localize(30201) + ' ' + (localize(30202) if watched else localize(30203))
-            xbmc.executebuiltin('XBMC.Notification(' + localize(30200) + ', ' + msg + ', 2000, ' +
-                                plugin_addon.getAddonInfo('icon') + ')')
+    def add_watched_status(self, batch, watched, sent_with=None):
+        """
+        Queue a change of the watched status, to send it with others. The server marks what a series or group has
+        with it, so the children that were loaded are queued too, without a request of their own
+        :param batch: the changes
+        :type batch: shoko_utils.WatchedBatch
+        :param watched: the new status
+        :param sent_with: (url_prefix, id) of the change that marks this one on the server, if it's a child
+        """
+        batch.add(self.url_prefix(), self.id, watched, sent_with=sent_with)
+        if sent_with is None:
+            sent_with = (self.url_prefix(), self.id)
+        if Directory.items.is_loaded(self) and self.items is not None:
+            for item in self.items:
+                if isinstance(item, Directory) and item.url_prefix() is not None:
+                    item.add_watched_status(batch, watched, sent_with)
 
     def vote(self, value):
-        url = self.base_url() + '/vote'
-        url = pyproxy.set_parameter(url, 'id', self.id)
-        url = pyproxy.set_parameter(url, 'score', value)
-        pyproxy.get_json(url)
+        url = UrlBuilder(self.base_url() + '/vote').set('id', self.id).set('score', value).build()
+        pyproxy.get_json(url, direct=True)
+        import cache
+        cache.remove_object(self.url_prefix(), self.id)
 
     def get_listitem(self):
         """
@@ -223,7 +313,7 @@ class Directory(object):
         context_menu = []
 
         # Refresh
-        if plugin_addon.getSetting('context_refresh') == 'true':
+        if plugin_settings.get_bool('context_refresh'):
             context_menu += [(plugin_addon.getLocalizedString(30131), script_utils.url_refresh())]
 
         # Information about Kodi menu being below
@@ -236,7 +326,7 @@ class Directory(object):
             yield i
 
     def is_watched(self):
-        local_only = plugin_addon.getSetting('local_total') == 'true'
+        local_only = plugin_settings.get_bool('local_total')
         no_specials = kodi_utils.get_kodi_setting('ignore_specials_watched')
         sizes = self.sizes
         if sizes is None:
@@ -297,7 +387,7 @@ class Directory(object):
         return sizes.watched_episodes + sizes.watched_specials
 
     def get_total_episodes(self):
-        local_only = plugin_addon.getSetting('local_total') == 'true'
+        local_only = plugin_settings.get_bool('local_total')
         no_specials = kodi_utils.get_kodi_setting('ignore_specials_watched')
         sizes = self.sizes
         if sizes is None:
@@ -324,17 +414,17 @@ class Directory(object):
         pass
 
     def hide_ratings(self, infolabels):
-        if plugin_addon.getSetting('hide_rating_type') == 'Episodes':  # Series|Both
+        if plugin_settings.get('hide_rating_type') == 'Episodes':  # Series|Both
             return
-        if plugin_addon.getSetting('hide_rating') == 'Always':
+        if plugin_settings.get('hide_rating') == 'Always':
             del infolabels['rating']
             return
-        if plugin_addon.getSetting('hide_rating') == 'Unwatched':
+        if plugin_settings.get('hide_rating') == 'Unwatched':
             if self.is_watched() == WatchedStatus.WATCHED:
                 return
             del infolabels['rating']
             return
-        if plugin_addon.getSetting('hide_rating') == 'All Unwatched':
+        if plugin_settings.get('hide_rating') == 'All Unwatched':
             if self.is_watched() != WatchedStatus.UNWATCHED:
                 return
             del infolabels['rating']
@@ -346,7 +436,7 @@ class Directory(object):
         if self.is_watched() == WatchedStatus.WATCHED:
             return
         if not kodi_utils.get_kodi_setting('videolibrary.showunwatchedplots')\
-                or plugin_addon.getSetting('hide_plot') == 'true':
+                or plugin_settings.get_bool('hide_plot'):
             infolabels['plot'] = localize(30079)
 
     def add_sort_methods(self, handle):
@@ -357,7 +447,7 @@ class Directory(object):
         xbmcplugin.addSortMethod(handle, Sorting.year.listitem_id)
 
     def apply_default_sorting(self):
-        sorting_setting = plugin_addon.getSetting('default_sort_series')
+        sorting_setting = plugin_settings.get('default_sort_series')
         kodi_utils.set_user_sort_method(sorting_setting)
 
     def bold(self):
@@ -430,6 +520,8 @@ class Filter(Directory):
     """
     A filter object, contains a unified method of representing a filter, with convenient converters
     """
+    stream_keys = ('filters', 'groups')
+
     def __init__(self, json_node, build_full_object=False, get_children=False, parent_menu=''):
         """
         Create a filter object from a json node, containing everything that is relevant to a ListItem.
@@ -467,18 +559,20 @@ class Filter(Directory):
 
         self.apply_built_in_overrides()
         self.process_children(json_node)
+        if get_children:
+            art_cache.prefetch(self.items)
 
         eh.spam(self)
 
     def get_api_url(self):
-        url = self.base_url()
+        url = UrlBuilder(self.base_url())
         level = 0
         if self.get_children and self.size > 0:
             level = 1 if self.directory_filter else 2
-        url = model_utils.add_default_parameters(url, self.id, level)
+        model_utils.set_default_parameters(url, self.id, level)
         if self.id == 0:
-            url = pyproxy.set_parameter(url, 'notag', 1)
-        return url
+            url.set('notag', 1)
+        return url.build()
 
     def url_prefix(self):
         """
@@ -515,18 +609,23 @@ class Filter(Directory):
 
     def process_children(self, json_node):
         items = json_node.get('filters', [])
+        prefetched = prefetch_full_objects(items, lambda i: Filter(i, parent_menu=self.parent_url))
         for i in items:
             try:
                 self.items.append(Filter(i, build_full_object=True, parent_menu=self.parent_url))
             except:
                 pass
+        drop_prefetched(prefetched)
         items = json_node.get('groups', [])
+        # the same url as get_collapsed_group() asks for
+        prefetched = prefetch_full_objects(items, lambda i: Group(i, filter_id=self.id, parent_menu=self.parent_url))
         for i in items:
             try:
                 group = self.get_collapsed_group(i)
                 self.items.append(group)
             except:
                 pass
+        drop_prefetched(prefetched)
 
     def get_collapsed_group(self, json_node):
         group = Group(json_node, build_full_object=True, filter_id=self.id, parent_menu=self.parent_url)
@@ -554,6 +653,8 @@ class Group(Directory):
     """
     A group object, contains a unified method of representing a group, with convenient converters
     """
+    stream_keys = ('series',)
+
     def __init__(self, json_node, build_full_object=False, get_children=False, filter_id=0, parent_menu=''):
         """
         Create a group object from a json node, containing everything that is relevant to a ListItem.
@@ -569,13 +670,14 @@ class Group(Directory):
             parent_menu = parent_menu[:-1]
         self.plugin_url = '%s/group-%s/' % (parent_menu, self.id)
         self.parent_menu = parent_menu
+        # before the download, get_api_url() has it
+        if filter_id != 0 and filter_id != '0':
+            self.filter_id = filter_id
 
         # don't redownload info on an okay object
         if build_full_object and (self.size < 0 or (get_children and len(self.items) < 1)):
             json_node = self.get_full_object()
             Directory.__init__(self, json_node, get_children)
-        if filter_id != 0 and filter_id != '0':
-            self.filter_id = filter_id
 
         # check again, as we might have replaced it above
         if isinstance(json_node, int) or pyproxy.is_unicode_or_string(json_node):
@@ -592,15 +694,17 @@ class Group(Directory):
         self.overview = model_utils.make_text_nice(pyproxy.decode(json_node.get('summary', '')))
 
         self.process_children(json_node)
+        if get_children:
+            art_cache.prefetch(self.items)
 
         eh.spam(self)
 
     def get_api_url(self):
-        url = self.base_url()
-        url = nakamori_utils.model_utils.add_default_parameters(url, self.id, 1 if self.get_children else 0)
+        url = UrlBuilder(self.base_url())
+        model_utils.set_default_parameters(url, self.id, 1 if self.get_children else 0)
         if self.filter_id != 0:
-            url = pyproxy.set_parameter(url, 'filter', self.filter_id)
-        return url
+            url.set('filter', self.filter_id)
+        return url.build()
 
     def url_prefix(self):
         """
@@ -655,11 +759,13 @@ class Group(Directory):
 
     def process_children(self, json_node):
         items = json_node.get('series', [])
+        prefetched = prefetch_full_objects(items, lambda i: Series(i, parent_menu=self.get_plugin_url()))
         for i in items:
             try:
                 self.items.append(Series(i, build_full_object=True, parent_menu=self.get_plugin_url()))
             except:
                 pass
+        drop_prefetched(prefetched)
 
     def get_context_menu_items(self):
         context_menu = []
@@ -667,7 +773,7 @@ class Group(Directory):
         # Mark as watched/unwatched
         watched_item = (localize(30126), script_utils.url_group_watched_status(self.id, True))
         unwatched_item = (localize(30127), script_utils.url_group_watched_status(self.id, False))
-        if plugin_addon.getSetting('context_krypton_watched') == 'true':
+        if plugin_settings.get_bool('context_krypton_watched'):
             watched = self.is_watched()
             if watched == WatchedStatus.WATCHED:
                 context_menu.append(unwatched_item)
@@ -688,6 +794,16 @@ class Series(Directory):
     """
     A series object, contains a unified method of representing a series, with convenient converters
     """
+    __slots__ = ('url', 'item_type', 'use_aid', 'plugin_url', 'parent_menu', '_episode_types', 'alternate_name',
+                 'overview', 'anidb_aid', 'season', 'date', 'rating', 'user_rating', 'votes', '_actors', '_tags',
+                 'is_movie', 'file_size', 'year', '_mpaa', 'studio', 'outline', 'hash', 'in_favorite', 'in_bookmark',
+                 'match')
+    # the SeriesTypeLists are made with the episodes
+    episode_types = LazyAttribute('episode_types', after='items')
+    actors = LazyAttribute('actors')
+    tags = LazyAttribute('tags')
+    mpaa = LazyAttribute('mpaa')
+
     def __init__(self, json_node, build_full_object=False, get_children=False, compute_hash=False, seiyuu_pic=False,
                  use_aid=False, in_bookmark=False, force_cache=False, cache_time=0, parent_menu=''):
         """
@@ -726,16 +842,16 @@ class Series(Directory):
         if seiyuu_pic:
             fix_seiyuu_pic = True
         else:
-            fix_seiyuu_pic = True if plugin_addon.getSetting('fix_seiyuu_pic') == 'true' else False
-        self.actors = model_utils.get_cast_info(json_node, fix_seiyuu_pic)
+            fix_seiyuu_pic = plugin_settings.get_bool('fix_seiyuu_pic')
+        self.actors = Deferred(model_utils.get_cast_info, json_node, fix_seiyuu_pic)
         self.sizes = get_sizes(json_node)
-        self.tags = model_utils.get_tags(json_node.get('tags', {}))
+        self.tags = Deferred(model_utils.get_tags, json_node.get('tags', {}))
         self.is_movie = json_node.get('ismovie', 0) == 1
         if self.is_movie:
             self.item_type = 'movie'
         self.file_size = json_node.get('filesize', 0)
         self.year = json_node.get('year', 0)
-        self.mpaa = self.get_mpaa_rating()
+        self.mpaa = Deferred(self.get_mpaa_rating)
         self.studio = ''
         self.outline = " ".join(self.overview.split(".", 3)[:2])  # first 3 sentence
         self.hash = None
@@ -743,7 +859,7 @@ class Series(Directory):
         self.in_bookmark = in_bookmark
         self.match = json_node.get('match', '')
 
-        self.process_children(json_node)
+        self.defer_children(json_node)
 
         if compute_hash:
             m = md5()
@@ -897,6 +1013,7 @@ class Series(Directory):
     def process_children(self, json_node):
         items = json_node.get('eps', [])
         episode_types = []
+        prefetched = prefetch_full_objects(items, lambda i: Episode(i, series=self))
         for i in items:
             try:
                 episode = Episode(i, series=self, build_full_object=True)
@@ -905,6 +1022,7 @@ class Series(Directory):
                     episode_types.append(episode.episode_type)
             except:
                 pass
+        drop_prefetched(prefetched)
         for i in episode_types:
             self.episode_types.append(SeriesTypeList(json_node, i, parent_menu=self.parent_menu))
 
@@ -914,7 +1032,7 @@ class Series(Directory):
         # Mark as watched/unwatched
         watched_item = (localize(30126), script_utils.url_series_watched_status(self.id, True))
         unwatched_item = (localize(30127), script_utils.url_series_watched_status(self.id, False))
-        if plugin_addon.getSetting('context_krypton_watched') == 'true':
+        if plugin_settings.get_bool('context_krypton_watched'):
             watched = self.is_watched()
             if watched == WatchedStatus.WATCHED:
                 context_menu.append(unwatched_item)
@@ -928,18 +1046,18 @@ class Series(Directory):
             context_menu.append(unwatched_item)
 
         # Vote Series
-        if plugin_addon.getSetting('context_show_vote_Series') == 'true':
+        if plugin_settings.get_bool('context_show_vote_Series'):
             context_menu.append((localize(30124), script_utils.url_vote_for_series(self.id)))
 
         # Favorite
-        if plugin_addon.getSetting('show_favorites') == 'true':
+        if plugin_settings.get_bool('show_favorites'):
             if self.in_favorite:
                 context_menu.append((localize(30213), script_utils.url_remove_favorite(self.id)))
             else:
                 context_menu.append((localize(30212), script_utils.url_add_favorite(self.id)))
 
         # Bookmark
-        if plugin_addon.getSetting('show_bookmark') == 'true':
+        if plugin_settings.get_bool('show_bookmark'):
             if self.in_bookmark:
                 context_menu.append((localize(30217), script_utils.url_remove_bookmark(self.anidb_aid)))
             else:
@@ -967,7 +1085,7 @@ class Series(Directory):
         xbmcplugin.addSortMethod(handle, Sorting.year.listitem_id)
 
     def apply_default_sorting(self):
-        sorting_setting = plugin_addon.getSetting('default_sort_episodes')
+        sorting_setting = plugin_settings.get('default_sort_episodes')
         kodi_utils.set_user_sort_method(sorting_setting)
 
     def get_mpaa_rating(self):
@@ -1088,7 +1206,7 @@ class SeriesTypeList(Series):
         return infolabels
 
     def is_watched(self):
-        local_only = plugin_addon.getSetting('local_total') == 'true'
+        local_only = plugin_settings.get_bool('local_total')
         sizes = self.sizes
         if sizes is None:
             return WatchedStatus.UNWATCHED
@@ -1153,7 +1271,7 @@ class SeriesTypeList(Series):
         return 0
 
     def get_total_episodes(self):
-        local_only = plugin_addon.getSetting('local_total') == 'true'
+        local_only = plugin_settings.get_bool('local_total')
         sizes = self.sizes
         if sizes is None:
             return 0
@@ -1177,6 +1295,15 @@ class Episode(Directory):
     """
     An episode object, contains a unified method of representing an episode, with convenient converters
     """
+    __slots__ = ('series_id', 'series_name', 'anidb_aid', 'anidb_eid', '_actors', 'url', 'item_type', 'episode_number',
+                 'episode_type', 'date', 'tvdb_episode', '_update_date', '_hash_content', 'alternate_name', 'watched',
+                 'watched_date', 'year', 'rating', 'user_rating', 'overview', 'votes', 'outline', '_tags', 'season')
+    actors = LazyAttribute('actors')
+    tags = LazyAttribute('tags')
+    # these come from the files
+    update_date = LazyAttribute('update_date', after='items')
+    hash_content = LazyAttribute('hash_content', after='items')
+
     def __init__(self, json_node, series=None, build_full_object=False):
         """
         Create an episode object from a json node, containing everything that is relevant to a ListItem
@@ -1193,7 +1320,7 @@ class Episode(Directory):
         if series is not None:
             self.series_id = series.id
             self.series_name = series.name
-            self.actors = series.actors
+            self.actors = Deferred(getattr, series, 'actors')
             self.anidb_aid = series.anidb_aid
             if series.is_movie:
                 self.item_type = 'movie'
@@ -1218,7 +1345,7 @@ class Episode(Directory):
         self.update_date = None
         self.hash_content = None
 
-        self.process_children(json_node)
+        self.defer_children(json_node)
 
         if self.name is None:
             self.name = 'Episode ' + str(self.episode_number)
@@ -1233,7 +1360,7 @@ class Episode(Directory):
         self.overview = model_utils.make_text_nice(pyproxy.decode(json_node.get('summary', '')))
         self.votes = pyproxy.safe_int(json_node.get('votes', ''))
         self.outline = " ".join(self.overview.split(".", 3)[:2])  # first 3 sentence
-        self.tags = model_utils.get_tags(json_node.get('tags', {}))
+        self.tags = Deferred(model_utils.get_tags, json_node.get('tags', {}))
 
         if self.episode_type != 'Special':
             season = str(json_node.get('season', '1'))
@@ -1427,7 +1554,7 @@ class Episode(Directory):
         # Calls to Plugin from Context Menus need 'RunPlugin(%s)' %
         context_menu = []
         # Play
-        if plugin_addon.getSetting('context_show_play') == 'true':
+        if plugin_settings.get_bool('context_show_play'):
             # I change this to play, because with 'show info' this does not play file
             url = plugin_utils.url_play_video(self.id, self.get_file().id, runplugin=True)
             context_menu.append((localize(30065), url))
@@ -1435,34 +1562,34 @@ class Episode(Directory):
 
         # Resume
         if self.get_file() is not None and self.get_file().resume_time > 0 \
-                and plugin_addon.getSetting('file_resume') == 'true':
+                and plugin_settings.get_bool('file_resume'):
             label = localize(30141) + ' (%s)' % time.strftime('%H:%M:%S', time.gmtime(self.get_file().resume_time))
             url = plugin_utils.url_resume_video(self.id, self.get_file().id, runplugin=True)
             context_menu.append((label, url))
 
         # Play (No Scrobble)
-        if plugin_addon.getSetting('context_show_play_no_watch') == 'true':
+        if plugin_settings.get_bool('context_show_play_no_watch'):
             context_menu.append((localize(30132), plugin_utils.url_play_video_without_marking(self.id, self.get_file().id, runplugin=True)))
 
         # Play (transcode)
-        if plugin_addon.getSetting('context_show_force_transcode') == 'true' and plugin_addon.getSetting('eigakan_handshake') == 'true':
+        if plugin_settings.get_bool('context_show_force_transcode') and plugin_settings.get_bool('eigakan_handshake'):
             context_menu.append((localize(30174), plugin_utils.url_transcode_play_video(self.id, self.get_file().id, runplugin=True)))
 
         # Play (Direct)
-        if plugin_addon.getSetting('enableEigakan') == 'true' and plugin_addon.getSetting('context_show_directplay') == 'true':
-            if plugin_addon.getSetting('context_pick_file') == 'true' and len(self.items) > 1:
+        if plugin_settings.get_bool('enableEigakan') and plugin_settings.get_bool('context_show_directplay'):
+            if plugin_settings.get_bool('context_pick_file') and len(self.items) > 1:
                 context_menu.append((localize(30175), plugin_utils.url_direct_play_video(self.id, runplugin=True)))
             else:
                 context_menu.append((localize(30175), plugin_utils.url_direct_play_video(self.id, self.get_file().id, runplugin=True)))
 
         # Inspect
-        if plugin_addon.getSetting('context_pick_file') == 'true' and len(self.items) > 1:
+        if plugin_settings.get_bool('context_pick_file') and len(self.items) > 1:
             context_menu.append((localize(30133), script_utils.url_file_list(self.id)))
 
         # Mark as watched/unwatched
         watched_item = (localize(30128), script_utils.url_episode_watched_status(self.id, True))
         unwatched_item = (localize(30129), script_utils.url_episode_watched_status(self.id, False))
-        if plugin_addon.getSetting('context_krypton_watched') == 'true':
+        if plugin_settings.get_bool('context_krypton_watched'):
             if self.watched:
                 context_menu.append(unwatched_item)
             else:
@@ -1472,31 +1599,31 @@ class Episode(Directory):
             context_menu.append(unwatched_item)
 
         # Play From Here
-        if plugin_addon.getSetting('context_playlist') == 'true':
+        if plugin_settings.get_bool('context_playlist'):
             # context_menu.append((localize(30130), 'TO BE ADDED TO SCRIPT'))
             pass
 
         # Vote Episode
-        if plugin_addon.getSetting('context_show_vote_Episode') == 'true':
+        if plugin_settings.get_bool('context_show_vote_Episode'):
             context_menu.append((localize(30125), script_utils.url_vote_for_episode(self.id)))
 
         # Vote Series
-        if plugin_addon.getSetting('context_show_vote_Series') == 'true' and self.series_id != 0:
+        if plugin_settings.get_bool('context_show_vote_Series') and self.series_id != 0:
             context_menu.append((localize(30124), script_utils.url_vote_for_series(self.series_id)))
 
         # Metadata
-        if plugin_addon.getSetting('context_show_info') == 'true':
+        if plugin_settings.get_bool('context_show_info'):
             context_menu.append((localize(30123), 'Action(Info)'))
 
         # View Cast
         # this was comment out, leaving until clean up
-        #if plugin_addon.getSetting('context_view_cast') == 'true' and self.series_id != 0:
+        #if plugin_settings.get_bool('context_view_cast') and self.series_id != 0:
             # context_menu.append((localize(30134), 'RunPlugin(%s&cmd=viewCast)'))
         #    pass
 
         # Probe
-        if plugin_addon.getSetting('enableEigakan') == 'true' and plugin_addon.getSetting('context_show_probe') == 'true':
-            if plugin_addon.getSetting('context_pick_file') == 'true' and len(self.items) > 1:
+        if plugin_settings.get_bool('enableEigakan') and plugin_settings.get_bool('context_show_probe'):
+            if plugin_settings.get_bool('context_pick_file') and len(self.items) > 1:
                 context_menu.append((localize(30177), script_utils.url_probe_episode(ep_id=self.id)))
             else:
                 file_ = self.get_file()
@@ -1504,8 +1631,8 @@ class Episode(Directory):
                 context_menu.append((localize(30177), script_utils.url_probe_file(file_id=file_id)))
 
         # Transcode
-        if plugin_addon.getSetting('enableEigakan') == 'true':
-            if plugin_addon.getSetting('context_pick_file') == 'true' and len(self.items) > 1:
+        if plugin_settings.get_bool('enableEigakan'):
+            if plugin_settings.get_bool('context_pick_file') and len(self.items) > 1:
                 context_menu.append((localize(30176), script_utils.url_transcode_episode(ep_id=self.id)))
             else:
                 file_ = self.get_file()
@@ -1521,6 +1648,13 @@ class Episode(Directory):
 
         return context_menu
 
+    def add_watched_status(self, batch, watched, sent_with=None):
+        # api/serie/fromep is keyed by the id of the episode, but doesn't need to show it
+        related = [('serie/fromep', self.id)]
+        if self.series_id != 0:
+            related.append(('serie', self.series_id))
+        batch.add(self.url_prefix(), self.id, watched, related, sent_with=sent_with)
+
     def vote(self, value):
         Directory.vote(self, value)
         xbmc.executebuiltin('XBMC.Notification(%s, %s %i, 7500, %s)' % (script_addon.getLocalizedString(30023),
@@ -1528,33 +1662,33 @@ class Episode(Directory):
                                                                         value, plugin_addon.getAddonInfo('icon')))
 
     def hide_images(self):
-        if plugin_addon.getSetting('hide_images') == 'true' and self.is_watched() != WatchedStatus.WATCHED:
+        if plugin_settings.get_bool('hide_images') and self.is_watched() != WatchedStatus.WATCHED:
             self.apply_image_override('hidden.png')
 
     def hide_title(self, infolabels):
-        if plugin_addon.getSetting('hide_title') == 'Never' or self.is_watched() == WatchedStatus.WATCHED:
+        if plugin_settings.get('hide_title') == 'Never' or self.is_watched() == WatchedStatus.WATCHED:
             return
         if self.episode_type == 'Special':
-            if plugin_addon.getSetting('hide_title') == 'Episodes':  # both,specials
+            if plugin_settings.get('hide_title') == 'Episodes':  # both,specials
                 return
             infolabels['title'] = localize(30076) + ' ' + str(self.episode_number)
         elif self.episode_type == 'Episode':
-            if plugin_addon.getSetting('hide_title') == 'Specials':  # both,episodes
+            if plugin_settings.get('hide_title') == 'Specials':  # both,episodes
                 return
             infolabels['title'] = localize(30076) + ' ' + str(self.episode_number)
 
     def hide_ratings(self, infolabels):
-        if plugin_addon.getSetting('hide_rating_type') == 'Series':  # Episodes|Both
+        if plugin_settings.get('hide_rating_type') == 'Series':  # Episodes|Both
             return
-        if plugin_addon.getSetting('hide_rating') == 'Always':
+        if plugin_settings.get('hide_rating') == 'Always':
             del infolabels['rating']
             return
-        if plugin_addon.getSetting('hide_rating') == 'Unwatched':
+        if plugin_settings.get('hide_rating') == 'Unwatched':
             if self.is_watched() == WatchedStatus.WATCHED:
                 return
             del infolabels['rating']
             return
-        if plugin_addon.getSetting('hide_rating') == 'All Unwatched':
+        if plugin_settings.get('hide_rating') == 'All Unwatched':
             if self.is_watched() != WatchedStatus.UNWATCHED:
                 return
             del infolabels['rating']
@@ -1565,6 +1699,12 @@ class File(Directory):
     """
     A file object, contains a unified method of representing a json_node file, with convenient converters
     """
+    __slots__ = ('server_path', 'file_url', 'file_name', 'file_extension', 'isVideo', 'resume_time', 'duration',
+                 'date_added', 'group', '_video_streams', '_audio_streams', '_sub_streams')
+    video_streams = LazyAttribute('video_streams')
+    audio_streams = LazyAttribute('audio_streams')
+    sub_streams = LazyAttribute('sub_streams')
+
     def __init__(self, json_node, build_full_object=False):
         """
         Create a file object from a json node, containing everything that is relevant to a ListItem
@@ -1608,18 +1748,9 @@ class File(Directory):
         self.group = json_node.get('group_full', '')
 
         if len(json_node.get('media', {})) > 0:
-            try:
-                self.video_streams = model_utils.get_video_streams(json_node['media'])
-            except:
-                self.video_streams = {}
-            try:
-                self.audio_streams = model_utils.get_audio_streams(json_node['media'])
-            except:
-                self.audio_streams = {}
-            try:
-                self.sub_streams = model_utils.get_sub_streams(json_node['media'])
-            except:
-                self.sub_streams = {}
+            self.video_streams = Deferred(_get_streams, model_utils.get_video_streams, json_node['media'])
+            self.audio_streams = Deferred(_get_streams, model_utils.get_audio_streams, json_node['media'])
+            self.sub_streams = Deferred(_get_streams, model_utils.get_sub_streams, json_node['media'])
         else:
             self.video_streams = {}
             self.audio_streams = {}
@@ -1629,11 +1760,7 @@ class File(Directory):
 
     def get_full_object(self):
         url = self.get_api_url()
-        json_body = pyproxy.get_json(url, True)
-        if json_body is None:
-            return None
-        json_node = json.loads(json_body)
-        return json_node
+        return pyproxy.get_json_tree(url, True)
 
     def get_api_url(self):
         url = self.base_url()
@@ -1670,7 +1797,7 @@ class File(Directory):
         li.setInfo(type='video', infoLabels=infolabels)
 
         # Files don't have watched states in the API, so this is all that's needed
-        if self.resume_time > 0 and plugin_addon.getSetting('file_resume') == 'true':
+        if self.resume_time > 0 and plugin_settings.get_bool('file_resume'):
             li.setProperty('ResumeTime', str(self.resume_time))
 
         model_utils.set_stream_info(li, self)
@@ -1726,6 +1853,9 @@ class File(Directory):
 
 
 class Sizes(object):
+    __slots__ = ('local_episodes', 'local_specials', 'local_total', 'watched_episodes', 'watched_specials',
+                 'watched_total', 'total_episodes', 'total_specials', 'total')
+
     def __init__(self):
         self.local_episodes = 0
         self.local_specials = 0
@@ -1755,12 +1885,108 @@ def get_sizes(json_node):
     return result
 
 
+def needs_full_object(json_node):
+    """
+    Whether a model built from this json node with build_full_object=True will have to download it
+    :param json_node: a child node, or an ID
+    :rtype: bool
+    """
+    if isinstance(json_node, int) or pyproxy.is_unicode_or_string(json_node):
+        return True
+    return pyproxy.safe_int(json_node.get('size', '0')) < 0
+
+
+def prefetch_full_objects(json_nodes, factory):
+    """
+    Download the full objects that the children of a listing will need, on a bounded pool of threads.
+    The children are still built one by one afterwards, get_full_object() just picks up what was downloaded,
+    so the result is the same as without the prefetch. They are always parsed whole, never streamed, as a stream
+    holds its connection until it's read, and nothing is read before all of them are downloaded
+    :param json_nodes: the child nodes, as given to process_children
+    :param factory: makes a helper object from the ID of a node, such as lambda i: Group(i). Made from an ID, the
+    models don't download anything or build children. It has to give the same api url as the children that are
+    built afterwards
+    :return: the urls that were downloaded, for drop_prefetched() once the children are built
+    :rtype: list
+    """
+    threads = get_int_setting('prefetch_threads', 4)
+    # a streamed array can only be read once, and its children come with the listing anyway
+    if threads < 2 or not isinstance(json_nodes, list):
+        return []
+    helpers = []
+    urls = set()
+    for json_node in json_nodes:
+        if not needs_full_object(json_node):
+            continue
+        if isinstance(json_node, dict):
+            json_node = json_node.get('id', 0)
+        helper = factory(json_node)
+        url = helper.get_api_url()
+        if url in urls or url in prefetched_objects:
+            continue
+        urls.add(url)
+        helpers.append(helper)
+    if len(helpers) < 2:
+        return []
+
+    eh.spam('Prefetching', len(helpers), 'objects on', threads, 'threads')
+    results = thread_utils.run_in_parallel(lambda helper: pyproxy.get_json_tree(helper.get_api_url()), helpers,
+                                           threads)
+    prefetched = []
+    for helper, json_node in zip(helpers, results):
+        if json_node is not None:
+            url = helper.get_api_url()
+            prefetched_objects[url] = json_node
+            prefetched.append(url)
+    return prefetched
+
+
+def drop_prefetched(urls):
+    """
+    Forget what prefetch_full_objects() downloaded and no child used, so nothing else picks it up later.
+    Anything that is still reading its response is closed
+    :param urls: what prefetch_full_objects() returned
+    """
+    for url in urls:
+        json_node = prefetched_objects.pop(url, None)
+        close = getattr(json_node, 'close', None)
+        if close is not None:
+            close()
+
+
+def mark_watched(items, watched):
+    """
+    Set the watched status of many models at once, like the episodes that were picked in a listing. With
+    syncwatched, they are sent to the server together, and the cache is cleaned once for all of them
+    :param items: the models
+    :type items: list[Directory]
+    :param watched: the new status, a bool or 'true'/'false'
+    """
+    if pyproxy.is_unicode_or_string(watched):
+        watched = watched.lower() != 'false'
+
+    # TODO DEPRECATED
+    if plugin_settings.get_bool('syncwatched'):
+        batch = shoko_utils.WatchedBatch()
+        for item in items:
+            # only these have a watched status on the server
+            if isinstance(item, (Group, Series, Episode)):
+                item.add_watched_status(batch, watched)
+        batch.send()
+    else:
+        xbmc.executebuiltin('XBMC.Action(ToggleWatched)')
+
+    if plugin_settings.get_bool('watchedbox'):
+        msg = localize(30201) + ' ' + (localize(30202) if watched else localize(30203))
+        xbmc.executebuiltin('XBMC.Notification(' + localize(30200) + ', ' + msg + ', 2000, ' +
+                            plugin_addon.getAddonInfo('icon') + ')')
+
+
 @eh.try_function(eh.ErrorPriority.NORMAL)
 def get_series_for_episode(ep_id):
     url = server + '/api/serie/fromep'
     url = nakamori_utils.model_utils.add_default_parameters(url, ep_id, 0)
-    json_body = pyproxy.get_json(url)
-    json_node = json.loads(json_body)
+    json_node = pyproxy.get_json_tree(url)
     return Series(json_node)
 
 
@@ -1788,9 +2014,8 @@ class ImportFolder(object):
         self.extra_data()
 
     def extra_data(self):
-        json_extra = pyproxy.get_json(server + '/api/serie/infobyfolder?id=%s' % self.id)
+        json_extra = pyproxy.get_json_tree(server + '/api/serie/infobyfolder?id=%s' % self.id)
         if json_extra is not None:
-            json_extra = json.loads(json_extra)
             self.size = int(json_extra.get('size', 0))
             self.filesize = int(json_extra.get('filesize', 0))
             capacity, units = convert_units(self.filesize)
@@ -1810,11 +2035,7 @@ class ImportFolder(object):
 
     def get_full_object(self):
         url = self.get_api_url()
-        json_body = pyproxy.get_json(url)
-        if json_body is None:
-            return None
-        json_node = json.loads(json_body)
-        return json_node
+        return pyproxy.get_json_tree(url)
 
     def get_api_url(self):
         url = self.base_url()
@@ -1873,11 +2094,7 @@ class ImportFolders(object):
 
     def get_full_object(self):
         url = self.get_api_url()
-        json_body = pyproxy.get_json(url)
-        if json_body is None:
-            return None
-        json_node = json.loads(json_body)
-        return json_node
+        return pyproxy.get_json_tree(url)
 
     def get_api_url(self):
         url = self.base_url()
@@ -1909,11 +2126,7 @@ class Queue(object):
 
     def get_full_object(self):
         url = self.get_api_url()
-        json_body = pyproxy.get_json(url)
-        if json_body is None:
-            return None
-        json_node = json.loads(json_body)
-        return json_node
+        return pyproxy.get_json_tree(url)
 
     def get_api_url(self):
         url = self.base_url()
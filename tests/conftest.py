@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+# the addon's modules, and stand-ins for the Kodi ones they import
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(here, 'stubs'), os.path.join(here, '..', 'lib')]
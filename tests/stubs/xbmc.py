@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Just enough of Kodi's xbmc module to import the addon's modules outside of Kodi
+import os
+import tempfile
+import time
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGNOTICE = 2
+LOGWARNING = 3
+LOGERROR = 4
+LOGSEVERE = 5
+LOGFATAL = 6
+LOGNONE = 7
+ISO_639_2 = 2
+
+# the addon's profile folder, a new one for every test run
+profile = os.environ.get('NAKAMORI_TEST_PROFILE') or tempfile.mkdtemp(prefix='nakamori-test-')
+
+
+def log(msg, level=LOGDEBUG):
+    pass
+
+
+def translatePath(path):
+    return profile
+
+
+def sleep(milliseconds):
+    time.sleep(milliseconds / 1000.0)
+
+
+def executebuiltin(function, wait=False):
+    pass
+
+
+def executescript(script):
+    pass
+
+
+def executeJSONRPC(request):
+    return '{"result": {"value": false}}'
+
+
+def getInfoLabel(label):
+    return '18.0 Leia'
+
+
+def getCondVisibility(condition):
+    return False
+
+
+def getUserAgent():
+    return 'Kodi/18.0'
+
+
+def getLanguage(format=None, region=False):
+    return 'en'
+
+
+class Monitor(object):
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=None):
+        time.sleep(timeout or 0)
+        return False
+
+
+class Player(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class Keyboard(object):
+    def __init__(self, default='', heading='', hidden=False):
+        self.text = default
+
+    def doModal(self, autoclose=0):
+        pass
+
+    def isConfirmed(self):
+        return False
+
+    def getText(self):
+        return self.text
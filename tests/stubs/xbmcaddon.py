@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Just enough of Kodi's xbmcaddon module to import the addon's modules outside of Kodi. Tests change SETTINGS
+import xbmc
+
+SETTINGS = {
+    'ipaddress': '127.0.0.1',
+    'port': '8111',
+    'apikey': 'test',
+    'timeout': '10',
+    'enableCache': 'true',
+    'expireCache': '600',
+    'spamLog': 'false',
+}
+
+
+class Addon(object):
+    def __init__(self, id=None):
+        self.id = id
+
+    def getSetting(self, id):
+        return SETTINGS.get(id, '')
+
+    def setSetting(self, id, value):
+        SETTINGS[id] = value
+
+    def getAddonInfo(self, id):
+        if id == 'profile':
+            return xbmc.profile
+        return ''
+
+    def getLocalizedString(self, id):
+        return 'string %s' % id
+
+    def openSettings(self):
+        pass
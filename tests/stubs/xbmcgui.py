@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Just enough of Kodi's xbmcgui module to import the addon's modules outside of Kodi
+
+
+def getCurrentWindowId():
+    return 10000
+
+
+def getCurrentWindowDialogId():
+    return 9999
+
+
+def _ignore(*args, **kwargs):
+    return None
+
+
+class ListItem(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    # kodi_models calls them on the class, so they have to be there, not made up by __getattr__
+    setArt = setPath = setInfo = setCast = setProperty = setRating = addContextMenuItems = setUniqueIDs = _ignore
+    setLabel = setLabel2 = setIconImage = setThumbnailImage = addStreamInfo = setSubtitles = setMimeType = _ignore
+    setContentLookup = getProperty = getLabel = _ignore
+
+
+class Dialog(object):
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class DialogProgress(object):
+    def create(self, *args):
+        pass
+
+    def update(self, *args):
+        pass
+
+    def iscanceled(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class Window(object):
+    def __init__(self, id=0):
+        self.properties = {}
+
+    def getProperty(self, key):
+        return self.properties.get(key, '')
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def clearProperty(self, key):
+        self.properties.pop(key, None)
+
+
+class ControlList(object):
+    pass
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Just enough of Kodi's xbmcplugin module to import the addon's modules outside of Kodi
+SORT_METHOD_UNSORTED = 0
+SORT_METHOD_LABEL = 1
+SORT_METHOD_DATE = 3
+SORT_METHOD_DURATION = 8
+SORT_METHOD_TITLE = 9
+SORT_METHOD_GENRE = 16
+SORT_METHOD_VIDEO_YEAR = 18
+SORT_METHOD_VIDEO_RATING = 19
+SORT_METHOD_VIDEO_USER_RATING = 20
+SORT_METHOD_DATEADDED = 21
+SORT_METHOD_EPISODE = 24
+SORT_METHOD_VIDEO_SORT_TITLE = 26
+
+
+def _ignore(*args, **kwargs):
+    return True
+
+
+addSortMethod = setContent = addDirectoryItem = addDirectoryItems = setPluginCategory = endOfDirectory = _ignore
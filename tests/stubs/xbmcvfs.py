@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+# Just enough of Kodi's xbmcvfs module to import the addon's modules outside of Kodi
+import io
+
+
+def File(path, mode='r'):
+    return io.open(path, mode + 'b' if 'b' not in mode else mode)
+
+
+def exists(path):
+    import os
+    return os.path.exists(path)
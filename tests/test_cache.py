@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import cache
+import database_manager
+
+
+class CacheTestCase(unittest.TestCase):
+    """
+    Runs every test on an empty cache.db of its own
+    """
+    def setUp(self):
+        self.old_db_file = cache.db_file
+        self.folder = tempfile.mkdtemp()
+        cache.db_file = os.path.join(self.folder, 'cache.db')
+        database_manager.register(cache.db_file, cache.create_tables)
+
+    def tearDown(self):
+        database_manager.close(cache.db_file)
+        cache.db_file = self.old_db_file
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class FindRelatedTest(CacheTestCase):
+    def setUp(self):
+        CacheTestCase.setUp(self)
+        # filter 7 has groups 1 and 2, group 1 has series 10 with episode 100, group 2 has series 20 with episode 200
+        relations = [
+            ('group', 1, 'filter', 7),
+            ('group', 2, 'filter', 7),
+            ('serie', 10, 'group', 1),
+            ('serie', 20, 'group', 2),
+            ('ep', 100, 'serie', 10),
+            ('ep', 200, 'serie', 20),
+        ]
+        with database_manager.cursor(cache.db_file, commit=True) as db_cursor:
+            db_cursor.executemany('INSERT INTO [object_parent] (type, id, parent_type, parent_id) VALUES (?, ?, ?, ?)',
+                                  relations)
+
+    def test_parents(self):
+        self.assertEqual(cache.find_related([('ep', 100)]),
+                         set([('ep', 100), ('serie', 10), ('group', 1), ('filter', 7)]))
+
+    def test_children(self):
+        self.assertEqual(cache.find_related([('group', 1)], parents=False, children=True),
+                         set([('group', 1), ('serie', 10), ('ep', 100)]))
+
+    def test_parents_and_children_leave_out_siblings(self):
+        self.assertEqual(cache.find_related([('group', 1)], parents=True, children=True),
+                         set([('group', 1), ('filter', 7), ('serie', 10), ('ep', 100)]))
+
+
+class CleanupTest(CacheTestCase):
+    url = 'http://127.0.0.1:8111/api/serie?id=10'
+
+    def test_remove_cache_forgets_the_trees_of_every_user(self):
+        for apikey in ('first', 'second'):
+            cache.add_cache(self.url, '{"id": 10}', apikey=apikey, tree={'id': 10})
+            self.assertIn(cache.make_key(self.url, apikey), cache.parsed_trees)
+        cache.remove_cache(self.url)
+        for apikey in ('first', 'second'):
+            self.assertNotIn(cache.make_key(self.url, apikey), cache.parsed_trees)
+            self.assertIsNone(cache.get_body_from_cache(self.url, apikey=apikey))
+
+    def test_sweep_keeps_revalidatable_responses_for_a_while(self):
+        day = 24 * 60 * 60
+        responses = [
+            ('plain', None, day),
+            ('recent', 'etag', day),
+            ('old', 'etag', 30 * day),
+        ]
+        for name, etag, age in responses:
+            cache.add_cache(self.url + '&r=' + name, '{}', etag=etag, apikey='first')
+            with database_manager.cursor(cache.db_file, commit=True) as db_cursor:
+                db_cursor.execute('UPDATE [response] SET expires=? WHERE url LIKE ?', (time.time() - age, '%' + name))
+        cache.sweep()
+        with database_manager.cursor(cache.db_file) as db_cursor:
+            left = [row[0] for row in db_cursor.execute('SELECT url FROM [response]').fetchall()]
+        self.assertEqual(left, [cache.normalize_url(self.url + '&r=recent')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import xbmcaddon
+from nakamori_utils.globalvars import Settings
+
+
+class DialogAddon(xbmcaddon.Addon):
+    """
+    An addon whose settings dialog changes a setting, like the user would
+    """
+    def openSettings(self):
+        xbmcaddon.SETTINGS['timeout'] = '30'
+
+
+class SettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.old_timeout = xbmcaddon.SETTINGS['timeout']
+        self.settings = Settings(DialogAddon('plugin.video.nakamori'))
+
+    def tearDown(self):
+        xbmcaddon.SETTINGS['timeout'] = self.old_timeout
+
+    def test_set_is_seen_at_once(self):
+        self.assertEqual(self.settings.get('timeout'), self.old_timeout)
+        self.settings.set('timeout', '20')
+        self.assertEqual(self.settings.get_int('timeout'), 20)
+        self.assertEqual(xbmcaddon.SETTINGS['timeout'], '20')
+
+    def test_dialog_changes_are_seen_after_it_closes(self):
+        self.assertEqual(self.settings.get('timeout'), self.old_timeout)
+        self.settings.open_dialog()
+        self.assertEqual(self.settings.get_int('timeout'), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
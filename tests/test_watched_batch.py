@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import cache
+import xbmcaddon
+from nakamori_utils import shoko_utils
+from shoko_models import v2
+
+
+class WatchedBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.removed = []
+        self.failing = set()
+        self.old_send = shoko_utils.send_watched_status
+        self.old_find_related = cache.find_related
+        self.old_remove_objects = cache.remove_objects
+        shoko_utils.send_watched_status = self.send
+        # nothing is cached, so only what was asked for is related
+        cache.find_related = lambda objects, parents=True, children=False: set(objects)
+        cache.remove_objects = lambda objects, listings=(): self.removed.append((set(objects), set(listings)))
+        xbmcaddon.SETTINGS['syncwatched'] = 'true'
+
+    def tearDown(self):
+        shoko_utils.send_watched_status = self.old_send
+        cache.find_related = self.old_find_related
+        cache.remove_objects = self.old_remove_objects
+        del xbmcaddon.SETTINGS['syncwatched']
+
+    def send(self, change):
+        self.sent.append(change[0])
+        return None if change[0] in self.failing else '{}'
+
+    def test_many_episodes_are_removed_in_one_pass(self):
+        batch = shoko_utils.WatchedBatch()
+        for ep_id in range(1, 6):
+            batch.add('ep', ep_id, True, related=[('serie', 10)])
+        self.assertEqual(len(batch.send()), 5)
+        self.assertEqual(sorted(self.sent), [('ep', ep_id) for ep_id in range(1, 6)])
+        self.assertEqual(len(self.removed), 1)
+        self.assertEqual(self.removed[0][0], set([('ep', ep_id) for ep_id in range(1, 6)] + [('serie', 10)]))
+
+    def test_children_go_with_their_parent(self):
+        batch = shoko_utils.WatchedBatch()
+        batch.add('serie', 10, True)
+        batch.add('ep', 1, True, sent_with=('serie', 10))
+        batch.add('ep', 2, True, sent_with=('serie', 10))
+        self.assertEqual(batch.send(), [('serie', 10), ('ep', 1), ('ep', 2)])
+        self.assertEqual(self.sent, [('serie', 10)])
+        self.assertEqual(len(self.removed), 1)
+        self.assertEqual(self.removed[0][0], set([('serie', 10), ('ep', 1), ('ep', 2)]))
+
+    def test_children_of_a_failed_parent_stay(self):
+        self.failing.add(('serie', 10))
+        batch = shoko_utils.WatchedBatch()
+        batch.add('serie', 10, True)
+        batch.add('ep', 1, True, sent_with=('serie', 10))
+        batch.add('ep', 3, True)
+        self.assertEqual(batch.send(), [('ep', 3)])
+        self.assertEqual(self.removed[0][0], set([('ep', 3)]))
+
+    def test_marking_a_series_sends_one_request(self):
+        json_node = {'type': 'serie', 'id': 10, 'name': 'Series', 'size': 3,
+                     'eps': [{'type': 'ep', 'id': ep_id, 'name': 'Episode', 'size': 1, 'eptype': 'Episode',
+                              'epnumber': ep_id} for ep_id in (1, 2, 3)]}
+        series = v2.Series(json_node)
+        self.assertEqual(len(series.items), 3)
+        v2.mark_watched([series], True)
+        self.assertEqual(self.sent, [('serie', 10)])
+        self.assertEqual(len(self.removed), 1)
+        self.assertEqual(self.removed[0][0], set([('serie', 10), ('ep', 1), ('ep', 2), ('ep', 3),
+                                                  ('serie/fromep', 1), ('serie/fromep', 2), ('serie/fromep', 3)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
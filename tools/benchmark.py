@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the hot paths of building listings. They compare the current code with what it replaced.
+Run it from the repository, with the stand-ins for the Kodi modules that the tests use: python tools/benchmark.py
+"""
+import os
+import sys
+import timeit
+
+# the addon's modules, and the stand-ins for the Kodi ones
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(here, '..', 'lib'), os.path.join(here, '..', 'tests', 'stubs')]
+
+import xbmc
+
+try:
+    from urllib.parse import quote_plus
+except ImportError:
+    from urllib import quote_plus
+
+
+def measure(func, number=10000, repeat=3):
+    """
+    :param func: function without arguments
+    :param number: how many times to call it in a run
+    :param repeat: how many runs, the best one counts
+    :return: seconds per call
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(name, old, new):
+    """
+    Log the result of a benchmark
+    :param name: what was measured
+    :param old: seconds per call before
+    :param new: seconds per call now
+    :return: the text that was logged
+    """
+    text = '%s: %.2f us -> %.2f us (%.1fx)' % (name, old * 1e6, new * 1e6, old / new if new > 0 else 0)
+    xbmc.log('[benchmark] ' + text, xbmc.LOGNOTICE)
+    return text
+
+
+def report_memory(name, old, new):
+    """
+    Log the result of a memory benchmark
+    :param name: what was measured
+    :param old: bytes before
+    :param new: bytes now
+    :return: the text that was logged
+    """
+    text = '%s: %i KiB -> %i KiB (%.1fx)' % (name, old // 1024, new // 1024, float(old) / new if new > 0 else 0)
+    xbmc.log('[benchmark] ' + text, xbmc.LOGNOTICE)
+    return text
+
+
+def _split_set_parameter(url, parameter, value):
+    # set_parameter before UrlBuilder, kept to compare against
+    from proxy.python_version_proxy import python_proxy as pyproxy
+    if value is None or value == '':
+        if '?' not in url:
+            return url
+        array1 = url.split('?')
+        if (parameter + '=') not in array1[1]:
+            return url
+        url = array1[0] + '?'
+        array2 = array1[1].split('&')
+        for key in array2:
+            array3 = key.split('=')
+            if array3[0] == parameter:
+                continue
+            url += array3[0] + '=' + array3[1] + '&'
+        return url[:-1]
+    value = quote_plus(pyproxy.encode(str(value)))
+    if '?' not in url:
+        return url + '?' + parameter + '=' + value
+
+    array1 = url.split('?')
+    if (parameter + '=') not in array1[1]:
+        return url + '&' + parameter + '=' + value
+
+    url = array1[0] + '?'
+    array2 = array1[1].split('&')
+    for key in array2:
+        array3 = key.split('=')
+        if array3[0] == parameter:
+            array3[1] = value
+        url += array3[0] + '=' + array3[1] + '&'
+    return url[:-1]
+
+
+def benchmark_url_builder():
+    """
+    add_default_parameters, which every get_api_url uses
+    """
+    from proxy.python_version_proxy import UrlBuilder
+    base = 'http://127.0.0.1:8111/api/group'
+
+    def old():
+        url = _split_set_parameter(base, 'id', 1234)
+        url = _split_set_parameter(url, 'level', 1)
+        url = _split_set_parameter(url, 'tagfilter', 2147483647)
+        return _split_set_parameter(url, 'nocast', 1)
+
+    def new():
+        return UrlBuilder(base).set('id', 1234).set('level', 1).set('tagfilter', 2147483647).set('nocast', 1).build()
+
+    assert old() == new()
+    return report('url building', measure(old), measure(new))
+
+
+def _regex_make_text_nice(data):
+    # make_text_nice before the patterns were compiled once, kept to compare against
+    import re
+    data = re.compile(r'(https?://anidb\.net/[0-9A-z/\-_.?=&]+[ ]*\[)([\S ]+?)(\])').sub(r'\2', data)
+    data = re.sub(r'\n(Source|Note|Summary):.*', "", data, flags=re.DOTALL).strip(" \n")
+    data = re.sub(r'^(\*|--|~) .*', "", data, flags=re.MULTILINE).strip(" \n")
+    return re.sub(r'\n\n+', r'\n\n', data).strip(" \n")
+
+
+# descriptions like the ones AniDB has, with its links, notes and comments
+anidb_descriptions = [
+    u'Tokyo, 2027. http://anidb.net/ch12345 [Kaneda] leads a gang of bikers, until his friend '
+    u'http://anidb.net/ch12346 [Tetsuo] is taken by the army after a crash.\n\nSource: Wikipedia',
+    u'The second season of http://anidb.net/a5678 [Some Show].\n* Based on the manga by '
+    u'http://anidb.net/cr999 [Someone].\n\n\n\nNote: The first two episodes were shown back to back.',
+    u'A girl finds a cat that can talk. It asks her to help it find its way home, before the summer ends.',
+    u'~ translated and adapted from the official site\nTwelve students are trapped in their school overnight.',
+    u'-- this is a comment\nhttps://anidb.net/perl-bin/animedb.pl?show=anime&aid=1 [The Movie] gets a sequel, '
+    u'set ten years later.\n\n\nSummary: a sequel',
+    u'Episode %i of the show. The team goes to the beach, and things go wrong.\n\n\nSource: AniDB',
+    u'http://anidb.net/ch1 [A] and http://anidb.net/ch2 [B] meet again, after a long time apart.\n'
+    u'\n\n* Episode 13 was only on the DVD.\n\nhttp://anidb.net/cr3 [C] wrote the music.',
+    u'\u5927\u5b66\u751f\u306e\u65e5\u5e38\u3002\nNote: only in Japan',
+]
+
+
+def _scan_match_title(data, lang, title_type):
+    # match_title before TitleIndex, kept to compare against
+    from proxy.python_version_proxy import python_proxy as pyproxy
+    exclude = False
+    if title_type.startswith('!'):
+        title_type = title_type[1:]
+        exclude = True
+    for title_tag in data.get('titles', []):
+        title = pyproxy.decode(title_tag.get('Title', ''))
+        if pyproxy.decode(title_tag.get('Title', '')) == '':
+            continue
+        if title_tag.get('Language', '').lower() != lang.lower():
+            continue
+        if exclude and title_tag.get('Type', '').lower() == title_type.lower():
+            continue
+        if not exclude and title_tag.get('Type', '').lower() != title_type.lower():
+            continue
+        return title
+    return None
+
+
+def _scan_get_title(data, lang, title_type):
+    # get_title before TitleIndex
+    from nakamori_utils import model_utils
+    from nakamori_utils.globalvars import plugin_settings
+    from proxy.python_version_proxy import python_proxy as pyproxy
+    if 'titles' not in data or plugin_settings.get_bool('use_server_title'):
+        return pyproxy.decode(data.get('name', ''))
+    if model_utils.is_type_list(pyproxy.decode(data.get('name', '').lower())):
+        return pyproxy.decode(data.get('name', ''))
+    for args in ((lang, title_type), (lang, '!short'), ('x-jat', 'main')):
+        title = _scan_match_title(data, *args)
+        if title is not None:
+            return title
+    return pyproxy.decode(data.get('name', ''))
+
+
+def shoko_payload(series_count=50, episode_count=24):
+    """
+    A made up level 2 group listing, shaped like what Shoko sends
+    :return: the json as bytes
+    """
+    import json
+
+    def episode(series_id, number):
+        return {'type': 'ep', 'id': series_id * 1000 + number, 'name': 'Episode %i' % number, 'eptype': 'Episode',
+                'epnumber': number, 'air': '2019-01-%02i' % (number % 28 + 1), 'rating': '8.21', 'votes': '120',
+                'summary': 'Something happens in episode %i.\nSource: AniDB' % number, 'view': 0, 'size': 1,
+                'art': {'thumb': [{'url': '/api/image/thumb/%i' % number, 'index': 0}], 'fanart': [], 'banner': []},
+                'files': [{'type': 'file', 'id': series_id * 10000 + number, 'filename': 'Show - %02i.mkv' % number,
+                           'size': 1, 'url': 'http://127.0.0.1:8111/Stream/%i' % number,
+                           'created': '2019-01-01T00:00:00',
+                           'media': {'video': {'0': {'Codec': 'h264', 'Width': 1920, 'Height': 1080}}}}]}
+
+    def series(series_id):
+        return {'type': 'serie', 'id': series_id, 'name': 'Series %i' % series_id, 'size': episode_count,
+                'titles': [{'Title': 'Series %i' % series_id, 'Language': 'x-jat', 'Type': 'main'},
+                           {'Title': u'シリーズ %i' % series_id, 'Language': 'ja', 'Type': 'official'}],
+                'tags': [{'tag': 'Action'}, {'tag': 'Comedy'}],
+                'roles': [{'character': 'Someone', 'staff': 'Voice Actor', 'character_image': '/c.jpg',
+                           'staff_image': '/s.jpg', 'role': 'Main'}] * 5,
+                'eps': [episode(series_id, e) for e in range(1, episode_count + 1)]}
+
+    group = {'type': 'group', 'id': 1, 'name': 'Group', 'size': series_count,
+             'series': [series(i) for i in range(1, series_count + 1)]}
+    return json.dumps(group).encode('utf-8')
+
+
+def benchmark_json_decode():
+    """
+    Decoding a big listing with the backend that json_utils picked, against the standard json
+    """
+    import json
+    from nakamori_utils import json_utils
+    payload = shoko_payload()
+
+    def old():
+        return json.loads(payload.decode('utf-8'))
+
+    def new():
+        return json_utils.loads(payload)
+
+    assert old() == new()
+    return report('json decode, %i KiB with %s' % (len(payload) // 1024, json_utils.backend),
+                  measure(old, number=10), measure(new, number=10))
+
+
+class _Unslotted(object):
+    # what a model object was before __slots__, an object with its attributes in a __dict__
+    pass
+
+
+def _model_size(obj):
+    """
+    :return: bytes of a model object and the models under it, without the values they hold
+    """
+    import sys
+    slots = set()
+    for cls in type(obj).__mro__:
+        slots.update(cls.__dict__.get('__slots__', ()))
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    unslotted = _Unslotted()
+    for name in slots:
+        if hasattr(obj, name):
+            setattr(unslotted, name, getattr(obj, name))
+    old_size = sys.getsizeof(unslotted) + sys.getsizeof(unslotted.__dict__)
+    for child in list(getattr(obj, 'items', None) or []) + [getattr(obj, 'sizes', None)]:
+        if child is not None and hasattr(type(child), '__slots__'):
+            child_old, child_new = _model_size(child)
+            old_size += child_old
+            size += child_new
+    return old_size, size
+
+
+def benchmark_model_memory():
+    """
+    The memory of a long series (1000 episodes, with a file each) with __slots__, against the same attributes in
+    a __dict__ per object
+    """
+    from nakamori_utils import json_utils
+    from shoko_models.v2 import Series
+    json_node = json_utils.loads(shoko_payload(series_count=1, episode_count=1000))['series'][0]
+    series = Series(json_node)
+    _load_everything(series)
+    old, new = _model_size(series)
+    return report_memory('model memory, %i episodes' % len(series.items), old, new)
+
+
+def _load_everything(obj):
+    # read every lazy attribute, like the models did in __init__ before
+    from shoko_models.v2 import LazyAttribute
+    for cls in type(obj).__mro__:
+        for name, attribute in list(cls.__dict__.items()):
+            if isinstance(attribute, LazyAttribute):
+                getattr(obj, name)
+    for child in list(getattr(obj, 'items', [])) + list(getattr(obj, 'episode_types', [])):
+        _load_everything(child)
+
+
+def benchmark_lazy_models():
+    """
+    Listing the episode types of a series of 200 episodes, which doesn't need the episodes themselves
+    """
+    from nakamori_utils import json_utils
+    from shoko_models.v2 import Series
+    json_node = json_utils.loads(shoko_payload(series_count=1, episode_count=200))['series'][0]
+    for episode in json_node['eps'][::10]:
+        episode['eptype'] = 'Special'
+
+    def old():
+        series = Series(json_node)
+        _load_everything(series)
+        return [t.get_listitem() for t in series.episode_types]
+
+    def new():
+        series = Series(json_node)
+        return [t.get_listitem() for t in series.episode_types]
+
+    assert len(old()) == len(new()) == 2
+    return report('listing episode types', measure(old, number=5), measure(new, number=5))
+
+
+def benchmark_settings():
+    """
+    Building the ListItems of a group of 50 series, reading every setting from Kodi against the snapshot in
+    plugin_settings. Outside of Kodi getSetting() is cheap, so the number of calls that reach it is logged too
+    """
+    from nakamori_utils import json_utils
+    from nakamori_utils.globalvars import plugin_settings
+    from shoko_models.v2 import Series
+    json_nodes = json_utils.loads(shoko_payload(series_count=50, episode_count=1))['series']
+    addon = plugin_settings.addon
+    max_age = plugin_settings.max_age
+    calls = [0]
+
+    class CountingAddon(object):
+        def getSetting(self, setting_id):
+            calls[0] += 1
+            return addon.getSetting(setting_id)
+
+    def build():
+        return [Series(json_node).get_listitem() for json_node in json_nodes]
+
+    def count(func):
+        calls[0] = 0
+        func()
+        return calls[0]
+
+    def old():
+        plugin_settings.max_age = -1
+        try:
+            return build()
+        finally:
+            plugin_settings.max_age = max_age
+
+    def new():
+        return build()
+
+    plugin_settings.addon = CountingAddon()
+    try:
+        plugin_settings.invalidate()
+        old_calls, new_calls = count(old), count(new)
+        return report('series listing, getSetting calls %i -> %i' % (old_calls, new_calls),
+                      measure(old, number=10), measure(new, number=10))
+    finally:
+        plugin_settings.addon = addon
+        plugin_settings.invalidate()
+
+
+def benchmark_make_text_nice():
+    """
+    Cleaning the descriptions of a listing with make_text_nice, the first time and when they come again
+    """
+    from nakamori_utils import model_utils
+    # all different, so the first run can't use what it remembered
+    texts = [u'%i. %s' % (i, text.replace(u'%i', str(i))) for i in range(50) for text in anidb_descriptions]
+
+    def old():
+        return [_regex_make_text_nice(text) for text in texts]
+
+    def new():
+        model_utils.nice_texts.clear()
+        return [model_utils.make_text_nice(text) for text in texts]
+
+    def again():
+        return [model_utils.make_text_nice(text) for text in texts]
+
+    assert old() == new() == again()
+    old_time = measure(old, number=20)
+    return '\n'.join([report('description cleaning, %i texts' % len(texts), old_time, measure(new, number=20)),
+                      report('description cleaning, the same %i again' % len(texts), old_time,
+                             measure(again, number=20))])
+
+
+def benchmark_titles():
+    """
+    Resolving the titles of 200 series with 20 titles each, the way Series does: the name and the alternate name
+    """
+    from nakamori_utils import model_utils
+    languages = ['x-jat', 'ja', 'en', 'de', 'fr', 'es', 'it', 'ko', 'zh-hans', 'ru']
+    kinds = ['main', 'official', 'synonym', 'short']
+    nodes = [{'name': 'Series %i' % i, 'titles': [{'Title': 'Title %i %i' % (i, t), 'Language': languages[t % 10],
+                                                   'Type': kinds[(t + i) % 4]} for t in range(20)]}
+             for i in range(200)]
+
+    def old():
+        return [(_scan_get_title(node, 'en', 'official'), _scan_get_title(node, 'en', 'official'),
+                 _scan_get_title(node, 'de', 'main')) for node in nodes]
+
+    def new():
+        model_utils.title_indexes.clear()
+        return [(model_utils.get_title(node, 'en', 'official'), model_utils.get_title(node, 'en', 'official'),
+                 model_utils.get_title(node, 'de', 'main')) for node in nodes]
+
+    assert old() == new()
+    return report('title resolution, %i series' % len(nodes), measure(old, number=20), measure(new, number=20))
+
+
+benchmarks = [
+    benchmark_url_builder,
+    benchmark_make_text_nice,
+    benchmark_titles,
+    benchmark_json_decode,
+    benchmark_model_memory,
+    benchmark_lazy_models,
+    benchmark_settings,
+]
+
+
+def run_all():
+    """
+    :return: the results as text, one line per benchmark
+    """
+    return [benchmark() for benchmark in benchmarks]
+
+
+if __name__ == '__main__':
+    for line in run_all():
+        print(line)